@@ -1,3 +1,4 @@
+import os
 from enum import Enum
 
 
@@ -116,6 +117,33 @@ class CoapOptionDelta(Enum):
         BLOCK1 -> REQUEST ex. GET
         BLOCK2 -> RESPONSE ex. PUT
 
+    Q-BLOCK FORMAT 19|31 (RFC 9177):
+        - same format as BLOCK1|BLOCK2, but the blocks are sent as NON bursts and
+          only the missing blocks are requested again by the receiver.
+
+    FEC FORMAT 65000 (experimental, elective):
+        - K -> number of data blocks in a parity group, the upper byte
+        - M -> number of parity blocks of a group, the lower byte
+
+    FEC_PARITY 65002 (experimental, elective):
+        - the index of the parity block within its group; the NUM of the block option is the group number
+
+    SUB_SESSION 65006 (experimental, elective):
+        - index of the run of 2**20 blocks the block belongs to; the NUM field holds 20 bits only,
+          so the block number of larger transfers is SUB_SESSION * 2**20 + NUM
+
+    LOCAL_BLOCK_SIZE 65004 (experimental, elective):
+        - block size in bytes, larger than the 1024 bytes allowed by SZX; meant for loopback and jumbo frames LANs,
+          the block option keeps SZX = 6 so peers that ignore it still get RFC sized blocks
+
+    CONTENT_HASH 65008 (experimental, elective):
+        - BLAKE2b digest of the bytes of a block-wise transfer, carried by its last block
+
+    COMPRESSION 65010 (experimental, elective):
+        - method -> the upper 4 bits: 1 for zlib, 2 for lzma
+        - level  -> the lower 4 bits: 0 to 9
+        offered by a request, and carried by the blocks of the response that were compressed one by one
+
     """
     IF_MATCH = 1
 
@@ -139,17 +167,28 @@ class CoapOptionDelta(Enum):
 
     ACCEPT = 17
 
+    Q_BLOCK1 = 19
+
     LOCATION_QUERY = 20
 
     BLOCK2 = 23
     BLOCK1 = 27
 
+    Q_BLOCK2 = 31
+
     PROXY_URI = 35
     PROXY_SCHEME = 39
 
     SIZE1 = 60
     SIZE2 = 28
 
+    FEC = 65000
+    FEC_PARITY = 65002
+    LOCAL_BLOCK_SIZE = 65004
+    SUB_SESSION = 65006
+    CONTENT_HASH = 65008
+    COMPRESSION = 65010
+
     @staticmethod
     def is_valid(items: dict):
         if len(items) > 0:
@@ -174,6 +213,15 @@ class CoapContentFormat(Enum):
     APPLICATION_EXI = 47
     APPLICATION_JSON = 50
 
+    # Experimental use (RFC 7252, 12.3): a folder sent as a streamed tar archive
+    APPLICATION_TAR = 65000
+
+    # Experimental use: a file sent as a delta against the copy of the receiver (COPY, DATA and END operations)
+    APPLICATION_DELTA = 65001
+
+    # Experimental use: a file sent as the chunks the receiver already has and the ones it misses (REF, DATA, END)
+    APPLICATION_CHUNKS = 65002
+
     @staticmethod
     def is_valid(item):
         for member in CoapContentFormat:
@@ -182,13 +230,22 @@ class CoapContentFormat(Enum):
         return False
 
 
-CURRENT_TOKEN = -1
+COAP_TOKEN_LENGTH = 8
 
 
-def gen_token() -> bytes:
-    global CURRENT_TOKEN
-    CURRENT_TOKEN += 1
-    return int(CURRENT_TOKEN).to_bytes()
+def gen_token(length: int = COAP_TOKEN_LENGTH) -> bytes:
+    """
+    Generate a random token, so tokens are neither guessable nor shared between peers or exchanges.
+
+    Args:
+        length (int): The token length in bytes, between 4 and 8.
+
+    Returns:
+        bytes: The generated token.
+    """
+    if not 4 <= length <= 8:
+        raise ValueError(f"Invalid token length: {length}")
+    return os.urandom(length)
 
 
 def verify_format(task) -> bool:
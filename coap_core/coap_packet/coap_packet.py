@@ -15,6 +15,17 @@ class CoapPacket:
     Reference: https://datatracker.ietf.org/doc/html/rfc7252#autoid-9
     """
 
+    # Block-wise transfer options, in lookup order
+    BLOCK_OPTIONS = (
+        CoapOptionDelta.BLOCK1.value,
+        CoapOptionDelta.BLOCK2.value,
+        CoapOptionDelta.Q_BLOCK1.value,
+        CoapOptionDelta.Q_BLOCK2.value
+    )
+
+    # The NUM field of the block options holds at most 20 bits (3 bytes option)
+    BLOCK_NUM_LIMIT = 1 << 20
+
     @staticmethod
     def decode_option_block(option) -> dict | None:
         """
@@ -51,12 +62,37 @@ class CoapPacket:
 
         Returns:
         - int: The resulting option block value.
+
+        Raises:
+        - ValueError: If NUM does not fit in 20 bits.
         """
+        if not 0 <= num < CoapPacket.BLOCK_NUM_LIMIT:
+            raise ValueError(f"Block number out of range: {num}")
+
         # Combining values to create the option block
         option = (num << 4) | (m << 3) | szx
 
         return option
 
+    @staticmethod
+    def _extend_option_field(value: int) -> tuple[int, bytes]:
+        """
+        Split an option delta/length into its 4 bits field and its extended bytes.
+
+        Args:
+            value (int): The option delta or option length.
+
+        Returns:
+            tuple: The 4 bits value and the extended bytes.
+        """
+        if value < 13:
+            return value, b""
+        elif value < 269:
+            return 13, (value - 13).to_bytes(1, 'big')
+        elif value <= 65804:
+            return 14, (value - 269).to_bytes(2, 'big')
+        raise ValueError(f"Option field too large: {value}")
+
     @staticmethod
     def _encode_option(option_value, delta_value) -> bytes:
         """
@@ -87,39 +123,10 @@ class CoapPacket:
         else:
             option_bytes = option_value
 
-        option_bytes_len = len(option_bytes)
-
-        current_option_bytes = b""
-        if delta_value < 13:
-            if option_bytes_len < 13:
-                current_option_bytes += bytes([(delta_value << 4) | option_bytes_len])
-            elif 13 <= option_bytes_len < 269:
-                current_option_bytes += bytes([(delta_value << 4) | 13])
-                current_option_bytes += (option_bytes_len - 13).to_bytes(1, 'big')
-            elif 269 <= option_bytes_len <= 65804:
-                current_option_bytes += bytes([(delta_value << 4) | 14])
-                current_option_bytes += (option_bytes_len - 269).to_bytes(2, 'big')
-        elif 13 <= delta_value < 269:
-            if option_bytes_len < 13:
-                current_option_bytes += bytes([13 << 4 | option_bytes_len, delta_value - 13])
-            elif 13 <= option_bytes_len < 269:
-                current_option_bytes += bytes([13 << 4 | 13, delta_value - 13])
-                current_option_bytes += (option_bytes_len - 13).to_bytes(1, 'big')
-            elif 269 <= delta_value <= 65804:
-                current_option_bytes += bytes([13 << 4 | 13, delta_value - 14])
-                current_option_bytes += (option_bytes_len - 269).to_bytes(2, 'big')
-        elif 269 <= delta_value <= 65804:
-            if option_bytes_len < 13:
-                current_option_bytes += bytes([14 << 4 | option_bytes_len])
-                current_option_bytes += (delta_value - 269).to_bytes(2, 'big')
-            elif 13 <= option_bytes_len < 269:
-                current_option_bytes += bytes([14 << 4 | option_bytes_len])
-                current_option_bytes += (delta_value - 269).to_bytes(2, 'big')
-                current_option_bytes += (option_bytes_len - 13).to_bytes(1, 'big')
-            elif 269 <= option_bytes_len <= 65804:
-                current_option_bytes += bytes([14 << 4 | option_bytes_len])
-                current_option_bytes += (delta_value - 269).to_bytes(2, 'big')
-                current_option_bytes += (option_bytes_len - 269).to_bytes(2, 'big')
+        delta_nibble, delta_extended = CoapPacket._extend_option_field(delta_value)
+        length_nibble, length_extended = CoapPacket._extend_option_field(len(option_bytes))
+
+        current_option_bytes = bytes([(delta_nibble << 4) | length_nibble]) + delta_extended + length_extended
 
         return current_option_bytes + option_bytes
 
@@ -137,7 +144,7 @@ class CoapPacket:
         Returns:
             Any: Interpreted value of the CoAP option.
         """
-        if delta == CoapOptionDelta.IF_MATCH.value:
+        if delta == CoapOptionDelta.IF_MATCH.value or delta == CoapOptionDelta.CONTENT_HASH.value:
             return option_value
         elif (delta == CoapOptionDelta.URI_HOST.value or delta == CoapOptionDelta.URI_PATH.value
               or delta == CoapOptionDelta.URI_QUERY.value or delta == CoapOptionDelta.LOCATION_PATH.value
@@ -145,8 +152,11 @@ class CoapPacket:
             return option_value.decode('utf-8')
         elif (delta == CoapOptionDelta.ETAG.value or delta == CoapOptionDelta.URI_PORT.value
               or delta == CoapOptionDelta.MAX_AGE.value or delta == CoapOptionDelta.ACCEPT.value
-              or delta == CoapOptionDelta.SIZE1.value or CoapOptionDelta.BLOCK1 or CoapOptionDelta.BLOCK2
-              or delta == CoapOptionDelta.SIZE2.value):
+              or delta == CoapOptionDelta.SIZE1.value or delta in CoapPacket.BLOCK_OPTIONS
+              or delta == CoapOptionDelta.SIZE2.value
+              or delta == CoapOptionDelta.FEC.value or delta == CoapOptionDelta.FEC_PARITY.value
+              or delta == CoapOptionDelta.LOCAL_BLOCK_SIZE.value or delta == CoapOptionDelta.SUB_SESSION.value
+              or delta == CoapOptionDelta.COMPRESSION.value):
             return int.from_bytes(option_value, byteorder='big')
         elif delta == CoapOptionDelta.IF_NONE_MATCH.value:
             return b''
@@ -166,7 +176,8 @@ class CoapPacket:
             code (int): CoAP Code indicating the method or response code.
             message_id (int): Message ID for the CoAP packet.
             options (dict): Dictionary of CoAP options.
-            payload (bytes): Payload of the CoAP packet.
+            payload (bytes): Payload of the CoAP packet; a memoryview (e.g. a block read in a buffer)
+                is sent without being copied.
         """
         self.version = version
         self.message_type = message_type
@@ -180,6 +191,7 @@ class CoapPacket:
 
         self.needs_internal_computation = internal_computation
         self.encoded = b""
+        self.encoded_parts = None
 
     def __repr__(self):
         """
@@ -190,7 +202,7 @@ class CoapPacket:
         """
         readable_options = deepcopy(self.options)
         for option in readable_options.keys():
-            if option == CoapOptionDelta.BLOCK2.value or option == CoapOptionDelta.BLOCK1.value:
+            if option in CoapPacket.BLOCK_OPTIONS:
                 readable_options[option] = CoapPacket.decode_option_block(readable_options[option])
         return f"CoAPPacket(version={self.version}, " \
                f"message_type={self.message_type}, " \
@@ -213,30 +225,48 @@ class CoapPacket:
             code=copy(self.code),
             message_id=copy(self.message_id),
             options=deepcopy(self.options),
-            payload=copy(self.payload),
+            payload=self.payload if isinstance(self.payload, memoryview) else copy(self.payload),
             internal_computation=copy(self.needs_internal_computation),
             sender_ip_port=copy(self.sender_ip_port),
             skt=copy(self.skt)
         )
 
     def has_option_block(self):
-        return CoapOptionDelta.BLOCK1.value in self.options or CoapOptionDelta.BLOCK2.value in self.options
+        return any(option in self.options for option in CoapPacket.BLOCK_OPTIONS)
+
+    def is_q_block(self) -> bool:
+        return CoapOptionDelta.Q_BLOCK1.value in self.options or CoapOptionDelta.Q_BLOCK2.value in self.options
 
     def get_block_id(self) -> int | None:
-        if CoapOptionDelta.BLOCK1.value in self.options:
-            return CoapPacket.decode_option_block(self.options[CoapOptionDelta.BLOCK1.value])["NUM"]
-        elif CoapOptionDelta.BLOCK2.value in self.options:
-            return CoapPacket.decode_option_block(self.options[CoapOptionDelta.BLOCK2.value])["NUM"]
+        option_code = self.get_option_code()
+        if option_code is not None:
+            num = CoapPacket.decode_option_block(self.options[option_code])["NUM"]
+            return self.options.get(CoapOptionDelta.SUB_SESSION.value, 0) * CoapPacket.BLOCK_NUM_LIMIT + num
         else:
             return None
 
-    def get_option_code(self):
-        if CoapOptionDelta.BLOCK1.value in self.options:
-            return CoapOptionDelta.BLOCK1.value
-        elif CoapOptionDelta.BLOCK2.value in self.options:
-            return CoapOptionDelta.BLOCK2.value
+    def set_option_block(self, option_code: int, num: int, m: int, szx: int = 6):
+        """
+        Set a block option, adding the SUB_SESSION option for block numbers that do not fit in 20 bits.
+
+        Args:
+        - option_code (int): The block option to set.
+        - num (int): The block number, as returned by get_block_id.
+        - m (int): The value of M (one bit).
+        - szx (int): The value of SZX (three bits).
+        """
+        sub_session, num = divmod(num, CoapPacket.BLOCK_NUM_LIMIT)
+        self.options[option_code] = CoapPacket.encode_option_block(num, m, szx)
+        if sub_session:
+            self.options[CoapOptionDelta.SUB_SESSION.value] = sub_session
         else:
-            return None
+            self.options.pop(CoapOptionDelta.SUB_SESSION.value, None)
+
+    def get_option_code(self):
+        for option in CoapPacket.BLOCK_OPTIONS:
+            if option in self.options:
+                return option
+        return None
 
     def get_size_code(self):
         if CoapOptionDelta.SIZE1.value in self.options:
@@ -247,9 +277,9 @@ class CoapPacket:
             return None
 
     def get_size_code_based_on_option(self):
-        if CoapOptionDelta.BLOCK1.value in self.options:
+        if CoapOptionDelta.BLOCK1.value in self.options or CoapOptionDelta.Q_BLOCK1.value in self.options:
             return CoapOptionDelta.SIZE1.value
-        elif CoapOptionDelta.BLOCK2.value in self.options:
+        elif CoapOptionDelta.BLOCK2.value in self.options or CoapOptionDelta.Q_BLOCK2.value in self.options:
             return CoapOptionDelta.SIZE2.value
         else:
             return None
@@ -260,21 +290,20 @@ class CoapPacket:
     def general_work_id(self) -> tuple:
         return self.sender_ip_port, self.token
 
-    def encode(self) -> bytes:
+    def encode_parts(self) -> tuple[bytes, bytes | memoryview]:
         """
-        Encode the CoAP packet into a byte representation.
+        Encode the CoAP packet into its head and its payload.
 
-        This method encodes a CoAP packet into a byte representation, including the CoAP header, token, options,
-        and payload. The CoAP header is constructed based on the version, message type, token length, code, and message
-        ID. The token is included in the encoded packet, followed by the options, which are iteratively processed and
-        encoded using the _code_option helper method. The payload, if present, is also included in the final byte
-        representation. The encoded CoAP packet is then returned as bytes.
+        The head holds the CoAP header, the token, the options and the payload marker. The header is constructed
+        based on the version, message type, token length, code, and message ID, and the options are iteratively
+        processed and encoded using the _encode_option helper method. A memoryview payload is returned as it is,
+        so it reaches the socket without being copied.
 
         Returns:
-            bytes: Byte representation of the CoAP packet.
+            tuple: The head and the payload of the CoAP packet.
         """
-        if self.encoded:
-            return self.encoded
+        if self.encoded_parts:
+            return self.encoded_parts
 
         # CoAP Header
         header = bytes([
@@ -298,28 +327,50 @@ class CoapPacket:
             prev_option_delta = delta
 
         # CoAP Payload
-        if self.payload:
+        if isinstance(self.payload, memoryview):
+            payload_bytes = self.payload
+        elif self.payload:
             if CoapOptionDelta.CONTENT_FORMAT.value in self.options:
                 if self.options[CoapOptionDelta.CONTENT_FORMAT.value] == CoapContentFormat.TEXT_PLAIN_UTF8.value:
-                    payload_bytes = bytes([0xFF]) + bytes(self.payload.encode(encoding="utf-8"))
+                    payload_bytes = bytes(self.payload.encode(encoding="utf-8"))
                 elif self.options[CoapOptionDelta.CONTENT_FORMAT.value] == CoapContentFormat.APPLICATION_JSON.value:
                     if not isinstance(self.payload, str):
                         self.payload = json.dumps(self.payload)
-                    payload_bytes = bytes([0xFF]) + bytes(self.payload.encode(encoding="utf-8"))
+                    payload_bytes = bytes(self.payload.encode(encoding="utf-8"))
                 else:
-                    payload_bytes = bytes([0xFF]) + bytes(self.payload)
+                    payload_bytes = bytes(self.payload)
             else:
-
-                payload_bytes = bytes([0xFF]) + bytes(self.payload)
+                payload_bytes = bytes(self.payload)
         else:
-            payload_bytes = bytes([0xFF])
+            payload_bytes = b""
+
+        self.encoded_parts = header + token_bytes + options_bytes + bytes([0xFF]), payload_bytes
+
+        return self.encoded_parts
+
+    def encode(self) -> bytes:
+        """
+        Encode the CoAP packet into a byte representation, joining its head and its payload.
+
+        Returns:
+            bytes: Byte representation of the CoAP packet.
+        """
+        if self.encoded:
+            return self.encoded
 
-        # Combine all parts to form the CoAP packet
-        coap_packet = header + token_bytes + options_bytes + payload_bytes
+        head, payload = self.encode_parts()
+        self.encoded = head + payload
 
-        self.encoded = coap_packet
+        return self.encoded
 
-        return coap_packet
+    def encoded_size(self) -> int:
+        """
+        Get the size of the encoded CoAP packet, without joining its head and its payload.
+
+        Returns:
+            int: The size in bytes.
+        """
+        return sum(map(len, self.encode_parts()))
 
     @classmethod
     def decode(cls, coap_packet, address: tuple, skt: socket):
@@ -366,7 +417,7 @@ class CoapPacket:
                 delta += coap_packet[options_start + 1]
                 options_start += 1
             elif delta == 14:
-                delta += int.from_bytes(coap_packet[options_start + 1:options_start + 3], 'big')
+                delta = int.from_bytes(coap_packet[options_start + 1:options_start + 3], 'big') + 269
                 options_start += 2
 
             # Handle length extension
@@ -399,5 +450,11 @@ class CoapPacket:
     def send(self):
         """
         Send the CoapPacket over the socket to the specified address.
+
+        A memoryview payload is gathered by the kernel together with the head, instead of being copied
+        into a joined datagram first.
         """
-        self.skt.sendto(self.encode(), self.sender_ip_port)
+        if isinstance(self.payload, memoryview):
+            self.skt.sendmsg(self.encode_parts(), [], 0, self.sender_ip_port)
+        else:
+            self.skt.sendto(self.encode(), self.sender_ip_port)
@@ -36,6 +36,16 @@ class CoapTemplates(Enum):
         payload=""
     )
 
+    REQUEST_ENTITY_TOO_LARGE = CoapPacket(
+        version=1,
+        message_type=CoapType.RST.value,
+        token=b"",
+        code=CoapCodeFormat.CLIENT_ERROR_REQUEST_ENTITY_TOO_LARGE.value(),
+        message_id=0,
+        options={},
+        payload=""
+    )
+
     NOT_FOUND = CoapPacket(
         version=1,
         message_type=CoapType.RST.value,
@@ -66,6 +76,16 @@ class CoapTemplates(Enum):
         payload=""
     )
 
+    EMPTY_RST = CoapPacket(
+        version=1,
+        message_type=CoapType.RST.value,
+        token=b"",
+        code=CoapCodeFormat.EMPTY.value(),
+        message_id=0,
+        options={},
+        payload=""
+    )
+
     EMPTY_ACK = CoapPacket(
         version=1,
         message_type=CoapType.ACK.value,
@@ -106,6 +126,16 @@ class CoapTemplates(Enum):
         payload="",
     )
 
+    SUCCESS_VALID = CoapPacket(
+        version=1,
+        message_type=CoapType.ACK.value,
+        token=b"",
+        code=CoapCodeFormat.SUCCESS_VALID.value(),
+        message_id=0,
+        options={},
+        payload="",
+    )
+
     def __init__(self, coap_packet: CoapPacket):
         self.coap_packet = coap_packet
 
@@ -3,4 +3,16 @@ ACK_RANDOM_FACTOR = 1.5
 MAX_RETRANSMIT = 4
 MAX_RETRANSMISSION_SPAN = (ACK_TIMEOUT * ((2 ** MAX_RETRANSMIT) - 1) * ACK_RANDOM_FACTOR)
 MAX_RETRANSMISSION_WAIT = (ACK_TIMEOUT * ((2 ** (MAX_RETRANSMIT + 1)) - 1) * ACK_RANDOM_FACTOR)
+MAX_LATENCY = 100
+PROCESSING_DELAY = ACK_TIMEOUT
+EXCHANGE_LIFETIME = MAX_RETRANSMISSION_SPAN + 2 * MAX_LATENCY + PROCESSING_DELAY
+NON_LIFETIME = MAX_RETRANSMISSION_SPAN + MAX_LATENCY
+COAP_DEDUPLICATION_CACHE_SIZE = 65536
 COAP_CONCURRENT_TRANSACTIONS = 1000
+COAP_INITIAL_WINDOW = 4
+COAP_MIN_WINDOW = 1
+COAP_INITIAL_SLOW_START_THRESHOLD = 64
+COAP_PACING_GAIN = 1.25
+COAP_PACING_BURST = 4
+COAP_FAST_RETRANSMIT_THRESHOLD = 3
+COAP_PIGGYBACK_TIMEOUT = 0.05
@@ -0,0 +1,132 @@
+import time
+
+from coap_core.coap_transaction import (ACK_TIMEOUT, COAP_CONCURRENT_TRANSACTIONS, COAP_INITIAL_WINDOW,
+                                        COAP_MIN_WINDOW, COAP_INITIAL_SLOW_START_THRESHOLD)
+
+
+class CoapCongestionWindow:
+    """
+    The `CoapCongestionWindow` class limits the number of confirmable transactions in flight towards a single peer.
+
+    The window follows an AIMD (additive increase, multiplicative decrease) policy:
+    - slow start: below the threshold, every timely acknowledgment grows the window by one transaction;
+    - congestion avoidance: above the threshold, the window grows by about one transaction per full window;
+    - decrease: a retransmission halves the window, at most once per ACK_TIMEOUT, so that a burst of
+      losses caused by the same congestion event is not punished several times.
+
+    The window also keeps a smoothed round-trip time (RFC 6298), sampled only from timely acknowledgments
+    (Karn's algorithm), which is used to derive the pacing rate towards the peer.
+
+    Note:
+    - The window never drops below COAP_MIN_WINDOW and never exceeds COAP_CONCURRENT_TRANSACTIONS.
+    - The class is not thread-safe by itself; the `CoapTransactionPool` serializes the access.
+    """
+
+    def __init__(self):
+        """
+        Initializes a CoapCongestionWindow instance in the slow start phase.
+        """
+        self.__size: float = COAP_INITIAL_WINDOW
+        self.__threshold: float = COAP_INITIAL_SLOW_START_THRESHOLD
+        self.__in_flight = 0
+        self.__last_decrease = 0.0
+        self.__smoothed_rtt: float | None = None
+
+    # Properties
+    @property
+    def size(self) -> int:
+        return int(self.__size)
+
+    @property
+    def threshold(self) -> int:
+        return int(self.__threshold)
+
+    @property
+    def in_flight(self) -> int:
+        return self.__in_flight
+
+    @property
+    def smoothed_rtt(self) -> float | None:
+        return self.__smoothed_rtt
+
+    # Methods
+    def has_room(self) -> bool:
+        """
+        Checks if a new transaction can be started without exceeding the window.
+
+        :return: True if there is room for a new transaction; False otherwise.
+        """
+        return self.__in_flight < int(self.__size)
+
+    def acquire(self) -> bool:
+        """
+        Reserves the slot of a new transaction, if the window has room for it.
+
+        :return: True if the slot was reserved; False otherwise.
+        """
+        if not self.has_room():
+            return False
+
+        self.__in_flight += 1
+        return True
+
+    def on_send(self):
+        """
+        Registers a new transaction in flight.
+        """
+        self.__in_flight += 1
+
+    def on_ack(self, timely: bool, rtt: float = None):
+        """
+        Registers the acknowledgment of a transaction in flight and grows the window if it was timely.
+
+        :param timely: True if the acknowledged transaction was never retransmitted.
+        :param rtt: The round-trip time of the transaction; only used when the acknowledgment is timely.
+        """
+        self.__in_flight = max(0, self.__in_flight - 1)
+
+        if not timely:
+            return
+
+        if rtt is not None:
+            if self.__smoothed_rtt is None:
+                self.__smoothed_rtt = rtt
+            else:
+                self.__smoothed_rtt = 0.875 * self.__smoothed_rtt + 0.125 * rtt
+
+        self.on_delivered(1)
+
+    def on_delivered(self, count: int):
+        """
+        Grows the window for messages confirmed without individual acknowledgments (e.g. NON blocks
+        reported as received), the same way as for timely acknowledgments.
+
+        :param count: The number of delivered messages.
+        """
+        for _ in range(count):
+            if self.__size < self.__threshold:
+                self.__size += 1
+            else:
+                self.__size += 1 / self.__size
+
+        self.__size = min(self.__size, COAP_CONCURRENT_TRANSACTIONS)
+
+    def on_loss(self):
+        """
+        Shrinks the window after a retransmission.
+        """
+        now = time.time()
+        if now - self.__last_decrease < ACK_TIMEOUT:
+            return
+
+        self.__last_decrease = now
+        self.__threshold = max(self.__size / 2, COAP_MIN_WINDOW)
+        self.__size = self.__threshold
+
+    def on_release(self, count: int = 1):
+        """
+        Removes transactions from flight without acknowledgment (e.g. failed or cancelled exchanges).
+
+        :param count: The number of released transactions.
+        """
+        self.__in_flight = max(0, self.__in_flight - count)
@@ -0,0 +1,98 @@
+import threading
+import time
+from collections import OrderedDict
+
+from coap_core.coap_packet.coap_config import CoapType
+from coap_core.coap_packet.coap_packet import CoapPacket
+from coap_core.coap_transaction import EXCHANGE_LIFETIME, NON_LIFETIME, COAP_DEDUPLICATION_CACHE_SIZE
+from coap_core.coap_utilities.coap_logger import logger
+from coap_core.coap_utilities.coap_singleton import CoapSingletonBase
+
+
+class CoapDeduplicationCache(CoapSingletonBase):
+    """
+    The `CoapDeduplicationCache` class detects duplicated messages and replays their responses (RFC 7252, 4.5).
+
+    Every received CON/NON message is remembered together with the encoded message that answered it
+    (an ACK or a piggybacked response). A duplicate arriving within EXCHANGE_LIFETIME (NON_LIFETIME for NON)
+    is not processed again; the stored answer is sent instead.
+
+    Note:
+    - The cache is bounded by COAP_DEDUPLICATION_CACHE_SIZE; the oldest entries are evicted first.
+    - Entries are keyed by (peer, message ID), as message IDs are allocated per peer.
+    - Fast bulk transfers go through the 65536 message IDs well within EXCHANGE_LIFETIME, so every entry keeps
+      a fingerprint of the message; a message ID that comes back with another message is a new message.
+    """
+
+    def __init__(self):
+        """
+        Initializes the CoapDeduplicationCache instance.
+        """
+        self.__entries: OrderedDict[tuple, tuple[float, int, bytes | None]] = OrderedDict()
+        self.__lock = threading.Lock()
+
+    @staticmethod
+    def __key(packet: CoapPacket) -> tuple:
+        return packet.sender_ip_port, packet.message_id
+
+    @staticmethod
+    def __fingerprint(packet: CoapPacket) -> int:
+        """
+        Computes a fingerprint of a message, telling a retransmission apart from a new message with a recycled ID.
+
+        Args:
+            packet (CoapPacket): The received CON/NON message.
+
+        Returns:
+            int: The fingerprint.
+        """
+        payload = packet.payload if isinstance(packet.payload, (bytes, str)) else repr(packet.payload)
+        return hash((packet.token, packet.code, tuple(sorted(packet.options.items())), payload))
+
+    def __evict(self):
+        """
+        Removes the expired entries and keeps the cache within its size limit.
+        """
+        now = time.time()
+        while self.__entries:
+            key, (expiry, _, _) = next(iter(self.__entries.items()))
+            if expiry > now and len(self.__entries) <= COAP_DEDUPLICATION_CACHE_SIZE:
+                break
+            self.__entries.popitem(last=False)
+
+    def register(self, packet: CoapPacket, response: CoapPacket | None = None):
+        """
+        Registers a received message and the message that answered it.
+
+        Args:
+            packet (CoapPacket): The received CON/NON message.
+            response (CoapPacket): The ACK or the response sent for it, if any.
+        """
+        lifetime = NON_LIFETIME if packet.message_type == CoapType.NON.value else EXCHANGE_LIFETIME
+
+        with self.__lock:
+            key = self.__key(packet)
+            self.__entries.pop(key, None)
+            self.__entries[key] = (time.time() + lifetime, self.__fingerprint(packet),
+                                   response.encode() if response else None)
+            self.__evict()
+
+    def replay(self, packet: CoapPacket) -> bool:
+        """
+        Checks if a received message is a duplicate and, if so, resends the stored answer.
+
+        Args:
+            packet (CoapPacket): The received CON/NON message.
+
+        Returns:
+            bool: True if the message is a duplicate; False otherwise.
+        """
+        with self.__lock:
+            entry = self.__entries.get(self.__key(packet))
+            if not entry or entry[0] < time.time() or entry[1] != self.__fingerprint(packet):
+                return False
+
+        if entry[2]:
+            packet.skt.sendto(entry[2], packet.sender_ip_port)
+        logger.debug(f"Duplicate of {packet}")
+        return True
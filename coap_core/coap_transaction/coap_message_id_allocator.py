@@ -0,0 +1,61 @@
+import random
+
+
+class CoapMessageIdAllocator:
+    """
+    The `CoapMessageIdAllocator` class hands out message IDs for each peer (RFC 7252, 4.4).
+
+    Every peer gets its own sequence, starting from a random value. The IDs of the transactions that are still
+    waiting for an acknowledgment are reserved, so a long-running exchange never sees its ID reused by another one.
+
+    Note:
+    - The class is not thread-safe by itself; the `CoapTransactionPool` serializes the access.
+    """
+
+    MESSAGE_ID_SPACE = 65536
+
+    def __init__(self):
+        """
+        Initializes the CoapMessageIdAllocator instance.
+        """
+        self.__next_ids: dict[tuple, int] = {}
+        self.__reserved: dict[tuple, set[int]] = {}
+
+    def allocate(self, peer: tuple) -> int:
+        """
+        Allocates the next free message ID for a peer.
+
+        :param peer: The (ip, port) of the peer.
+        :return: The allocated message ID.
+        :raises RuntimeError: If all the message IDs of the peer are reserved.
+        """
+        next_id = self.__next_ids.get(peer, random.randrange(self.MESSAGE_ID_SPACE))
+        reserved = self.__reserved.get(peer, set())
+
+        for _ in range(self.MESSAGE_ID_SPACE):
+            message_id = next_id
+            next_id = (next_id + 1) % self.MESSAGE_ID_SPACE
+
+            if message_id not in reserved:
+                self.__next_ids[peer] = next_id
+                return message_id
+
+        raise RuntimeError(f"No message ID available for {peer}")
+
+    def reserve(self, peer: tuple, message_id: int):
+        """
+        Marks a message ID as used by a transaction in flight.
+
+        :param peer: The (ip, port) of the peer.
+        :param message_id: The message ID to reserve.
+        """
+        self.__reserved.setdefault(peer, set()).add(message_id)
+
+    def release(self, peer: tuple, message_id: int):
+        """
+        Frees a message ID once its transaction is finished or dropped.
+
+        :param peer: The (ip, port) of the peer.
+        :param message_id: The message ID to release.
+        """
+        self.__reserved.get(peer, set()).discard(message_id)
@@ -0,0 +1,53 @@
+import threading
+import time
+
+from coap_core.coap_transaction import COAP_PACING_BURST
+
+
+class CoapPacer:
+    """
+    The `CoapPacer` class spreads the datagrams sent to a single peer using a token bucket.
+
+    Tokens are bytes: they are refilled at the current rate and every datagram consumes its own size.
+    The bucket holds at most COAP_PACING_BURST datagrams worth of tokens, so short bursts are still allowed,
+    while long back-to-back runs are stretched to the target rate instead of overflowing the receiver.
+
+    Note:
+    - The rate is given on every call, because it follows the RTT and the congestion window of the peer.
+    - The waiting is done outside the lock, so several senders towards the same peer share the rate fairly.
+    """
+
+    def __init__(self):
+        """
+        Initializes a CoapPacer instance with a full bucket.
+        """
+        self.__tokens: float | None = None
+        self.__last_refill = time.time()
+        self.__lock = threading.Lock()
+
+    def pace(self, size: int, rate: float | None):
+        """
+        Blocks the caller until a datagram of the given size can be sent at the given rate.
+
+        :param size: The size of the datagram in bytes.
+        :param rate: The target rate in bytes per second; None disables the pacing.
+        """
+        if not rate:
+            return
+
+        burst = COAP_PACING_BURST * size
+
+        with self.__lock:
+            now = time.time()
+            if self.__tokens is None:
+                self.__tokens = burst
+            else:
+                self.__tokens = min(burst, self.__tokens + (now - self.__last_refill) * rate)
+            self.__last_refill = now
+
+            # The bucket may go in debt; the debt is the time the caller has to wait
+            self.__tokens -= size
+            delay = -self.__tokens / rate if self.__tokens < 0 else 0
+
+        if delay > 0:
+            time.sleep(delay)
@@ -0,0 +1,153 @@
+import os
+import threading
+import time
+from collections import deque
+
+from coap_core.coap_packet.coap_config import CoapType
+from coap_core.coap_packet.coap_packet import CoapPacket
+from coap_core.coap_transaction import COAP_PIGGYBACK_TIMEOUT
+from coap_core.coap_transaction.coap_deduplication_cache import CoapDeduplicationCache
+from coap_core.coap_transaction.coap_transaction_pool import CoapTransactionPool
+from coap_core.coap_utilities.coap_singleton import CoapSingletonBase
+
+
+class CoapResponder(CoapSingletonBase):
+    """
+    The `CoapResponder` class piggybacks the responses of fast handlers on the ACK of their request (RFC 7252, 5.2.1).
+
+    The ACK of a CON request is held for COAP_PIGGYBACK_TIMEOUT. A response given by the handler within that time
+    is sent as the ACK itself; otherwise the empty ACK is sent, and the response follows as a separate CON
+    response (RFC 7252, 5.2.2), tracked by the `CoapTransactionPool`.
+
+    The held ACKs are sent by one thread of the responder, in the order they expire: all of them wait the same
+    COAP_PIGGYBACK_TIMEOUT, so the order they were held in is the order of their deadlines.
+
+    Note:
+    - Only the requests that may be answered shortly have their ACK held (see `CoapWorkerPool`); handlers that
+      start a long work (e.g. a transfer) flush the ACK right away, so the peer does not wait for it.
+    - The answer that was sent is registered in the `CoapDeduplicationCache`, so duplicates of the request get it.
+    """
+
+    def __init__(self):
+        """
+        Initializes the CoapResponder instance.
+        """
+        self.__pending: dict[tuple, tuple[CoapPacket, CoapPacket]] = {}
+        self.__lock = threading.Lock()
+
+        # The deadlines of the held ACKs, in the order they expire, and the thread sending the expired ones,
+        # started with the first one
+        self.__deadlines: deque[tuple[float, CoapPacket]] = deque()
+        self.__condition = threading.Condition(self.__lock)
+        self.__scheduler = None
+
+        # A forked process starts its own thread
+        os.register_at_fork(after_in_child=self.__reset_scheduler)
+
+    def __reset_scheduler(self):
+        """
+        Forget the held ACKs and the thread of the parent process, which does not exist in a forked one.
+        """
+        self.__pending = {}
+        self.__lock = threading.Lock()
+        self.__deadlines = deque()
+        self.__condition = threading.Condition(self.__lock)
+        self.__scheduler = None
+
+    @staticmethod
+    def __key(packet: CoapPacket) -> tuple:
+        return packet.sender_ip_port, packet.message_id
+
+    def __take(self, request: CoapPacket) -> CoapPacket | None:
+        """
+        Removes the held ACK of a request.
+
+        Args:
+            request (CoapPacket): The CON request.
+
+        Returns:
+            CoapPacket | None: The held ACK; None if it was already sent.
+        """
+        with self.__lock:
+            pending = self.__pending.pop(self.__key(request), None)
+
+        return pending[1] if pending else None
+
+    def defer_acknowledgment(self, request: CoapPacket, ack: CoapPacket):
+        """
+        Holds the ACK of a CON request, waiting for a response to piggyback.
+
+        Args:
+            request (CoapPacket): The CON request.
+            ack (CoapPacket): The empty ACK, sent if no response is given in time.
+        """
+        with self.__condition:
+            self.__pending[self.__key(request)] = (request, ack)
+            self.__deadlines.append((time.monotonic() + COAP_PIGGYBACK_TIMEOUT, request))
+            if self.__scheduler is None:
+                self.__scheduler = threading.Thread(target=self.__flush_expired, daemon=True)
+                self.__scheduler.start()
+            self.__condition.notify()
+
+    def __flush_expired(self):
+        """
+        Sends the held ACKs whose deadline passed, the ones answered meanwhile being skipped by
+        `flush_acknowledgment`.
+        """
+        while True:
+            with self.__condition:
+                while not self.__deadlines:
+                    self.__condition.wait()
+
+                deadline, request = self.__deadlines[0]
+                delay = deadline - time.monotonic()
+                if delay > 0:
+                    self.__condition.wait(delay)
+                    continue
+                self.__deadlines.popleft()
+
+            self.flush_acknowledgment(request)
+
+    def flush_acknowledgment(self, request: CoapPacket):
+        """
+        Sends the held ACK of a request, if it was not sent yet.
+
+        Args:
+            request (CoapPacket): The CON request.
+        """
+        ack = self.__take(request)
+        if ack:
+            ack.send()
+            CoapDeduplicationCache().register(request, ack)
+
+    def respond(self, request: CoapPacket, response: CoapPacket):
+        """
+        Sends the response of a request, piggybacked on its ACK if the ACK is still held.
+
+        Args:
+            request (CoapPacket): The request being answered.
+            response (CoapPacket): The response; RST responses reject the request and are sent as they are.
+        """
+        response.token = request.token
+        response.skt = request.skt
+        response.sender_ip_port = request.sender_ip_port
+
+        ack = self.__take(request)
+        if response.message_type == CoapType.RST.value or request.message_type != CoapType.CON.value:
+            response.message_id = request.message_id
+            response.send()
+            if ack:
+                CoapDeduplicationCache().register(request, response)
+        elif ack:
+            # Piggybacked response: the ACK carries the response and the options it echoes
+            response.message_type = CoapType.ACK.value
+            response.message_id = request.message_id
+            for option, value in ack.options.items():
+                response.options.setdefault(option, value)
+            response.send()
+            CoapDeduplicationCache().register(request, response)
+        else:
+            # Separate response, acknowledged by the peer
+            response.message_type = CoapType.CON.value
+            response.message_id = CoapTransactionPool().next_message_id(request.sender_ip_port)
+            CoapTransactionPool().add_transaction(response)
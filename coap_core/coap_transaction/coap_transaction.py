@@ -20,19 +20,23 @@ class CoapTransaction:
     FAILED_TRANSACTION = 2
 
     # Constructor
-    def __init__(self, request: CoapPacket, parent_msg_id: int):
+    def __init__(self, request: CoapPacket, parent_msg_id: int, on_end=None):
         """
         Initializes a CoapTransaction instance.
 
         :param request: The CoAP request packet.
         :param parent_msg_id: The parent message ID.
+        :param on_end: Called once the transaction ends (acknowledged or dropped), when its request is not
+                       retransmitted anymore.
         """
         self.__request: CoapPacket = request
         self.__parent_msg_id = parent_msg_id
+        self.__on_end = on_end
         self.__timer: CoapTimer = CoapTimer().reset()
         self.__ack_timeout = ACK_TIMEOUT
         self.__transmit_time_span = 0
         self.__retransmission_counter = 0
+        self.__later_acknowledgments = 0
 
     # Properties
     @property
@@ -43,6 +47,10 @@ class CoapTransaction:
     def parent_msg_id(self) -> int:
         return self.__parent_msg_id
 
+    @property
+    def on_end(self):
+        return self.__on_end
+
     @property
     def timer(self) -> CoapTimer:
         return self.__timer
@@ -71,7 +79,35 @@ class CoapTransaction:
     def retransmission_counter(self, value: int):
         self.__retransmission_counter = value
 
+    @property
+    def later_acknowledgments(self) -> int:
+        return self.__later_acknowledgments
+
     # Methods
+    def register_later_acknowledgment(self) -> int:
+        """
+        Registers the acknowledgment of a later block of the same overall transaction.
+
+        :return: The number of later acknowledgments registered so far.
+        """
+        self.__later_acknowledgments += 1
+        return self.__later_acknowledgments
+
+    def fast_retransmit(self):
+        """
+        Retransmits the request before its timeout expires, because later requests were already acknowledged.
+
+        Note:
+        - The ACK timeout is not doubled, as the loss is not caused by a slow peer.
+        - The retransmission counter is still updated, so a dead peer keeps failing in MAX_RETRANSMIT steps.
+        """
+        self.__transmit_time_span += self.__timer.elapsed_time()
+        self.__retransmission_counter += 1
+        self.__timer.reset()
+
+        self.__request.send()
+        logger.debug(f"Fast retransmission of {self.__request}")
+
     def run_transaction(self) -> int:
         """
         Runs the CoAP transaction, handling retransmissions and checking for failure.
@@ -97,7 +133,7 @@ class CoapTransaction:
                 logger.log(f"Transaction failed: {self.__request}")
                 return CoapTransaction.FAILED_TRANSACTION
 
-            self.__request.skt.sendto(self.__request.encode(), self.__request.sender_ip_port)
+            self.__request.send()
             logger.debug(f"Retransmission of {self.__request}")
             return CoapTransaction.RETRANSMISSION
 
@@ -1,7 +1,11 @@
+import threading
 import time
 
-from coap_core.coap_transaction import COAP_CONCURRENT_TRANSACTIONS
 from coap_core.coap_packet.coap_packet import CoapPacket
+from coap_core.coap_transaction import COAP_PACING_GAIN, COAP_FAST_RETRANSMIT_THRESHOLD
+from coap_core.coap_transaction.coap_congestion_window import CoapCongestionWindow
+from coap_core.coap_transaction.coap_message_id_allocator import CoapMessageIdAllocator
+from coap_core.coap_transaction.coap_pacer import CoapPacer
 from coap_core.coap_transaction.coap_transaction import CoapTransaction
 from coap_core.coap_utilities.coap_singleton import CoapSingletonBase
 from coap_core.coap_utilities.coap_timer import CoapTimer
@@ -10,6 +14,16 @@ from coap_core.coap_utilities.coap_timer import CoapTimer
 class CoapTransactionPool(CoapSingletonBase):
     """
     Represents a pool of CoAP transactions, managing their execution, completion, and retransmissions.
+
+    The number of transactions in flight is limited per peer by a `CoapCongestionWindow`, which grows on
+    timely acknowledgments and shrinks on retransmissions.
+    Optionally, the initial requests are paced per peer by a `CoapPacer`, at a rate derived either from
+    the measured RTT and the window or from a configured bandwidth cap.
+    Block-wise transactions are tracked in sending order for each overall transaction, so a block is
+    retransmitted as soon as enough later blocks are acknowledged (fast retransmit), without waiting its timeout.
+    Message IDs are allocated per peer; the IDs of the transactions in flight stay reserved until they finish.
+    The slot of a transaction is reserved in the window while its sender waits for room, so concurrent senders
+    never exceed the window, and the transactions in flight are counted per overall transaction.
     """
 
     def __init__(self):
@@ -20,14 +34,176 @@ class CoapTransactionPool(CoapSingletonBase):
 
         # Dictionaries to track various transaction states
         self.__overall_finished_transactions: dict = {}
+        # Notified when an overall transaction finishes, so the waiting threads wake up right away
+        self.__finished_condition = threading.Condition()
         self.__finished_transactions: dict[tuple] = {}
         self.__failed_transactions: dict[tuple] = {}
         self.__transaction_dict: dict[tuple, CoapTransaction] = {}
         self.__retransmissions: dict = {}
 
+        # Transactions in flight for each overall transaction, and the work IDs whose window slot is reserved
+        self.__pending_transactions: dict[tuple, int] = {}
+        self.__reserved_slots: set[tuple] = set()
+
+        # Congestion windows for each peer, guarded by the condition
+        self.__windows: dict[tuple, CoapCongestionWindow] = {}
+        self.__condition = threading.Condition(threading.RLock())
+
+        # Optional pacing of the initial requests for each peer
+        self.__pacing = False
+        self.__bandwidth_cap: int | None = None
+        self.__pacers: dict[tuple, CoapPacer] = {}
+
+        # Outstanding block-wise transactions of each overall transaction, in sending order
+        self.__outstanding_blocks: dict[tuple, dict[int, tuple]] = {}
+        self.__fast_retransmit_threshold = COAP_FAST_RETRANSMIT_THRESHOLD
+
+        self.__message_ids = CoapMessageIdAllocator()
+
+    def set_pacing(self, enabled: bool, bandwidth_cap: int = None):
+        """
+        Configures the pacing of the initial requests.
+
+        Args:
+            enabled (bool): Whether the datagrams are paced.
+            bandwidth_cap (int): Optional fixed rate in bytes per second; when missing,
+                the rate is derived from the RTT and the congestion window of each peer.
+        """
+        self.__pacing = enabled or bool(bandwidth_cap)
+        self.__bandwidth_cap = bandwidth_cap
+
+    def __get_window(self, peer: tuple) -> CoapCongestionWindow:
+        """
+        Gets the congestion window of a peer, creating it on first use.
+
+        Args:
+            peer (tuple): The (ip, port) of the peer.
+
+        Returns:
+            CoapCongestionWindow: The congestion window of the peer.
+        """
+        if peer not in self.__windows:
+            self.__windows[peer] = CoapCongestionWindow()
+        return self.__windows[peer]
+
+    def next_message_id(self, peer: tuple) -> int:
+        """
+        Allocates a message ID for a new message sent to a peer.
+
+        Args:
+            peer (tuple): The (ip, port) of the peer.
+
+        Returns:
+            int: A message ID that is not used by any transaction in flight towards the peer.
+        """
+        with self.__condition:
+            return self.__message_ids.allocate(peer)
+
+    def set_fast_retransmit(self, threshold: int):
+        """
+        Configures the fast retransmission of blocks.
+
+        Args:
+            threshold (int): The number of later acknowledged blocks that triggers the retransmission of a block;
+                0 disables the fast retransmission.
+        """
+        self.__fast_retransmit_threshold = threshold
+
+    def __pace(self, packet: CoapPacket):
+        """
+        Delays the caller according to the pacing rate of the packet's peer.
+
+        Args:
+            packet (CoapPacket): The CoAP packet that is about to be sent.
+        """
+        size = packet.encoded_size()
+
+        with self.__condition:
+            peer = packet.sender_ip_port
+            if peer not in self.__pacers:
+                self.__pacers[peer] = CoapPacer()
+            pacer = self.__pacers[peer]
+
+            if self.__bandwidth_cap:
+                rate = self.__bandwidth_cap
+            else:
+                window = self.__get_window(peer)
+                rate = None
+                if window.smoothed_rtt:
+                    rate = COAP_PACING_GAIN * window.size * size / window.smoothed_rtt
+
+        pacer.pace(size, rate)
+
+    def __track_block(self, key: tuple):
+        """
+        Registers a block-wise transaction as outstanding for its overall transaction.
+
+        Args:
+            key (tuple): The work ID of the transaction.
+        """
+        if key[3] is not None:
+            self.__outstanding_blocks.setdefault((key[0], key[1]), {})[key[3]] = key
+
+    def __untrack_block(self, key: tuple):
+        """
+        Removes an acknowledged block-wise transaction and fast retransmits the earlier outstanding blocks
+        that collected enough later acknowledgments.
+
+        Args:
+            key (tuple): The work ID of the acknowledged transaction.
+        """
+        general_work_id, block_id = (key[0], key[1]), key[3]
+        outstanding = self.__outstanding_blocks.get(general_work_id)
+        if block_id is None or not outstanding:
+            return
+
+        outstanding.pop(block_id, None)
+        if not outstanding:
+            del self.__outstanding_blocks[general_work_id]
+            return
+
+        if not self.__fast_retransmit_threshold:
+            return
+
+        # Blocks are tracked in sending order, so only the blocks sent before the acknowledged one are visited
+        for earlier_block_id, earlier_key in outstanding.items():
+            if earlier_block_id >= block_id:
+                break
+
+            transaction = self.__transaction_dict.get(earlier_key)
+            if transaction and transaction.register_later_acknowledgment() == self.__fast_retransmit_threshold:
+                transaction.fast_retransmit()
+                self.__get_window(key[0]).on_loss()
+                self.__retransmissions[general_work_id] = self.__retransmissions.get(general_work_id, 0) + 1
+
+    def __has_pending_transactions(self, general_work_id: tuple) -> bool:
+        """
+        Checks if an overall transaction still has transactions in flight.
+
+        Args:
+            general_work_id (tuple): The general work ID of the overall transaction.
+
+        Returns:
+            bool: True if there are transactions in flight; False otherwise.
+        """
+        return self.__pending_transactions.get(general_work_id, 0) > 0
+
+    def __release_pending(self, general_work_id: tuple):
+        """
+        Counts out a transaction of an overall transaction that is no longer in flight.
+
+        Args:
+            general_work_id (tuple): The general work ID of the overall transaction.
+        """
+        remaining = self.__pending_transactions.get(general_work_id, 0) - 1
+        if remaining > 0:
+            self.__pending_transactions[general_work_id] = remaining
+        else:
+            self.__pending_transactions.pop(general_work_id, None)
+
     def handle_congestions(self, packet: CoapPacket, last_packet: bool = False):
         """
-        Handles congestion by checking overall transaction failure and managing concurrent transactions.
+        Handles congestion by checking overall transaction failure and waiting for room in the peer's window.
 
         Args:
             packet (CoapPacket): The CoAP packet to handle.
@@ -35,43 +211,119 @@ class CoapTransactionPool(CoapSingletonBase):
 
         Returns:
             bool: True if overall transaction failed; False otherwise.
+
+        Notes:
+            On success, the slot of the packet is reserved in the peer's window until `add_transaction` registers
+            its transaction.
         """
         if self.is_overall_transaction_failed(packet):
             return True
 
-        # Wait until there's room for a new transaction
-        while len(self.__transaction_dict) >= COAP_CONCURRENT_TRANSACTIONS:
-            pass
+        with self.__condition:
+            if last_packet:
+                # Wait until all transactions of the series are finished
+                while self.__has_pending_transactions(packet.general_work_id()):
+                    if self.is_overall_transaction_failed(packet):
+                        return True
+                    self.__condition.wait(timeout=0.1)
 
-        if last_packet:
-            # Wait until all transactions are finished
-            while len(self.__transaction_dict) != 0:
-                pass
+            window = self.__get_window(packet.sender_ip_port)
+
+            # Wait until there's room for a new transaction in the peer's window, and reserve it under the same lock
+            while not window.acquire():
+                if self.is_overall_transaction_failed(packet):
+                    return True
+                self.__condition.wait(timeout=0.1)
+
+            if self.is_overall_transaction_failed(packet):
+                window.on_release()
+                return True
+            self.__reserved_slots.add(packet.work_id())
 
         return False
 
-    def add_transaction(self, packet: CoapPacket, parent_msg_id=0):
+    def add_transaction(self, packet: CoapPacket, parent_msg_id=0, on_end=None):
         """
         Adds a new CoAP transaction to the pool.
 
         Args:
             packet (CoapPacket): The CoAP packet to initiate the transaction.
             parent_msg_id (int): The parent message ID for the transaction.
+            on_end (callable): Called once the transaction is acknowledged or dropped, e.g. to recycle the buffer
+                of its payload.
 
         Notes:
-            Initiates the request and adds the transaction to the pool.
+            The transaction is registered before the initial request is made,
+            so an acknowledgment can never arrive for an unknown transaction.
+            The packet is paced before the transaction starts its timer, so the pacing delay is counted
+            neither in the RTT samples nor in the ACK timeout.
         """
+        if self.__pacing:
+            self.__pace(packet)
+
+        transaction = CoapTransaction(packet, parent_msg_id, on_end)
+
+        key = packet.work_id()
+
+        with self.__condition:
+            # The slot of the transaction may already be reserved by `handle_congestions`
+            reserved = key in self.__reserved_slots
+            self.__reserved_slots.discard(key)
+
+            if key not in self.__finished_transactions:
+                self.__transaction_dict[key] = transaction
+                self.__track_block(key)
+                self.__message_ids.reserve(packet.sender_ip_port, packet.message_id)
+                general_work_id = packet.general_work_id()
+                self.__pending_transactions[general_work_id] = self.__pending_transactions.get(general_work_id, 0) + 1
+                if not reserved:
+                    self.__get_window(packet.sender_ip_port).on_send()
+            elif reserved:
+                self.__get_window(packet.sender_ip_port).on_release()
+
         # Make the initial request
         packet.send()
 
-        transaction = CoapTransaction(packet, parent_msg_id)
+    def send_unconfirmed(self, packet: CoapPacket):
+        """
+        Sends a message that is not tracked by a transaction (e.g. a NON block), applying the peer's pacing.
 
-        key = packet.work_id()
+        Args:
+            packet (CoapPacket): The CoAP packet to send.
+        """
+        if self.__pacing:
+            self.__pace(packet)
 
-        # An acknowledgment for a packet might be received earlier
-        # than the moment when the transaction is added to the pool.
-        if key not in self.__finished_transactions:
-            self.__transaction_dict[key] = transaction
+        packet.send()
+
+    def get_window_size(self, peer: tuple) -> int:
+        """
+        Gets the current congestion window of a peer.
+
+        Args:
+            peer (tuple): The (ip, port) of the peer.
+
+        Returns:
+            int: The number of messages that may be in flight towards the peer.
+        """
+        with self.__condition:
+            return self.__get_window(peer).size
+
+    def register_delivery(self, peer: tuple, delivered: int, lost: int):
+        """
+        Reports the outcome of unconfirmed messages to the peer's congestion window.
+
+        Args:
+            peer (tuple): The (ip, port) of the peer.
+            delivered (int): The number of messages the peer reported as received.
+            lost (int): The number of messages the peer reported as missing.
+        """
+        with self.__condition:
+            window = self.__get_window(peer)
+            if lost:
+                window.on_loss()
+            else:
+                window.on_delivered(delivered)
 
     def solve_transactions(self):
         """
@@ -79,22 +331,25 @@ class CoapTransactionPool(CoapSingletonBase):
 
         Notes:
             Uses CoapTimer for timing purposes and handles failed transactions and retransmissions.
+            Every retransmission is reported to the peer's congestion window.
         """
-        with CoapTimer():
+        with CoapTimer(), self.__condition:
             if len(self.__transaction_dict) > 0:
                 keys_copy = list(self.__transaction_dict.keys())
 
                 for key in keys_copy:
-                    if ((key[0], key[1]) not in self.__failed_transactions and
+                    transaction = self.__transaction_dict.get(key)
+                    if (transaction and (key[0], key[1]) not in self.__failed_transactions and
                             key not in self.__finished_transactions):
 
-                        match self.__transaction_dict[key].run_transaction():
+                        match transaction.run_transaction():
                             case CoapTransaction.FAILED_TRANSACTION:
-                                self.set_overall_transaction_failure(self.__transaction_dict[key].request)
-                                self.clean_failed_transactions(self.__transaction_dict[key].request)
+                                self.set_overall_transaction_failure(transaction.request)
                                 break
 
                             case CoapTransaction.RETRANSMISSION:
+                                self.__get_window(key[0]).on_loss()
+
                                 identifier = (key[0], key[1])
                                 if identifier not in self.__retransmissions:
                                     self.__retransmissions[identifier] = 1
@@ -112,11 +367,22 @@ class CoapTransactionPool(CoapSingletonBase):
         """
         key = packet.work_id()
 
-        self.__finished_transactions[key] = time.time()
-
-        # There is no need to delete the transaction if it has already finished.
-        if key in self.__transaction_dict:
-            del self.__transaction_dict[key]
+        with self.__condition:
+            self.__finished_transactions[key] = time.time()
+
+            # There is no need to delete the transaction if it has already finished.
+            transaction = self.__transaction_dict.pop(key, None)
+            if transaction:
+                self.__untrack_block(key)
+                self.__release_pending(transaction.request.general_work_id())
+                self.__message_ids.release(packet.sender_ip_port, packet.message_id)
+                self.__get_window(packet.sender_ip_port).on_ack(
+                    transaction.retransmission_counter == 0,
+                    transaction.timer.elapsed_time()
+                )
+                if transaction.on_end:
+                    transaction.on_end()
+                self.__condition.notify_all()
 
     def is_transaction_finished(self, packet: CoapPacket):
         """
@@ -138,8 +404,10 @@ class CoapTransactionPool(CoapSingletonBase):
         Args:
             packet (CoapPacket): The CoAP packet associated with the overall finished transaction.
         """
-        if packet.general_work_id() not in self.__overall_finished_transactions:
-            self.__overall_finished_transactions[packet.general_work_id()] = time.time()
+        with self.__finished_condition:
+            if packet.general_work_id() not in self.__overall_finished_transactions:
+                self.__overall_finished_transactions[packet.general_work_id()] = time.time()
+                self.__finished_condition.notify_all()
 
     def wait_util_finish(self, packet: CoapPacket):
         """
@@ -148,8 +416,10 @@ class CoapTransactionPool(CoapSingletonBase):
         Args:
             packet (CoapPacket): The CoAP packet associated with the overall transaction.
         """
-        while packet.general_work_id() not in self.__overall_finished_transactions:
-            time.sleep(0.5)
+        with self.__finished_condition:
+            self.__finished_condition.wait_for(
+                lambda: packet.general_work_id() in self.__overall_finished_transactions
+            )
 
     def is_overall_transaction_failed(self, packet: CoapPacket):
         """
@@ -165,12 +435,15 @@ class CoapTransactionPool(CoapSingletonBase):
 
     def set_overall_transaction_failure(self, packet: CoapPacket):
         """
-        Marks the overall CoAP transaction as failed.
+        Marks the overall CoAP transaction as failed and drops its pending transactions.
 
         Args:
             packet (CoapPacket): The CoAP packet associated with the overall failed transaction.
         """
-        self.__failed_transactions[packet.general_work_id()] = time.time()
+        with self.__condition:
+            self.__failed_transactions[packet.general_work_id()] = time.time()
+            self.clean_failed_transactions(packet)
+            self.__condition.notify_all()
 
     def clean_failed_transactions(self, packet: CoapPacket):
         """
@@ -180,13 +453,23 @@ class CoapTransactionPool(CoapSingletonBase):
             packet (CoapPacket): The CoAP packet used to filter and remove failed transactions.
 
         Notes:
-            Removes transactions from the transaction dictionary based on the provided packet's general work ID.
+            Removes transactions from the transaction dictionary based on the provided packet's general work ID
+            and releases their slots from the peer's congestion window.
         """
-        # Create a new transaction dictionary excluding failed transactions related to the specified packet
-        self.__transaction_dict = {
-            t.request.work_id(): time.time() for t in self.__transaction_dict.values()
-            if t.request.general_work_id() != packet.general_work_id()
-        }
+        with self.__condition:
+            failed = [key for key, t in self.__transaction_dict.items()
+                      if t.request.general_work_id() == packet.general_work_id()]
+
+            for key in failed:
+                transaction = self.__transaction_dict.pop(key)
+                self.__message_ids.release(key[0], key[2])
+                if transaction.on_end:
+                    transaction.on_end()
+            self.__outstanding_blocks.pop(packet.general_work_id(), None)
+            self.__pending_transactions.pop(packet.general_work_id(), None)
+
+            if failed:
+                self.__get_window(packet.sender_ip_port).on_release(len(failed))
 
     def get_number_of_retransmissions(self, packet: CoapPacket):
         """
@@ -1,3 +1,15 @@
 COAP_MAX_WORKERS_NUMBER = 10
 COAP_WORKER_QUEUE_SIZE = 20000
 COAP_ALLOWED_WORKER_IDLE = 60
+
+# RFC 7252 4.6: a 1024 bytes payload plus up to 128 bytes of header, token and options
+COAP_MAX_DATAGRAM_SIZE = 1152
+
+# The bytes a block may carry besides its payload: the header and the 8 bytes token (12), the name of the file
+# (up to 255 bytes, and 3 of option header), the other options of a block at their largest (block, size, ETag,
+# content hash, FEC, local block size, compression: 64), the payload marker and the compression byte (2).
+# The largest local block plus this bound still fits a UDP datagram.
+COAP_DATAGRAM_OVERHEAD = 384
+
+# The socket buffers hold this many datagrams of the largest size, so bursts of large blocks are not dropped
+COAP_SOCKET_BUFFER_DATAGRAMS = 256
@@ -2,10 +2,12 @@ from contextlib import contextmanager
 from queue import Queue
 from threading import Thread
 
-from coap_core.coap_packet.coap_config import CoapOptionDelta, CoapCodeFormat
+from coap_core.coap_packet.coap_config import CoapOptionDelta, CoapCodeFormat, CoapType
 from coap_core.coap_packet.coap_packet import CoapPacket
 from coap_core.coap_packet.coap_templates import CoapTemplates
 from coap_core.coap_resource.resource_manager import ResourceManager
+from coap_core.coap_transaction.coap_responder import CoapResponder
+from coap_core.coap_transaction.coap_transaction_pool import CoapTransactionPool
 from coap_core.coap_utilities.coap_logger import logger
 from coap_core.coap_utilities.coap_timer import CoapTimer
 
@@ -124,8 +126,7 @@ class CoapWorker(Thread):
         if not task.options.get(CoapOptionDelta.URI_PATH.value) and CoapCodeFormat.is_method(task.code):
             # Handle the case where URI PATH is not specified for a method
             logger.log("URI PATH not specified")
-            reset = CoapTemplates.BAD_REQUEST.value_with(task.token, task.message_id)
-            task.skt.sendto(reset.encode(), task.sender_ip_port)
+            CoapResponder().respond(task, CoapTemplates.BAD_REQUEST.value_with(task.token, task.message_id))
             return
 
         # Obtain a resource based on URI PATH
@@ -136,14 +137,16 @@ class CoapWorker(Thread):
         if not resource:
             # Handle the case where URI PATH does not exist
             logger.log("URI PATH does not exist")
-            reset = CoapTemplates.BAD_REQUEST.value_with(task.token, task.message_id)
-            task.skt.sendto(reset.encode(), task.sender_ip_port)
+            CoapResponder().respond(task, CoapTemplates.BAD_REQUEST.value_with(task.token, task.message_id))
             return
 
         if task.needs_internal_computation:
             # Handle internal computation
-            resource.handle_internal(task)
+            with self.heavy_work():
+                resource.handle_internal(task)
         else:
+            # The ACK of a transfer is not held (see CoapWorkerPool); a GET carrying an ETag may be answered
+            # 2.03 Valid instead, so its handler flushes the ACK
             task_code = task.code
             if task_code == CoapCodeFormat.GET.value():
                 with self.heavy_work():
@@ -160,3 +163,9 @@ class CoapWorker(Thread):
             else:
                 resource.handle_response(task)
 
+        # Handlers that did not respond through the responder still get their request acknowledged
+        CoapResponder().flush_acknowledgment(task)
+
+        # The requester sees a piggybacked response handled once its transaction is finished
+        if task.message_type == CoapType.ACK.value:
+            CoapTransactionPool().finish_transaction(task)
@@ -4,14 +4,17 @@ import threading
 import time
 from abc import ABC
 from select import select
-from socket import socket
+from socket import socket, SOL_SOCKET, SO_RCVBUF, SO_SNDBUF
 
-from coap_core.coap_worker import COAP_WORKER_QUEUE_SIZE, COAP_ALLOWED_WORKER_IDLE
+from coap_core.coap_worker import COAP_WORKER_QUEUE_SIZE, COAP_ALLOWED_WORKER_IDLE, COAP_MAX_DATAGRAM_SIZE, \
+    COAP_SOCKET_BUFFER_DATAGRAMS
 from coap_core.coap_packet.coap_config import CoapType, CoapCodeFormat, CoapOptionDelta, verify_format, gen_token
 from coap_core.coap_packet.coap_packet import CoapPacket
 from coap_core.coap_packet.coap_templates import CoapTemplates
 from coap_core.coap_resource.resource import Resource
 from coap_core.coap_resource.resource_manager import ResourceManager
+from coap_core.coap_transaction.coap_deduplication_cache import CoapDeduplicationCache
+from coap_core.coap_transaction.coap_responder import CoapResponder
 from coap_core.coap_transaction.coap_transaction_pool import CoapTransactionPool
 from coap_core.coap_utilities.coap_logger import logger, LogColor
 from coap_core.coap_worker.coap_worker import CoapWorker
@@ -28,7 +31,8 @@ class CoapWorkerPool(ABC):
     to add UI threads or other kinds of stuff.
     """
 
-    def __init__(self, skt: socket, resource: Resource, receive_queue=None):
+    def __init__(self, skt: socket, resource: Resource, receive_queue=None,
+                 max_datagram_size: int = COAP_MAX_DATAGRAM_SIZE):
         """
         Initializes the CoapWorkerPool instance.
 
@@ -36,6 +40,7 @@ class CoapWorkerPool(ABC):
             skt (socket): The socket for communication.
             resource (Resource): The default resource for the worker pool.
             receive_queue (Queue): Optional queue for receiving CoAP packets.
+            max_datagram_size (int): The size of the largest datagram that can be received.
         """
         self.name = f"WorkerPoll"
 
@@ -45,6 +50,8 @@ class CoapWorkerPool(ABC):
         self._failed_requests = {}
 
         self._socket = skt
+        self._max_datagram_size = max_datagram_size
+        CoapWorkerPool.size_socket_buffers(skt, max_datagram_size)
 
         self.__workers: list[CoapWorker] = []
 
@@ -69,8 +76,43 @@ class CoapWorkerPool(ABC):
         ]
 
         self.__transaction_pool = CoapTransactionPool()
+        self.__deduplication_cache = CoapDeduplicationCache()
         ResourceManager().add_default_resource(resource)
 
+    @staticmethod
+    def size_socket_buffers(skt: socket, max_datagram_size: int):
+        """
+        Grows the socket buffers to hold COAP_SOCKET_BUFFER_DATAGRAMS datagrams of the largest size.
+        The kernel caps the requested size (net.core.rmem_max/wmem_max on Linux).
+
+        Args:
+            skt (socket): The socket for communication.
+            max_datagram_size (int): The size of the largest datagram.
+        """
+        for option in (SO_RCVBUF, SO_SNDBUF):
+            if skt.getsockopt(SOL_SOCKET, option) < COAP_SOCKET_BUFFER_DATAGRAMS * max_datagram_size:
+                skt.setsockopt(SOL_SOCKET, option, COAP_SOCKET_BUFFER_DATAGRAMS * max_datagram_size)
+
+    @staticmethod
+    def __may_piggyback(packet: CoapPacket) -> bool:
+        """
+        Checks if a CON request may be answered shortly, so its ACK is held for the response. Transfers started by
+        a FETCH or a GET without ETag are answered by their blocks, and the blocks of an upload after the first one
+        only by their ACK.
+
+        Args:
+            packet (CoapPacket): The CON request.
+
+        Returns:
+            bool: True if the ACK is held.
+        """
+        if packet.code == CoapCodeFormat.FETCH.value() or (packet.code == CoapCodeFormat.GET.value() and
+                                                           CoapOptionDelta.ETAG.value not in packet.options):
+            return False
+        if packet.get_option_code() in (CoapOptionDelta.BLOCK1.value, CoapOptionDelta.Q_BLOCK1.value):
+            return packet.get_block_id() == 0
+        return True
+
     def _add_background_thread(self, thread: threading.Thread):
         """
         Adds a background thread to the list of background threads.
@@ -128,10 +170,14 @@ class CoapWorkerPool(ABC):
         Filters and processes incoming CoAP packets based on their format.
 
         The received packet can have the following types:
-        - CON: An acknowledgment must be sent accordingly with the additional related fields.
+        - CON: An acknowledgment must be sent accordingly with the additional related fields; the ACK of a method
+          is held shortly, so that a fast response can be piggybacked on it.
         - NON: It is clear that no operation must be done.
-        - ACK: The transaction that waited for it must be finished.
-        - RST: An error occurred, and all related transactions must be stopped.
+        - ACK: The transaction that waited for it must be finished; a piggybacked response is handled first.
+        - RST: An error occurred or the peer canceled the exchange (empty RST), and all related transactions must
+          be stopped; CON messages of a stopped exchange are answered with an RST.
+
+        Duplicated CON/NON messages are not processed again; the stored acknowledgment is replayed instead.
         """
         while self.__is_running:
             data: tuple[bytes, tuple] = self._received_packets.get()
@@ -139,7 +185,15 @@ class CoapWorkerPool(ABC):
             if verify_format(packet):
                 match packet.message_type:
                     case CoapType.CON.value:
-                        if not self.__transaction_pool.is_overall_transaction_failed(packet):
+                        if self.__deduplication_cache.replay(packet):
+                            pass
+                        elif self.__transaction_pool.is_overall_transaction_failed(packet):
+                            # The exchange was canceled or failed: the peer is told to stop sending
+                            CoapTemplates.EMPTY_RST.value_with(
+                                packet.token, packet.message_id,
+                                self._socket, data[1]
+                            ).send()
+                        else:
                             if CoapCodeFormat.is_method(packet.code):  # GET PUT POST DELETE FETCH
                                 ack = CoapTemplates.EMPTY_ACK.value_with(
                                     packet.token, packet.message_id,
@@ -160,27 +214,50 @@ class CoapWorkerPool(ABC):
                                     packet.token, packet.message_id,
                                     self._socket, data[1]
                                 )
+                            # Blocks past the 20 bits NUM limit are identified by their sub-session too
+                            if packet.get_option_code() and CoapOptionDelta.SUB_SESSION.value in packet.options:
+                                ack.options[CoapOptionDelta.SUB_SESSION.value] = \
+                                    packet.options[CoapOptionDelta.SUB_SESSION.value]
                             ack.skt = self._socket
                             ack.sender_ip_port = packet.sender_ip_port
-                            ack.send()
 
-                            if packet.work_id() not in self._shared_work:
-                                self.__choose_worker().submit_task(packet)
-                                self._shared_work[packet.work_id()] = time.time()
+                            if CoapCodeFormat.is_method(packet.code) and self.__may_piggyback(packet):
+                                # The ACK waits shortly for a response to piggyback; duplicates meanwhile are dropped
+                                self.__deduplication_cache.register(packet)
+                                CoapResponder().defer_acknowledgment(packet, ack)
+                            else:
+                                ack.send()
+                                # Retransmissions of the request will only get the same ACK back
+                                self.__deduplication_cache.register(packet, ack)
+                            self.__choose_worker().submit_task(packet)
 
                     case CoapType.NON.value:
-                        if packet.work_id() not in self._shared_work:
+                        if not self.__deduplication_cache.replay(packet):
+                            self.__deduplication_cache.register(packet)
                             self.__choose_worker().submit_task(packet)
-                            self._shared_work[packet.work_id()] = time.time()
 
                     case CoapType.ACK.value:
-                        CoapTransactionPool().finish_transaction(packet)
+                        if packet.code == CoapCodeFormat.EMPTY.value() or \
+                                (packet.code == CoapCodeFormat.SUCCESS_CONTINUE.value() and not packet.payload):
+                            CoapTransactionPool().finish_transaction(packet)
+                        else:
+                            # Piggybacked responses finish their transaction once handled
+                            self.__choose_worker().submit_task(packet)
 
                     case CoapType.RST.value:
+                        if not self.__transaction_pool.is_overall_transaction_failed(packet):
+                            if packet.code == CoapCodeFormat.EMPTY.value():
+                                logger.log("! Warning: exchange canceled by the peer", LogColor.YELLOW)
+                            else:
+                                logger.log(f"! Warning: {CoapCodeFormat.get_field_name(packet.code)}",
+                                           LogColor.YELLOW)
+
                         self._failed_requests[packet.general_work_id()] = time.time()
                         self.__transaction_pool.set_overall_transaction_failure(packet)
                         self.__transaction_pool.finish_overall_transaction(packet)
-                        logger.log(f"! Warning: {CoapCodeFormat.get_field_name(packet.code)}", LogColor.YELLOW)
+
+                        # The resource releases the state of the exchange
+                        self.__choose_worker().submit_task(packet)
 
                     case _:
                         pass
@@ -207,7 +284,12 @@ class CoapWorkerPool(ABC):
                 active_socket, _, _ = select([self._socket], [], [], 1)
 
                 if active_socket:
-                    data, address = self._socket.recvfrom(1152)
+                    # One more byte than allowed, so truncated datagrams can be told apart
+                    data, address = self._socket.recvfrom(self._max_datagram_size + 1)
+                    if len(data) > self._max_datagram_size:
+                        logger.debug(f"{self.name} Datagram from {address} larger than {self._max_datagram_size}"
+                                     f" bytes dropped.", LogColor.YELLOW)
+                        continue
                     self._received_packets.put((data, address))
 
             except Exception:
@@ -220,9 +302,10 @@ class CoapWorkerPool(ABC):
         Handles internal CoAP tasks, distributing them to workers.
 
         Args:
-            task (CoapPacket): The internal CoAP task.
+            task (CoapPacket): The internal CoAP task; a token set by the caller is kept.
         """
-        task.token = gen_token()
+        task.token = task.token or gen_token()
+        task.message_id = self.__transaction_pool.next_message_id(task.sender_ip_port)
         if task.needs_internal_computation:
             chosen_worker = CoapWorker(self._shared_work)
             chosen_worker.start()
@@ -15,6 +15,7 @@ setup(
         'console_scripts': [
             'share-drive-client = share_drive.share_drive_client.client:main',
             'share-drive-server = share_drive.share_drive_server.server:main',
+            'share-drive-benchmark = share_drive.share_drive_benchmark.block_size_benchmark:main',
         ],
     },
     include_package_data=True,
@@ -0,0 +1,159 @@
+import argparse
+import hashlib
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+from coap_core.coap_utilities.coap_logger import logger, LogColor
+from share_drive.share_drive_client.client import Client
+from share_drive.share_drive_helpers import DRIVE_MAX_LOCAL_BLOCK_SIZE
+from share_drive.share_drive_helpers.drive_spliter import DriveSpliter
+
+BENCHMARK_FILE = "benchmark.bin"
+BENCHMARK_FOLDER = "benchmark"
+
+# The longest file name (NAME_MAX), so every block carries the largest Location-Path option
+LONG_NAME_LENGTH = 255
+
+
+def stop_server(server: subprocess.Popen):
+    """
+    Stops the server together with the processes it forked for the clients.
+
+    Args:
+        server (subprocess.Popen): The server process, started in its own session.
+    """
+    try:
+        os.killpg(server.pid, signal.SIGTERM)
+    except ProcessLookupError:
+        pass
+
+
+def file_digest(path: str) -> str:
+    """
+    Computes the MD5 digest of a file.
+
+    Args:
+        path (str): The path of the file.
+
+    Returns:
+        str: The hexadecimal digest.
+    """
+    digest = hashlib.md5()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class BenchmarkClient(Client):
+    """
+    Downloads the same file once per block size and reports the throughput of each transfer.
+
+    Args:
+        block_sizes (list): The block sizes to be measured.
+        file_name (str): The name of the served file.
+        expected_digest (str): The digest of the served file, to check the downloads.
+        server (subprocess.Popen): The server process, stopped at the end of the benchmark.
+        home (str): The temporary home folder, deleted at the end of the benchmark.
+    """
+
+    def __init__(self, server_ip, server_port, ip_address, port, block_sizes, file_name, expected_digest, server,
+                 home, q_block=False):
+        super().__init__(server_ip, server_port, ip_address, port, q_block, block_size=max(block_sizes))
+
+        self.__block_sizes = block_sizes
+        self.__file_name = file_name
+        self.__expected_digest = expected_digest
+        self.__server = server
+        self.__home = home
+
+    def client_cli(self):
+        """
+        Runs the downloads instead of the interactive CLI, then prints the results.
+        """
+        results = []
+        try:
+            os.makedirs(os.path.join(self.__home, BENCHMARK_FOLDER), exist_ok=True)
+            local_file = os.path.join(self.__home, BENCHMARK_FOLDER, self.__file_name)
+
+            for block_size in self.__block_sizes:
+                if os.path.exists(local_file):
+                    os.remove(local_file)
+
+                start = time.time()
+                self.download(self.__file_name, BENCHMARK_FOLDER, block_size)
+                elapsed = time.time() - start
+
+                valid = os.path.exists(local_file) and file_digest(local_file) == self.__expected_digest
+                size = os.path.getsize(local_file) if os.path.exists(local_file) else 0
+                results.append((block_size, elapsed, size / elapsed / (1 << 20), valid))
+        finally:
+            stop_server(self.__server)
+            shutil.rmtree(self.__home, ignore_errors=True)
+
+            logger.log(f"{'block size':>12} {'time (s)':>10} {'MiB/s':>10} {'valid':>6}", LogColor.CYAN)
+            for block_size, elapsed, throughput, valid in results:
+                logger.log(f"{block_size:>12} {elapsed:>10.2f} {throughput:>10.2f} {str(valid):>6}", LogColor.CYAN)
+
+            # The pool threads block on the socket and queues, so the process is ended here
+            os._exit(0)
+
+
+def main():
+    """
+    Main function: starts a server in a temporary home folder and measures the downloads of a random file
+    for each block size.
+    """
+    parser = argparse.ArgumentParser(description='Download throughput for each block size')
+
+    parser.add_argument('--server_address', '-sa', type=str, default='127.0.0.1', help='Server address')
+    parser.add_argument('--server_port', '-sp', type=int, default=5693, help='Server port')
+    parser.add_argument('--client_address', '-ca', type=str, default='127.0.0.2', help='Client address')
+    parser.add_argument('--client_port', '-cp', type=int, default=5693, help='Client port')
+    parser.add_argument('--size', '-s', type=int, default=8_000_000, help='Size of the downloaded file in bytes')
+    parser.add_argument('--block_sizes', '-bs', type=int, nargs='+', default=[256, 512, 1024, 4096, 16384, 65024],
+                        help='Block sizes in bytes to be measured')
+    parser.add_argument('--q_block', '-qb', action='store_true', help='Transfer files with Q-Block NON bursts')
+    parser.add_argument('--long_name', '-ln', action='store_true',
+                        help=f'Serve the file under a name of {LONG_NAME_LENGTH} bytes, the longest one')
+
+    args = parser.parse_args()
+    if not all(16 <= block_size <= DRIVE_MAX_LOCAL_BLOCK_SIZE for block_size in args.block_sizes):
+        parser.error(f'--block_sizes must be between 16 and {DRIVE_MAX_LOCAL_BLOCK_SIZE}')
+
+    # Both sides run in a temporary home folder
+    home = tempfile.mkdtemp(prefix="share_drive_benchmark_")
+    os.environ["HOME"] = home
+    served_folder = os.path.join(home, "coap", "server", "resources", "share_drive")
+    os.makedirs(served_folder)
+    os.makedirs(os.path.join(home, "coap", "client", "resources"))
+
+    file_name = BENCHMARK_FILE.rjust(LONG_NAME_LENGTH, "b") if args.long_name else BENCHMARK_FILE
+    served_file = os.path.join(served_folder, file_name)
+    with open(served_file, 'wb') as file:
+        file.write(os.urandom(args.size))
+
+    server = subprocess.Popen(
+        [sys.executable, "-m", "share_drive.share_drive_server.server",
+         "--server_address", args.server_address, "--server_port", str(args.server_port),
+         "--block_size", str(max(args.block_sizes))],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True
+    )
+    time.sleep(1)
+
+    try:
+        DriveSpliter().set_max_block_size(max(args.block_sizes))
+        BenchmarkClient(args.server_address, args.server_port, args.client_address, args.client_port,
+                        args.block_sizes, file_name, file_digest(served_file), server, home, args.q_block).listen()
+    finally:
+        stop_server(server)
+        shutil.rmtree(home, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,8 @@
 import argparse
+import json
 import os
 import threading
+from concurrent.futures import ThreadPoolExecutor
 from _socket import IPPROTO_UDP
 from socket import socket, AF_INET, SOCK_DGRAM
 
@@ -11,12 +13,27 @@ from prompt_toolkit.styles import Style
 from pyfiglet import Figlet
 
 from coap_core.coap_transaction.coap_transaction_pool import CoapTransactionPool
-from coap_core.coap_packet.coap_config import CoapOptionDelta
+from coap_core.coap_packet.coap_config import CoapOptionDelta, gen_token
+from coap_core.coap_packet.coap_packet import CoapPacket
+from coap_core.coap_packet.coap_templates import CoapTemplates
 from coap_core.coap_utilities.coap_logger import logger, LogColor
+from coap_core.coap_utilities.coap_timer import CoapTimer
+from coap_core.coap_worker import COAP_MAX_DATAGRAM_SIZE, COAP_DATAGRAM_OVERHEAD
 from coap_core.coap_worker.coap_worker_pool import CoapWorkerPool
 from share_drive.share_drive_client.client_resource import ClientResource
+from share_drive.share_drive_helpers import DRIVE_BLOCK_SIZE, DRIVE_MAX_LOCAL_BLOCK_SIZE, DRIVE_MANIFEST_QUERY, \
+    DRIVE_FOLDER_PARALLELISM, DRIVE_DELTA_SIGNATURE_QUERY, DRIVE_DELTA_QUERY, DRIVE_DELTA_READ_SIZE, \
+    DRIVE_CHUNK_RECIPE_QUERY, DRIVE_CHUNK_MISSING_QUERY, DRIVE_CHUNK_QUERY
 from share_drive.share_drive_helpers.drive_assembler import DriveAssembler
+from share_drive.share_drive_helpers.drive_chunks import DriveChunker, WINDOW_SIZE
+from share_drive.share_drive_helpers.drive_compression import DriveCompression
+from share_drive.share_drive_helpers.drive_delta import DriveDelta, DriveDeltaPatcher, COPY, DATA
+from share_drive.share_drive_helpers.drive_etag import DriveETag
+from share_drive.share_drive_helpers.drive_fec import DriveFec
+from share_drive.share_drive_helpers.drive_resume import DriveResume
+from share_drive.share_drive_helpers.drive_spliter import DriveSpliter
 from share_drive.share_drive_helpers.drive_templates import DriveTemplates
+from share_drive.share_drive_helpers.drive_utils import DriveUtilities, DriveFileReader
 
 
 def clean_terminal():
@@ -37,9 +54,16 @@ class Client(CoapWorkerPool):
         server_port (int): The port of the CoAP server.
         ip_address (str): The IP address of the client.
         port (int): The port of the client.
+        q_block (bool): Whether the transfers use Q-Block (NON bursts) instead of Block (CON per block).
+        fec (tuple): The group size (K) and parity count (M) of the Q-Block transfers, or None for no parity.
+        block_size (int): The block size asked for the transfers; above 1024 bytes the local mode is used.
+        parallelism (int): The number of files of a folder downloaded at once; 1 downloads a folder as one archive.
+        compression (tuple): The compression method and level offered for the transfers, or None for no compression.
+        dedup (bool): Whether new files are uploaded as the chunks the server does not have.
     """
 
-    def __init__(self, server_ip, server_port, ip_address, port):
+    def __init__(self, server_ip, server_port, ip_address, port, q_block=False, fec=None,
+                 block_size=DRIVE_BLOCK_SIZE, parallelism=DRIVE_FOLDER_PARALLELISM, compression=None, dedup=False):
         """
         Initializes the CoAP Drive Client.
 
@@ -48,15 +72,38 @@ class Client(CoapWorkerPool):
             server_port (int): The port of the CoAP server.
             ip_address (str): The IP address of the client.
             port (int): The port of the client.
+            q_block (bool): Whether the transfers use Q-Block (NON bursts) instead of Block (CON per block).
+            fec (tuple): The group size (K) and parity count (M) of the Q-Block transfers, or None for no parity.
+            block_size (int): The block size asked for the transfers; above 1024 bytes the local mode is used.
+            parallelism (int): The number of files of a folder downloaded at once; 1 downloads a folder as one
+                archive.
+            compression (tuple): The compression method and level offered for the transfers, or None for no
+                compression.
+            dedup (bool): Whether new files are uploaded as the chunks the server does not have.
         """
         skt = socket(AF_INET, SOCK_DGRAM, IPPROTO_UDP)
         skt.bind((ip_address, port))
-        super().__init__(skt, ClientResource("downloads", f"{os.path.expanduser('~')}/coap/client/resources/"))
+        super().__init__(skt, ClientResource("downloads", f"{os.path.expanduser('~')}/coap/client/resources/"),
+                         max_datagram_size=max(COAP_MAX_DATAGRAM_SIZE, block_size + COAP_DATAGRAM_OVERHEAD))
 
         self._add_background_thread(threading.Thread(target=self.client_cli))
 
         self.__server_ip = server_ip
         self.__server_port = server_port
+        self.__q_block = q_block
+        self.__fec = fec
+        self.__block_size = block_size
+        self.__parallelism = parallelism
+        self.__compression = compression
+        self.__dedup = dedup
+
+        # The ETags of the local files are kept, so unchanged copies are validated without being hashed again
+        DriveETag().set_index(f"{os.path.expanduser('~')}/coap/client/etags.db")
+
+        # Transfers in progress by token, so they can be canceled
+        self.__transfers: dict[bytes, CoapPacket] = {}
+        self.__transfers_lock = threading.Lock()
+
         self.__style = Style(
             [
                 ("separator", "fg:#cc5454"),
@@ -71,6 +118,60 @@ class Client(CoapWorkerPool):
             ]
         )
 
+    def __set_transfer_mode(self, coap_message, block_size=None):
+        """
+        Sets the block size of a transfer request, offers compression if enabled, replaces its Block option with
+        the Q-Block counterpart, if enabled, and asks for parity blocks if FEC is enabled.
+
+        Args:
+            coap_message (CoapPacket): The download or upload request.
+            block_size (int): The block size of this transfer, at most the one of the client.
+        """
+        # Larger blocks than the ones of the client would not fit in its receive buffer
+        szx, local_block_size = DriveSpliter.encode_block_size(min(block_size or self.__block_size,
+                                                                   self.__block_size))
+        coap_message.options[coap_message.get_option_code()] = CoapPacket.encode_option_block(0, 0, szx)
+        if local_block_size:
+            coap_message.options[CoapOptionDelta.LOCAL_BLOCK_SIZE.value] = local_block_size
+
+        # The sender compresses the blocks of the files that are worth it, and marks them
+        if self.__compression:
+            coap_message.options[CoapOptionDelta.COMPRESSION.value] = DriveCompression.encode_option(
+                *self.__compression)
+
+        if not self.__q_block:
+            return
+
+        for block_option, q_block_option in ((CoapOptionDelta.BLOCK1.value, CoapOptionDelta.Q_BLOCK1.value),
+                                             (CoapOptionDelta.BLOCK2.value, CoapOptionDelta.Q_BLOCK2.value)):
+            if block_option in coap_message.options:
+                coap_message.options[q_block_option] = coap_message.options.pop(block_option)
+
+        if self.__fec:
+            coap_message.options[CoapOptionDelta.FEC.value] = DriveFec.encode_option(*self.__fec)
+
+    @staticmethod
+    def __set_resume_point(coap_message, local_file_path):
+        """
+        Asks a download to continue from the next missing block of a partial file, if one was left by
+        an interrupted download of the same remote file.
+
+        Args:
+            coap_message (CoapPacket): The download request.
+            local_file_path (str): The path where the file is saved.
+        """
+        state = DriveResume.load(local_file_path)
+        remote_name = os.path.basename(coap_message.options[CoapOptionDelta.LOCATION_PATH.value])
+        block_size = DriveSpliter.get_requested_block_size(coap_message)
+        if not state or state.get("path") != remote_name or not DriveResume.is_resumable(
+                state, local_file_path, state["etag"], block_size, state["total_packets"], state["next_block"]):
+            return
+
+        # The sender starts over if the file changed since
+        szx = CoapPacket.decode_option_block(coap_message.options[coap_message.get_option_code()])["SZX"]
+        coap_message.set_option_block(coap_message.get_option_code(), state["next_block"], 0, szx)
+        coap_message.options[CoapOptionDelta.IF_MATCH.value] = state["etag"].to_bytes(8, 'big')
+
     def download_file(self):
         """
         Initiates the process of downloading a file from the CoAP server.
@@ -90,19 +191,235 @@ class Client(CoapWorkerPool):
                 complete_style=CompleteStyle.COLUMN
             ).ask()
 
-            coap_message = DriveTemplates.DOWNLOAD.value()
-            coap_message.options[CoapOptionDelta.LOCATION_PATH.value] = file_name
-            coap_message.options[CoapOptionDelta.URI_PATH.value] = "share_drive"
-            coap_message.skt = self._socket
-            coap_message.sender_ip_port = (self.__server_ip, int(self.__server_port))
-
-            DriveAssembler().set_save_path(local_path)
-            self._handle_internal_task(coap_message)
-
-            CoapTransactionPool().wait_util_finish(coap_message)
+            if file_name in DriveAssembler().get_folders_list() and self.__parallelism > 1:
+                self.download_folder(file_name, local_path)
+            else:
+                self.download(file_name, local_path, delta=True)
         else:
             logger.log("> There is nothing to be downloaded.", LogColor.YELLOW)
 
+    def download(self, file_name, local_path, block_size=None, delta=False):
+        """
+        Downloads a file from the CoAP server and waits for the transfer to finish.
+
+        Args:
+            file_name (str): The remote path of the file to download.
+            local_path (str): The local folder, relative to the home folder, where the file is saved.
+            block_size (int): The block size of this transfer, at most the one of the client.
+            delta (bool): Whether a local copy of the file is updated with only the blocks that changed.
+        """
+        local_file_path = os.path.join(os.path.expanduser("~"), local_path, os.path.basename(file_name))
+
+        # The ETag of a local copy is sent, so the file is not sent again if it did not change; a partial file
+        # is resumed instead
+        etag = None
+        if os.path.isfile(local_file_path) and not DriveResume.load(local_file_path):
+            etag = DriveETag().get(local_file_path)
+
+        if delta and etag is not None and self.__download_delta(file_name, local_file_path, etag, block_size):
+            return
+
+        coap_message = DriveTemplates.DOWNLOAD.value()
+        coap_message.options[CoapOptionDelta.LOCATION_PATH.value] = file_name
+        coap_message.options[CoapOptionDelta.URI_PATH.value] = "share_drive"
+        coap_message.skt = self._socket
+        coap_message.sender_ip_port = (self.__server_ip, int(self.__server_port))
+        self.__set_transfer_mode(coap_message, block_size)
+
+        # The token is set here, so the file is saved in the local path whatever the other downloads
+        coap_message.token = gen_token()
+        DriveAssembler().open_session(coap_message, local_path)
+        self.__set_resume_point(coap_message, local_file_path)
+        if etag is not None:
+            coap_message.options[CoapOptionDelta.ETAG.value] = etag
+        self._handle_internal_task(coap_message)
+
+        self.__wait_transfer(coap_message)
+        if DriveAssembler().pop_valid(coap_message):
+            logger.log(f"> The local copy of {file_name} is up to date.", LogColor.CYAN)
+
+    def __download_delta(self, file_name, local_file_path, etag, block_size=None):
+        """
+        Updates the local copy of a remote file: the signature of the remote file is read, the blocks found
+        in the local copy are copied from it, and only the others are read from the server. The signature is
+        not sent if the local copy has the ETag of the remote file.
+
+        Args:
+            file_name (str): The remote path of the file.
+            local_file_path (str): The path of the local copy.
+            etag (int): The ETag of the local copy.
+            block_size (int): The block size of the transfers, at most the one of the client.
+
+        Returns:
+            bool: True if the local copy was updated or is up to date; False if the file must be downloaded whole.
+        """
+        coap_message = self.__send_read(file_name, DRIVE_DELTA_SIGNATURE_QUERY, block_size, etag)
+        if DriveAssembler().pop_valid(coap_message):
+            logger.log(f"> The local copy of {file_name} is up to date.", LogColor.CYAN)
+            return True
+
+        signature = DriveDelta.parse_signature(DriveAssembler().pop_read(coap_message))
+        if signature is None:
+            return False
+
+        try:
+            with DriveFileReader(local_file_path, DriveDelta.get_window_size(signature)) as reader:
+                operations = DriveDelta.get_rebuild_operations(signature, reader)
+        except OSError as e:
+            logger.log(f"> The local copy of {file_name} cannot be scanned: {e}", LogColor.RED)
+            return False
+        missing = sum(length for operation, _, length in operations if operation == DATA)
+        if signature["size"] and missing == signature["size"]:
+            return False
+        logger.log(f"> Downloading {missing} of {signature['size']} bytes, the rest is in the local copy...",
+                   LogColor.CYAN)
+
+        work_timer = CoapTimer()
+        work_timer.reset()
+        patcher = DriveDeltaPatcher(local_file_path, local_file_path)
+        for operation, offset, length in operations:
+            if operation == COPY:
+                patcher.feed(DriveDelta.encode_copy(offset, length))
+            elif operation == DATA:
+                for start in range(offset, offset + length, DRIVE_DELTA_READ_SIZE):
+                    last = min(start + DRIVE_DELTA_READ_SIZE, offset + length) - 1
+                    data = self.read_range(file_name, start, last, block_size)
+                    if data is None or len(data) != last - start + 1:
+                        patcher.discard()
+                        return False
+                    patcher.feed(DriveDelta.encode_data(data))
+            else:
+                patcher.feed(DriveDelta.encode_end(offset, length))
+
+        # The remote file may have changed meanwhile
+        if not patcher.finished:
+            patcher.discard()
+            return False
+
+        logger.log(f"> Download finished in {work_timer.elapsed_time()}", LogColor.CYAN)
+        return True
+
+    def download_folder(self, folder_name, local_path, block_size=None):
+        """
+        Downloads a folder file by file: its manifest is read first, then its folders are created and its files
+        are downloaded over their own tokens, `parallelism` at once, so the server sends them from several workers
+        and the latency of the small files overlaps.
+
+        Args:
+            folder_name (str): The remote path of the folder to download.
+            local_path (str): The local folder, relative to the home folder, where the folder is saved.
+            block_size (int): The block size of the transfers, at most the one of the client.
+        """
+        manifest = self.__read(folder_name, DRIVE_MANIFEST_QUERY, block_size)
+        if manifest is None:
+            logger.log(f"> The folder {folder_name} cannot be listed.", LogColor.RED)
+            return
+        manifest = json.loads(manifest)
+
+        # Entries outside the folder are skipped
+        def inside(path):
+            return not os.path.isabs(path) and os.path.normpath(path).split(os.sep)[0] != ".."
+
+        folder_name = folder_name.rstrip("/")
+        folder_path = os.path.join(local_path, os.path.basename(folder_name))
+        files = [file["path"] for file in manifest["files"] if inside(file["path"])]
+
+        home = os.path.expanduser("~")
+        os.makedirs(os.path.join(home, folder_path), exist_ok=True)
+        for path in filter(inside, manifest["folders"]):
+            os.makedirs(os.path.join(home, folder_path, path), exist_ok=True)
+
+        logger.log(f"> Downloading {len(files)} files, {self.__parallelism} at once...", LogColor.CYAN)
+
+        work_timer = CoapTimer()
+        work_timer.reset()
+        with ThreadPoolExecutor(max_workers=self.__parallelism) as executor:
+            list(executor.map(
+                lambda path: self.download(f"{folder_name}/{path}", os.path.join(folder_path, os.path.dirname(path)),
+                                           block_size),
+                files
+            ))
+        logger.log(f"> Folder downloaded in {work_timer.elapsed_time()}", LogColor.CYAN)
+
+    def read_range(self, file_name, first_byte, last_byte=None, block_size=None):
+        """
+        Reads a byte range of a remote file, without saving it.
+
+        Args:
+            file_name (str): The remote path of the file.
+            first_byte (int): The first byte of the range; a negative value reads the last -first_byte bytes.
+            last_byte (int): The last byte of the range, included; None to read until the end of the file.
+            block_size (int): The block size of this transfer, at most the one of the client.
+
+        Returns:
+            bytes | None: The bytes of the range; None if the range could not be read.
+        """
+        if first_byte < 0:
+            return self.__read(file_name, f"bytes={first_byte}", block_size)
+        return self.__read(file_name, f"bytes={first_byte}-{'' if last_byte is None else last_byte}", block_size)
+
+    def read_blocks(self, file_name, first_block, last_block=None, block_size=None):
+        """
+        Reads a range of blocks of a remote file, without saving it.
+
+        Args:
+            file_name (str): The remote path of the file.
+            first_block (int): The first block of the range.
+            last_block (int): The last block of the range, included; None to read until the end of the file.
+            block_size (int): The block size of this transfer, at most the one of the client.
+
+        Returns:
+            bytes | None: The bytes of the blocks; None if the blocks could not be read.
+        """
+        return self.__read(file_name, f"blocks={first_block}-{'' if last_block is None else last_block}",
+                           block_size)
+
+    def __read(self, file_name, query, block_size=None):
+        """
+        Downloads a range of a remote file in memory and waits for the transfer to finish.
+
+        Args:
+            file_name (str): The remote path of the file.
+            query (str): The range, as sent in the Uri-Query option.
+            block_size (int): The block size of this transfer, at most the one of the client.
+
+        Returns:
+            bytes | None: The bytes of the range; None if the range could not be read.
+        """
+        return DriveAssembler().pop_read(self.__send_read(file_name, query, block_size))
+
+    def __send_read(self, file_name, query, block_size=None, etag=None):
+        """
+        Sends the request of a read in memory and waits for the transfer to finish.
+
+        Args:
+            file_name (str): The remote path of the file.
+            query (str): The range, as sent in the Uri-Query option.
+            block_size (int): The block size of this transfer, at most the one of the client.
+            etag (int): The ETag of the local copy of the file, if any; the read is answered 2.03 Valid instead
+                if the remote file is the same.
+
+        Returns:
+            CoapPacket: The read request, whose bytes are taken from the DriveAssembler.
+        """
+        coap_message = DriveTemplates.DOWNLOAD.value()
+        coap_message.options[CoapOptionDelta.LOCATION_PATH.value] = file_name
+        coap_message.options[CoapOptionDelta.URI_PATH.value] = "share_drive"
+        coap_message.options[CoapOptionDelta.URI_QUERY.value] = query
+        if etag is not None:
+            coap_message.options[CoapOptionDelta.ETAG.value] = etag
+        coap_message.skt = self._socket
+        coap_message.sender_ip_port = (self.__server_ip, int(self.__server_port))
+        self.__set_transfer_mode(coap_message, block_size)
+
+        # The token is set here, so the response is known as a read in memory from its first block
+        coap_message.token = gen_token()
+        DriveAssembler().read_in_memory(coap_message)
+        self._handle_internal_task(coap_message)
+
+        self.__wait_transfer(coap_message)
+        return coap_message
+
     def upload_file(self):
         """
         Initiates the process of uploading a file to the CoAP server.
@@ -120,17 +437,166 @@ class Client(CoapWorkerPool):
             style=self.__style
         ).ask()
 
+        # A file that is already on the server is updated with only the blocks that changed
+        self.upload(local_file_path, remote_path,
+                    delta=remote_path + os.path.basename(local_file_path) in DriveAssembler().get_files_list(),
+                    dedup=self.__dedup)
+
+    def upload(self, local_file_path, remote_path, block_size=None, delta=False, dedup=False):
+        """
+        Uploads a file to the CoAP server and waits for the transfer to finish.
+
+        Args:
+            local_file_path (str): The local path of the file, relative to the home folder.
+            remote_path (str): The remote folder where the file is saved.
+            block_size (int): The block size of this transfer, at most the one of the client.
+            delta (bool): Whether the file replaces its remote copy, sending only the blocks that changed;
+                the file is uploaded whole if the server has no copy of it.
+            dedup (bool): Whether a new file is uploaded as the chunks the server does not have; the file is
+                uploaded whole if the server keeps no index of its chunks.
+        """
+        # The path is made absolute, as the working directory is shared by the threads of the process
+        local_file_path = os.path.join(os.path.expanduser("~"), local_file_path)
+
+        # The delta is computed against the signature of the remote copy
+        signature = None
+        if delta and DriveUtilities.file_exists(local_file_path):
+            signature = DriveDelta.parse_signature(self.__read(remote_path + os.path.basename(local_file_path),
+                                                               DRIVE_DELTA_SIGNATURE_QUERY, block_size))
+        elif dedup and DriveUtilities.file_exists(local_file_path) and \
+                self.__upload_chunks(local_file_path, remote_path, block_size):
+            return
+
+        if signature is not None:
+            # The token is set here, so the sender finds the signature of the remote copy
+            coap_message = self.__make_upload(local_file_path, remote_path, block_size, DRIVE_DELTA_QUERY)
+            DriveSpliter().set_delta_signature(coap_message, signature)
+        else:
+            coap_message = self.__make_upload(local_file_path, remote_path, block_size)
+            if DriveUtilities.file_exists(local_file_path):
+                # The receiver continues a partial upload of the same file
+                coap_message.options[CoapOptionDelta.ETAG.value] = DriveETag().get(
+                    coap_message.options[CoapOptionDelta.LOCATION_PATH.value])
+
+        self._handle_internal_task(coap_message)
+
+        self.__wait_transfer(coap_message)
+
+    def __make_upload(self, local_file_path, remote_path, block_size=None, query=None):
+        """
+        Creates the request of an upload.
+
+        Args:
+            local_file_path (str): The local path of the file, relative to the home folder.
+            remote_path (str): The remote folder where the file is saved.
+            block_size (int): The block size of this transfer, at most the one of the client.
+            query (str): The Uri-Query option of the request, if any; the token is then set, so the sender can be
+                told what to send before the transfer starts.
+
+        Returns:
+            CoapPacket: The upload request.
+        """
         coap_message = DriveTemplates.UPLOAD.value()
-        coap_message.options[CoapOptionDelta.LOCATION_PATH.value] = local_file_path
+        coap_message.options[CoapOptionDelta.LOCATION_PATH.value] = os.path.join(os.path.expanduser("~"),
+                                                                                 local_file_path)
         coap_message.options[CoapOptionDelta.URI_PATH.value] = f"share_drive"
         coap_message.payload = {'upload_path': remote_path}
         coap_message.skt = self._socket
         coap_message.sender_ip_port = (self.__server_ip, int(self.__server_port))
         coap_message.needs_internal_computation = True
+        self.__set_transfer_mode(coap_message, block_size)
+
+        if query:
+            coap_message.options[CoapOptionDelta.URI_QUERY.value] = query
+            coap_message.token = gen_token()
+        return coap_message
+
+    def __upload_chunks(self, local_file_path, remote_path, block_size=None):
+        """
+        Uploads a file as the chunks the server does not have: the recipe of the file is uploaded first, then
+        the server answers which of its chunks it misses, and only those are sent whole.
+
+        Args:
+            local_file_path (str): The local path of the file, relative to the home folder.
+            remote_path (str): The remote folder where the file is saved.
+            block_size (int): The block size of this transfer, at most the one of the client.
+
+        Returns:
+            bool: False if the server keeps no index of its chunks, so nothing was uploaded.
+        """
+        with DriveFileReader(local_file_path, WINDOW_SIZE) as reader:
+            recipe = DriveChunker.get_recipe(reader)
 
+        coap_message = self.__make_upload(local_file_path, remote_path, block_size, DRIVE_CHUNK_RECIPE_QUERY)
+        DriveSpliter().set_content(coap_message, DriveChunker.encode_recipe(recipe))
         self._handle_internal_task(coap_message)
+        self.__wait_transfer(coap_message)
 
-        CoapTransactionPool().wait_util_finish(coap_message)
+        # The server finds the recipe by the token of its upload
+        missing = DriveChunker.parse_missing(self.__read(
+            remote_path + os.path.basename(local_file_path),
+            f"{DRIVE_CHUNK_MISSING_QUERY}={coap_message.token.hex()}", block_size))
+        if missing is None:
+            return False
+
+        coap_message = self.__make_upload(local_file_path, remote_path, block_size, DRIVE_CHUNK_QUERY)
+        DriveSpliter().set_chunk_upload(coap_message, recipe, missing)
+        self._handle_internal_task(coap_message)
+        self.__wait_transfer(coap_message)
+        return True
+
+    def __wait_transfer(self, coap_message):
+        """
+        Waits for a transfer to finish, keeping it in the transfers that can be canceled meanwhile.
+
+        Args:
+            coap_message (CoapPacket): The download or upload request.
+        """
+        with self.__transfers_lock:
+            self.__transfers[coap_message.token] = coap_message
+        try:
+            CoapTransactionPool().wait_util_finish(coap_message)
+        finally:
+            with self.__transfers_lock:
+                self.__transfers.pop(coap_message.token, None)
+
+    def get_transfers(self):
+        """
+        Gets the tokens of the transfers in progress.
+
+        Returns:
+            list: The tokens of the transfers.
+        """
+        with self.__transfers_lock:
+            return list(self.__transfers)
+
+    def cancel(self, token=None):
+        """
+        Cancels transfers in progress. The server is told with an empty RST carrying the token of the transfer,
+        so it stops sending or receiving the blocks right away; the progress of the partial file is kept,
+        so the transfer can be resumed.
+
+        Args:
+            token (bytes): The token of the transfer to cancel; None to cancel all the transfers.
+
+        Returns:
+            int: The number of canceled transfers.
+        """
+        with self.__transfers_lock:
+            transfers = [message for message in self.__transfers.values() if token in (None, message.token)]
+
+        for coap_message in transfers:
+            CoapTransactionPool().set_overall_transaction_failure(coap_message)
+            DriveAssembler().cancel(coap_message)
+
+            peer = coap_message.sender_ip_port
+            CoapTemplates.EMPTY_RST.value_with(
+                coap_message.token, CoapTransactionPool().next_message_id(peer), self._socket, peer
+            ).send()
+            CoapTransactionPool().finish_overall_transaction(coap_message)
+            logger.log(f"> Transfer {coap_message.token} canceled.", LogColor.YELLOW)
+
+        return len(transfers)
 
     def rename_file(self):
         """
@@ -273,9 +739,38 @@ def main():
     parser.add_argument('--client_address', '-ca', type=str, default='127.0.0.2', help='Client address')
     parser.add_argument('--client_port', '-cp', type=int, default=5683, help='Client port')
 
-    args = parser.parse_args()
+    # Transfer arguments
+    parser.add_argument('--pacing', '-p', action='store_true', help='Pace the outgoing blocks per peer')
+    parser.add_argument('--bandwidth_cap', '-bc', type=int, default=None, help='Pacing rate cap in bytes per second')
+    parser.add_argument('--q_block', '-qb', action='store_true', help='Transfer files with Q-Block NON bursts')
+    parser.add_argument('--fec', '-f', type=int, nargs=2, metavar=('K', 'M'), default=None,
+                        help='Send M parity blocks for every K blocks of a Q-Block transfer')
+    parser.add_argument('--block_size', '-bs', type=int, default=DRIVE_BLOCK_SIZE,
+                        help='Block size in bytes; above 1024 the local (non RFC) block size mode is used')
+    parser.add_argument('--compression', '-c', choices=sorted(DriveCompression.METHODS), default=None,
+                        help='Compress the blocks of the transfers that are worth it')
+    parser.add_argument('--compression_level', '-cl', type=int, default=6, choices=range(10), metavar='0-9',
+                        help='Compression level')
+    parser.add_argument('--parallelism', '-j', type=int, default=DRIVE_FOLDER_PARALLELISM,
+                        help='Files of a folder downloaded at once; 1 downloads a folder as one archive')
+    parser.add_argument('--dedup', '-d', action='store_true',
+                        help='Upload new files as the chunks the server does not have, if it keeps their index')
 
-    Client(args.server_address, args.server_port, args.client_address, args.client_port).listen()
+    args = parser.parse_args()
+    if args.fec and (not args.q_block or not 1 <= args.fec[1] <= args.fec[0] <= 255):
+        parser.error('--fec requires --q_block and 1 <= M <= K <= 255')
+    if not 16 <= args.block_size <= DRIVE_MAX_LOCAL_BLOCK_SIZE:
+        parser.error(f'--block_size must be between 16 and {DRIVE_MAX_LOCAL_BLOCK_SIZE}')
+    if args.parallelism < 1:
+        parser.error('--parallelism must be at least 1')
+
+    CoapTransactionPool().set_pacing(args.pacing, args.bandwidth_cap)
+    DriveSpliter().set_max_block_size(args.block_size)
+
+    Client(args.server_address, args.server_port, args.client_address, args.client_port, args.q_block,
+           args.fec, args.block_size, args.parallelism,
+           (DriveCompression.METHODS[args.compression], args.compression_level) if args.compression else None,
+           args.dedup).listen()
 
 
 if __name__ == "__main__":
@@ -5,7 +5,7 @@ from share_drive.share_drive_helpers.drive_assembler import DriveAssembler
 from share_drive.share_drive_helpers.drive_spliter import DriveSpliter
 from coap_core.coap_packet.coap_templates import CoapTemplates
 from coap_core.coap_utilities.coap_logger import logger
-from coap_core.coap_packet.coap_config import CoapCodeFormat, CoapOptionDelta
+from coap_core.coap_packet.coap_config import CoapCodeFormat, CoapOptionDelta, CoapType
 from coap_core.coap_packet.coap_packet import CoapPacket
 from coap_core.coap_resource.resource import Resource
 from coap_core.coap_transaction.coap_transaction_pool import CoapTransactionPool
@@ -90,7 +90,9 @@ class ClientResource(Resource):
             logger.debug("Invalid_PATH")
         else:
             while not CoapTransactionPool().is_transaction_finished(request):
-                pass
+                # The upload request may be rejected by the receiver
+                if CoapTransactionPool().is_overall_transaction_failed(request):
+                    return
             DriveSpliter().split_on_bytes_and_send(request, path)
 
     def handle_response(self, request: CoapPacket):
@@ -100,12 +102,20 @@ class ClientResource(Resource):
         Args:
             request (CoapPacket): The CoAP packet representing the response.
         """
-        os.chdir(self.get_path())
-        if request.code == CoapCodeFormat.SUCCESS_CONTENT.value():
+        if request.message_type == CoapType.RST.value:  # download canceled or rejected by the server
+            DriveAssembler().cancel(request)
+        elif request.code == CoapCodeFormat.SUCCESS_CONTENT.value():
             if CoapOptionDelta.LOCATION_PATH.value in request.options:
-                path = request.options[CoapOptionDelta.LOCATION_PATH.value]
+                path = os.path.join(self.get_path(), request.options[CoapOptionDelta.LOCATION_PATH.value])
                 DriveAssembler().handle_packets(request, path)
             else:
                 DriveAssembler().handle_paths(request)
+        elif request.code == CoapCodeFormat.SUCCESS_VALID.value():  # the local copy of the download is current
+            DriveAssembler().handle_valid(request)
+        elif request.code == CoapCodeFormat.SUCCESS_CONTINUE.value():
+            if isinstance(request.payload, dict) and "missing" in request.payload:  # missing blocks of an upload
+                DriveSpliter().handle_missing_blocks(request)
+            else:  # block where an upload resumes
+                DriveSpliter().handle_resume_point(request)
 
 
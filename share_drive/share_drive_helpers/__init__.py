@@ -0,0 +1,81 @@
+# Largest block size of the block options (SZX = 6) and of the local mode (LOCAL_BLOCK_SIZE option)
+DRIVE_BLOCK_SIZE = 1024
+DRIVE_MAX_LOCAL_BLOCK_SIZE = 65024
+
+DRIVE_Q_BLOCK_MIN_ROUND = 32
+DRIVE_Q_BLOCK_REPORT_DELAY = 0.05
+DRIVE_Q_BLOCK_MAX_REPORTED_RANGES = 32
+
+# Partial transfers keep their progress in a sidecar file next to the target, saved every few blocks
+DRIVE_RESUME_SUFFIX = ".resume"
+DRIVE_RESUME_SAVE_INTERVAL = 256
+
+# Consecutive blocks are written to the file in runs of up to this many bytes, synced to the disk before the
+# progress is saved, so the saved progress never runs ahead of the file
+DRIVE_WRITE_COALESCE_SIZE = 256 * 1024
+DRIVE_WRITE_SYNC = True
+
+# Size in bytes of the BLAKE2b digest that checks the bytes of every transfer
+DRIVE_CONTENT_HASH_SIZE = 16
+
+# Bytes of the upcoming blocks read ahead of the sender, by a thread of their own
+DRIVE_READ_AHEAD_SIZE = 1024 * 1024
+
+# The blocks of the files are read into buffers returned once the blocks are acknowledged, and this many bytes of
+# idle buffers are kept for the next blocks
+DRIVE_BUFFER_POOL_SIZE = 8 * 1024 * 1024
+
+# Archives of the folders sent by the server are cached on the disk, the least recently used ones being removed
+# above this many bytes
+DRIVE_ARCHIVE_CACHE_SIZE = 256 * 1024 * 1024
+
+# The files of a received archive are unpacked with this suffix, and replace the files of the folder only once
+# they are complete
+DRIVE_ARCHIVE_SUFFIX = ".part"
+
+# A folder is listed by a download asking for its manifest in the Uri-Query option; the client then downloads
+# its files over their own tokens, this many at once
+DRIVE_MANIFEST_QUERY = "manifest"
+DRIVE_FOLDER_PARALLELISM = 4
+
+# The blocks of files of these types are not compressed, nor are those of files whose first bytes do not shrink
+# by at least DRIVE_COMPRESSION_MIN_SAVING
+DRIVE_COMPRESSED_SUFFIXES = frozenset({
+    ".7z", ".avi", ".br", ".bz2", ".docx", ".flac", ".gif", ".gz", ".heic", ".jar", ".jpeg", ".jpg", ".lz4", ".mkv",
+    ".mov", ".mp3", ".mp4", ".ogg", ".pdf", ".png", ".pptx", ".rar", ".tgz", ".webm", ".webp", ".xlsx", ".xz",
+    ".zip", ".zst"
+})
+DRIVE_COMPRESSION_SAMPLE_SIZE = 64 * 1024
+DRIVE_COMPRESSION_MIN_SAVING = 0.1
+
+# A file that changed is sent as a delta against the copy of the receiver: the signature of the copy holds at most
+# DRIVE_DELTA_MAX_BLOCKS blocks, the new file is scanned byte by byte for the moved blocks over at most
+# DRIVE_DELTA_SLIDE_BUDGET bytes, and the bytes not found are sent in chunks of DRIVE_DELTA_DATA_SIZE bytes
+# (downloads fetch them with range reads of DRIVE_DELTA_READ_SIZE bytes)
+DRIVE_DELTA_SIGNATURE_QUERY = "signature"
+DRIVE_DELTA_QUERY = "delta"
+DRIVE_DELTA_SUFFIX = ".delta"
+DRIVE_DELTA_MAX_BLOCKS = 4096
+DRIVE_DELTA_MIN_BLOCK_SIZE = 1024
+DRIVE_DELTA_SLIDE_BUDGET = 4 * 1024 * 1024
+DRIVE_DELTA_DATA_SIZE = 64 * 1024
+DRIVE_DELTA_READ_SIZE = 4 * 1024 * 1024
+
+# The server may keep an index of the content-defined chunks of its files (between DRIVE_CHUNK_MIN_SIZE and
+# DRIVE_CHUNK_MAX_SIZE bytes, DRIVE_CHUNK_AVG_SIZE on average): an upload then sends the recipe of the file,
+# asks which chunks are missing, and sends only those
+DRIVE_CHUNK_RECIPE_QUERY = "recipe"
+DRIVE_CHUNK_MISSING_QUERY = "missing"
+DRIVE_CHUNK_QUERY = "chunks"
+DRIVE_CHUNK_SUFFIX = ".chunks"
+DRIVE_CHUNK_MIN_SIZE = 2048
+DRIVE_CHUNK_AVG_SIZE = 8192
+DRIVE_CHUNK_MAX_SIZE = 64 * 1024
+
+# The bytes of a finished read in memory (e.g. a recipe uploaded before its chunks) are dropped if they are not
+# taken within this many seconds
+DRIVE_READ_EXPIRY = 60
+
+# The ETag of a file is the BLAKE2b digest of its content, DRIVE_ETAG_SIZE bytes long (the most the ETag option
+# holds): a download carrying the ETag of the copy of the client is answered 2.03 Valid, without the file
+DRIVE_ETAG_SIZE = 8
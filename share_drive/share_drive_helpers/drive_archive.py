@@ -0,0 +1,349 @@
+import hashlib
+import os
+import stat
+import tarfile
+
+from share_drive.share_drive_helpers import DRIVE_RESUME_SUFFIX, DRIVE_ARCHIVE_SUFFIX
+from coap_core.coap_utilities.coap_logger import logger, LogColor
+
+TAR_BLOCK_SIZE = 512
+
+
+class DriveArchive:
+    """
+    DriveArchive streams a folder as a tar archive (POSIX pax format), block by block, without writing
+    the archive to the disk.
+
+    The folder is walked once before the transfer, so the exact size of the archive, and with it the number of
+    blocks, is known before the first block is sent. The content of the files is read only when their blocks
+    are generated; a file that shrinks meanwhile is padded with zeros, and one that grows is cut to the size it
+    had when the folder was walked, so the archive keeps its announced size.
+
+    Author: Damir Denis-Tudor
+    """
+
+    @staticmethod
+    def walk(folder: str) -> tuple[list[tuple[tarfile.TarInfo, bytes, str]], str]:
+        """
+        List the entries of a folder: its sub-folders and regular files, in the order of a top-down walk.
+
+        Parameters:
+        - folder (str): The path to the folder.
+
+        Returns:
+        - tuple: The entries, as (tar header info, encoded header, path) tuples, and the fingerprint of the tree,
+          a digest of the path, type, size, mode and modification time of every entry.
+        """
+        entries = []
+        fingerprint = hashlib.blake2b(digest_size=16)
+        for root, folders, files in os.walk(folder):
+            folders.sort()
+            for name in [*folders, *sorted(files)]:
+                path = os.path.join(root, name)
+                if name.endswith(DRIVE_RESUME_SUFFIX):
+                    continue
+
+                try:
+                    file_stat = os.lstat(path)
+                except OSError as e:
+                    logger.debug(f"Skipping '{path}': {e}")
+                    continue
+
+                info = tarfile.TarInfo(os.path.relpath(path, folder).replace(os.sep, "/"))
+                info.mtime = int(file_stat.st_mtime)
+                info.mode = stat.S_IMODE(file_stat.st_mode)
+                if stat.S_ISDIR(file_stat.st_mode):
+                    info.type = tarfile.DIRTYPE
+                elif stat.S_ISREG(file_stat.st_mode):
+                    info.type = tarfile.REGTYPE
+                    info.size = file_stat.st_size
+                else:
+                    continue
+
+                entries.append((info, info.tobuf(tarfile.PAX_FORMAT, "utf-8", "surrogateescape"), path))
+                fingerprint.update(f"{info.name}\0{info.type}\0{info.size}\0{info.mode}\0"
+                                   f"{file_stat.st_mtime_ns}\n".encode("utf-8", "surrogateescape"))
+        return entries, fingerprint.hexdigest()
+
+    @staticmethod
+    def get_size(entries: list) -> int:
+        """
+        Compute the size of the archive of a folder.
+
+        Parameters:
+        - entries (list): The entries of the folder, as listed by `walk`.
+
+        Returns:
+        - int: The size in bytes, the end-of-archive marker included.
+        """
+        size = 2 * TAR_BLOCK_SIZE
+        for info, header, path in entries:
+            size += len(header) + info.size + (-info.size % TAR_BLOCK_SIZE)
+        return size
+
+    @staticmethod
+    def split_on_packets(entries: list, block_size: int):
+        """
+        Generate the archive of a folder in blocks of the specified size.
+
+        Parameters:
+        - entries (list): The entries of the folder, as listed by `walk`.
+        - block_size (int): The size of each packet in bytes.
+
+        Yields:
+        - bytes: Blocks of the archive; only the last one may be shorter.
+        """
+        buffer = bytearray()
+        for info, header, path in entries:
+            buffer += header
+            if info.type == tarfile.REGTYPE:
+                remaining = info.size
+                try:
+                    with open(path, 'rb') as file:
+                        while remaining:
+                            chunk = file.read(min(remaining, max(block_size, 64 * 1024)))
+                            if not chunk:
+                                break
+                            buffer += chunk
+                            remaining -= len(chunk)
+
+                            while len(buffer) >= block_size:
+                                yield bytes(buffer[:block_size])
+                                del buffer[:block_size]
+                except OSError as e:
+                    logger.debug(f"Error reading '{path}': {e}")
+
+                if remaining:
+                    logger.log(f"> The file {path} changed while it was sent.", LogColor.YELLOW)
+                    buffer += bytes(remaining)
+                buffer += bytes(-info.size % TAR_BLOCK_SIZE)
+
+            while len(buffer) >= block_size:
+                yield bytes(buffer[:block_size])
+                del buffer[:block_size]
+
+        buffer += bytes(2 * TAR_BLOCK_SIZE)
+        for offset in range(0, len(buffer), block_size):
+            yield bytes(buffer[offset:offset + block_size])
+
+
+class DriveArchiveExtractor:
+    """
+    DriveArchiveExtractor unpacks a tar archive into a folder as its bytes arrive, in order, without keeping
+    the archive. Only folders and regular files are extracted; entries whose path leaves the folder are skipped.
+
+    Every file is written with the DRIVE_ARCHIVE_SUFFIX suffix and replaces the file of the folder only once its
+    entry is complete, so a failed transfer leaves the files that were there before untouched.
+
+    Author: Damir Denis-Tudor
+    """
+
+    def __init__(self, folder: str):
+        """
+        Constructor for DriveArchiveExtractor.
+
+        Parameters:
+        - folder (str): The folder where the archive is unpacked.
+        """
+        self.__folder = folder
+        self.__buffer = bytearray()
+
+        # The entry being read: its header info, the bytes of its data left, and the file it is written to
+        self.__info = None
+        self.__remaining = 0
+        self.__padding = 0
+        self.__file = None
+        self.__pax_headers = {}
+
+        # Files and folders that did not exist before, in order, so a failed transfer can remove them
+        self.__created = []
+
+        self.finished = False
+        self.failed = False
+
+        os.makedirs(folder, exist_ok=True)
+
+    def feed(self, data: bytes):
+        """
+        Unpack the next bytes of the archive.
+
+        Parameters:
+        - data (bytes): The bytes, following the ones fed before.
+        """
+        if self.finished or self.failed:
+            return
+
+        self.__buffer += data
+        try:
+            self.__process()
+        except (tarfile.TarError, ValueError, OSError) as e:
+            logger.log(f"> The archive of {self.__folder} cannot be unpacked: {e}", LogColor.RED)
+            self.failed = True
+            self.close()
+
+    def __process(self):
+        """
+        Consume the buffered bytes: headers, file data and paddings.
+        """
+        while True:
+            if self.__info is not None:
+                if not self.__consume_data():
+                    return
+                continue
+
+            if self.__padding:
+                skipped = min(self.__padding, len(self.__buffer))
+                del self.__buffer[:skipped]
+                self.__padding -= skipped
+                if self.__padding:
+                    return
+
+            if len(self.__buffer) < TAR_BLOCK_SIZE:
+                return
+
+            header = bytes(self.__buffer[:TAR_BLOCK_SIZE])
+            del self.__buffer[:TAR_BLOCK_SIZE]
+
+            # The end-of-archive marker
+            if header == bytes(TAR_BLOCK_SIZE):
+                self.finished = True
+                return
+
+            self.__start_entry(tarfile.TarInfo.frombuf(header, "utf-8", "surrogateescape"))
+
+    def __start_entry(self, info: tarfile.TarInfo):
+        """
+        Start the entry of a header: create its folder, or open its file.
+
+        Parameters:
+        - info (tarfile.TarInfo): The header of the entry.
+        """
+        # The extended header of the next entry (long names, large sizes)
+        if info.type in (tarfile.XHDTYPE, tarfile.XGLTYPE):
+            self.__info, self.__remaining = info, info.size
+            self.__padding = -info.size % TAR_BLOCK_SIZE
+            return
+
+        path = self.__pax_headers.pop("path", info.name)
+        if "size" in self.__pax_headers:
+            info.size = int(self.__pax_headers.pop("size"))
+        self.__pax_headers.clear()
+
+        relative_path = os.path.normpath(path)
+        safe = not os.path.isabs(relative_path) and relative_path.split(os.sep)[0] not in ("..", ".")
+        target = os.path.join(self.__folder, relative_path)
+
+        if info.type == tarfile.DIRTYPE:
+            if safe:
+                self.__make_folders(target)
+            return
+
+        if info.type in (tarfile.REGTYPE, tarfile.AREGTYPE) and safe:
+            self.__make_folders(os.path.dirname(target))
+            self.__file = open(target + DRIVE_ARCHIVE_SUFFIX, 'wb')
+        else:
+            logger.debug(f"Skipping the archive entry '{path}'")
+
+        self.__info, self.__remaining = info, info.size
+        self.__padding = -info.size % TAR_BLOCK_SIZE
+        if not self.__remaining:
+            self.__finish_entry()
+
+    def __make_folders(self, path: str):
+        """
+        Create a folder and its missing parents, remembering the ones created.
+
+        Parameters:
+        - path (str): The path of the folder.
+        """
+        missing = []
+        while not os.path.isdir(path):
+            missing.append(path)
+            path = os.path.dirname(path)
+
+        for folder in reversed(missing):
+            os.mkdir(folder)
+            self.__created.append(folder)
+
+    def __consume_data(self) -> bool:
+        """
+        Write the buffered data of the current entry to its file.
+
+        Returns:
+        - bool: True if the entry is complete, False if more bytes are needed.
+        """
+        length = min(self.__remaining, len(self.__buffer))
+        if self.__info.type in (tarfile.XHDTYPE, tarfile.XGLTYPE):
+            # The extended header is kept whole until it is parsed
+            if length < self.__remaining:
+                return False
+            self.__parse_pax_headers(bytes(self.__buffer[:length]))
+        elif self.__file:
+            with memoryview(self.__buffer) as view:
+                self.__file.write(view[:length])
+        del self.__buffer[:length]
+        self.__remaining -= length
+
+        if self.__remaining:
+            return False
+        self.__finish_entry()
+        return True
+
+    def __finish_entry(self):
+        """
+        Close the file of the current entry, with the modification time of the archived file, and move it
+        in place of the file of the folder.
+        """
+        if self.__file:
+            self.__file.close()
+            os.utime(self.__file.name, (self.__info.mtime, self.__info.mtime))
+            os.chmod(self.__file.name, self.__info.mode)
+
+            target = self.__file.name[:-len(DRIVE_ARCHIVE_SUFFIX)]
+            if not os.path.lexists(target):
+                self.__created.append(target)
+            os.replace(self.__file.name, target)
+            self.__file = None
+        self.__info = None
+
+    def __parse_pax_headers(self, data: bytes):
+        """
+        Parse the records of an extended header ("length key=value\\n").
+
+        Parameters:
+        - data (bytes): The content of the extended header.
+        """
+        position = 0
+        while position < len(data):
+            space = data.index(b" ", position)
+            length = int(data[position:space])
+            key, _, value = data[space + 1:position + length - 1].partition(b"=")
+            if self.__info.type == tarfile.XHDTYPE:
+                self.__pax_headers[key.decode("utf-8")] = value.decode("utf-8", "surrogateescape")
+            position += length
+
+    def close(self):
+        """
+        Close and remove the file being written, if any, as its entry is incomplete.
+        """
+        if self.__file:
+            self.__file.close()
+            try:
+                os.remove(self.__file.name)
+            except OSError as e:
+                logger.debug(f"Error removing '{self.__file.name}': {e}")
+            self.__file = None
+
+    def discard(self):
+        """
+        Remove the files and folders unpacked so far that did not exist before.
+        """
+        self.close()
+        for path in reversed(self.__created):
+            try:
+                if os.path.isdir(path):
+                    os.rmdir(path)
+                else:
+                    os.remove(path)
+            except OSError as e:
+                logger.debug(f"Error removing '{path}': {e}")
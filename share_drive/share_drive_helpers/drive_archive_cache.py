@@ -0,0 +1,164 @@
+import os
+import threading
+
+from coap_core.coap_utilities.coap_logger import logger
+from coap_core.coap_utilities.coap_singleton import CoapSingletonBase
+from share_drive.share_drive_helpers import DRIVE_ARCHIVE_CACHE_SIZE
+from share_drive.share_drive_helpers.drive_archive import DriveArchive
+
+
+class DriveArchiveCache(CoapSingletonBase):
+    """
+    DriveArchiveCache keeps the archives of the folders that were sent, so a folder that did not change is sent
+    again from its cached archive instead of being archived again.
+
+    Every archive is a `<fingerprint>.tar` file of the cache folder, the fingerprint being the one of the tree
+    (see DriveArchive.walk): a folder that changed has another fingerprint, so its outdated archive is never
+    sent again, and is removed in time. The archive is written while its blocks are sent the first time,
+    and kept only if it was generated whole and the tree did not change meanwhile.
+
+    The cache lives on the disk, so it is shared by the processes of all the clients. The archives are kept
+    in least recently used order (their modification time), and the oldest are removed once the cache is
+    larger than its size limit. The cache is disabled until its folder is set.
+
+    Author: Damir Denis-Tudor
+    """
+
+    def __init__(self):
+        """
+        Constructor for DriveArchiveCache.
+        """
+        self.__path = None
+        self.__max_size = DRIVE_ARCHIVE_CACHE_SIZE
+        self.__lock = threading.Lock()
+
+    def set_cache(self, path: str, max_size: int = DRIVE_ARCHIVE_CACHE_SIZE):
+        """
+        Enable the cache in a folder.
+
+        Parameters:
+        - path (str): The folder of the cached archives, created if it does not exist.
+        - max_size (int): The size limit of the cache in bytes; 0 disables the cache.
+        """
+        if max_size <= 0:
+            self.__path = None
+            return
+
+        os.makedirs(path, exist_ok=True)
+        self.__path = path
+        self.__max_size = max_size
+
+    def __archive_path(self, fingerprint: str) -> str:
+        return os.path.join(self.__path, f"{fingerprint}.tar")
+
+    def get(self, fingerprint: str) -> str | None:
+        """
+        Get the cached archive of a tree, marking it as the most recently used.
+
+        Parameters:
+        - fingerprint (str): The fingerprint of the tree.
+
+        Returns:
+        - str | None: The path of the archive; None if it is not cached.
+        """
+        if self.__path is None:
+            return None
+
+        path = self.__archive_path(fingerprint)
+        try:
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+
+    def cache_blocks(self, fingerprint: str, folder: str, generator, size: int):
+        """
+        Cache the archive of a tree while its blocks are generated.
+
+        Parameters:
+        - fingerprint (str): The fingerprint of the tree.
+        - folder (str): The path of the folder, walked again to check that it did not change.
+        - generator: The generator of the archive blocks.
+        - size (int): The size of the archive in bytes.
+
+        Returns:
+        - generator: The generator of the archive blocks, writing them to the cache as they are read;
+          the same generator if the archive is not cached.
+        """
+        if self.__path is None or size > self.__max_size:
+            return generator
+
+        # Every transfer writes its own temporary file, moved into the cache only when it is complete
+        temporary = f"{self.__archive_path(fingerprint)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            file = open(temporary, 'wb')
+        except OSError as e:
+            logger.debug(f"Error caching the archive of '{folder}': {e}")
+            return generator
+        return self.__write_through(fingerprint, folder, generator, size, file)
+
+    def __write_through(self, fingerprint: str, folder: str, generator, size: int, file):
+        """
+        Write the archive blocks to a temporary file as they are read.
+
+        Parameters:
+        - fingerprint (str): The fingerprint of the tree.
+        - folder (str): The path of the folder.
+        - generator: The generator of the archive blocks.
+        - size (int): The size of the archive in bytes.
+        - file: The temporary file.
+
+        Yields:
+        - bytes: The blocks of the archive.
+        """
+        written = 0
+        try:
+            for payload in generator:
+                if file:
+                    try:
+                        file.write(payload)
+                        written += len(payload)
+                    except OSError as e:
+                        logger.debug(f"Error caching the archive of '{folder}': {e}")
+                        file.close()
+                        file = None
+                yield payload
+
+            if file:
+                file.close()
+                if written == size and DriveArchive.walk(folder)[1] == fingerprint:
+                    os.replace(file.name, self.__archive_path(fingerprint))
+                    logger.debug(f"Archive of '{folder}' cached as {fingerprint}")
+                    self.__evict()
+        finally:
+            generator.close()
+            if file:
+                file.close()
+                if os.path.exists(file.name):
+                    os.remove(file.name)
+
+    def __evict(self):
+        """
+        Remove the least recently used archives until the cache fits its size limit.
+        """
+        with self.__lock:
+            archives = []
+            try:
+                for entry in os.scandir(self.__path):
+                    if entry.name.endswith(".tar"):
+                        stat = entry.stat()
+                        archives.append((stat.st_mtime, stat.st_size, entry.path))
+            except OSError as e:
+                logger.debug(f"Error listing the archive cache: {e}")
+                return
+
+            total_size = sum(size for _, size, _ in archives)
+            for _, size, path in sorted(archives):
+                if total_size <= self.__max_size:
+                    break
+                try:
+                    os.remove(path)
+                    logger.debug(f"Archive {os.path.basename(path)} removed from the cache")
+                except OSError:
+                    pass
+                total_size -= size
@@ -1,8 +1,22 @@
+import hashlib
 import os
 import threading
-
+import time
+
+from share_drive.share_drive_helpers import DRIVE_Q_BLOCK_REPORT_DELAY, DRIVE_Q_BLOCK_MAX_REPORTED_RANGES, \
+    DRIVE_RESUME_SAVE_INTERVAL, DRIVE_WRITE_COALESCE_SIZE, DRIVE_WRITE_SYNC, DRIVE_CONTENT_HASH_SIZE, \
+    DRIVE_READ_EXPIRY
+from share_drive.share_drive_helpers.drive_archive import DriveArchiveExtractor
+from share_drive.share_drive_helpers.drive_chunks import DriveChunkWriter, DriveChunkStore
+from share_drive.share_drive_helpers.drive_compression import DriveCompression
+from share_drive.share_drive_helpers.drive_delta import DriveDeltaPatcher
+from share_drive.share_drive_helpers.drive_etag import DriveETag
+from share_drive.share_drive_helpers.drive_fec import DriveFec
+from share_drive.share_drive_helpers.drive_resume import DriveResume
+from share_drive.share_drive_helpers.drive_spliter import DriveSpliter
+from share_drive.share_drive_helpers.drive_templates import DriveTemplates
 from share_drive.share_drive_helpers.drive_utils import DriveUtilities
-from coap_core.coap_packet.coap_config import CoapOptionDelta
+from coap_core.coap_packet.coap_config import CoapOptionDelta, CoapType, CoapContentFormat
 from coap_core.coap_packet.coap_packet import CoapPacket
 from coap_core.coap_transaction.coap_transaction_pool import CoapTransactionPool
 from coap_core.coap_utilities.coap_logger import logger, LogColor
@@ -16,6 +30,45 @@ class DriveAssembler(CoapSingletonBase):
     It manages both file operations and path responses during the communication process.
     Its main usage is within the share_drive context.
 
+    For Q-Block transfers, every CON block closes a round of NON blocks: the assembler answers it
+    with the list of blocks that are still missing up to that block. When the transfer carries parity blocks,
+    the missing blocks that can be rebuilt from them are stored without waiting for the sender.
+
+    The progress of every transfer is saved next to the file (see DriveResume). The first block sent carries
+    the total number of blocks and the ETag of the file: if it continues the saved progress, the blocks are
+    kept in the partial file; otherwise the file is written from the start. Until that block arrives,
+    the received blocks are only kept in memory.
+
+    The file is opened once per transfer and preallocated to its number of blocks. Every block is written at its
+    offset, so blocks received out of order are not kept in memory; consecutive blocks are gathered and written
+    in runs of up to DRIVE_WRITE_COALESCE_SIZE bytes. The file is truncated to its exact size at the end.
+
+    The blocks are hashed in order as the transfer moves past them, and the digest is checked at the end against
+    the CONTENT_HASH option of the last block: a file that does not match is deleted and the transfer fails.
+    A block written out of order is read back when it is hashed, while it is still in the page cache.
+
+    Range reads are assembled in memory instead of a file, and their bytes are taken with `pop_read`.
+
+    The blocks of a transfer marked with the COMPRESSION option are decoded as they arrive (see DriveCompression);
+    the parity blocks cover the blocks as they were sent, so the rebuilt blocks are decoded too.
+
+    Folders arrive as a tar archive (content format APPLICATION_TAR), unpacked by a DriveArchiveExtractor as the
+    transfer moves past the blocks, so the archive is never stored; their blocks are kept in memory until all the
+    blocks before them are received, like the blocks of a read in memory.
+
+    Files sent as a delta against the copy of this side (content format APPLICATION_DELTA) are rebuilt the same
+    way, by a DriveDeltaPatcher fed with the blocks in order: the copy is replaced only once the rebuilt file
+    matches the digest of the delta. So are the files uploaded as chunks (content format APPLICATION_CHUNKS), by
+    a DriveChunkWriter that copies the chunks the server already has.
+
+    A download carrying the ETag of the copy of this side may be answered 2.03 Valid instead: its session is closed
+    without touching the copy. A file received whole keeps the ETag of its first block (see DriveETag), as its
+    bytes were checked against their digest.
+
+    Every transfer is assembled in its own session, keyed by the peer and the token of the transfer: the session
+    holds the destination folder, the timer and the lock of the transfer, so many downloads and uploads are
+    assembled at once. The global lock only guards the table of sessions.
+
     Author: Damir Denis-Tudor
     """
 
@@ -28,37 +81,194 @@ class DriveAssembler(CoapSingletonBase):
         """
         self.__transaction_pool = CoapTransactionPool()
 
-        # Dictionary to store in-progress file assembly
+        # Assembly sessions of the transfers in progress, by (peer, token)
         self.__in_assembly: dict[tuple, dict] = {}
 
         # List to store assembled operations
         self.__assembled: list[tuple] = []
 
-        self.__work_timer = CoapTimer()
+        # Bytes of the finished reads in memory, with the time they finished, until they are taken or expire
+        self.__reads: dict[tuple, tuple[bytes, float]] = {}
+
+        # Downloads answered 2.03 Valid, until they are checked
+        self.__validated: set[tuple] = set()
+
         self.__lock = threading.Lock()
 
         # Dictionary to store content details (folders and files)
         self.__content_dict = {"folder": [], "file": []}
 
-        self.__save_path = None
+    @staticmethod
+    def __new_session(save_path: str | None, in_memory: bool) -> dict:
+        """
+        Create the assembly state of a transfer.
+
+        Parameters:
+        - save_path (str | None): The folder where the file is saved; None to save it at the path given by the
+          resource handling its blocks.
+        - in_memory (bool): Whether the transfer is assembled in memory instead of a file.
 
-    def set_save_path(self, path: str, home_root=True):
+        Returns:
+        - dict: The assembly state.
         """
-        Set the save path for downloaded files.
+        timer = CoapTimer()
+        timer.reset()
+        return {
+            "SAVE_PATH": save_path,
+            "PATH": None,
+            "LOCK": threading.Lock(),
+            "TIMER": timer,
+            "CLOSED": False,
+            "TOTAL_RESPONSES": -1,
+            "WRITE_INDEX": None,
+            "RECEIVED_PACKETS": {},
+            "TOTAL_PACKETS": -1,
+            "FEC_BLOCKS": {},
+            "FEC_PARITY": {},
+            "FEC_COMPLETED": set(),
+            "BUFFER": bytearray() if in_memory else None,
+            "RESUME": None,
+            "FD": None,
+            "BLOCK_SIZE": None,
+            "RUN_START": None,
+            "RUN_BUFFER": bytearray(),
+            "END": None,
+            "CONTENT_HASH": hashlib.blake2b(digest_size=DRIVE_CONTENT_HASH_SIZE),
+            "EXPECTED_HASH": None,
+            "STREAM": None,
+            "COMPRESSED": False
+        }
+
+    def open_session(self, request: CoapPacket, path: str):
+        """
+        Open the assembly session of a transfer, saving its file in a given folder.
 
         Parameters:
-        - path (str): The base path for saving files.
-        - home_root (bool): Whether to use the home directory as the root for saving files.
+        - request (CoapPacket): The request of the transfer, with its token already set.
+        - path (str): The folder for saving the file, absolute or relative to the home directory; if it does not
+          exist, the file is saved at the path given by the resource handling its blocks.
         """
-        if DriveUtilities.folder_exists(path):
-            print(home_root)
-            if home_root:
-                self.__save_path = f"{os.path.expanduser('~')}/{path}/"
-            else:
-                self.__save_path = f"{path}/"
+        # The working directory is shared by the threads of the process, so it is never used
+        save_path = os.path.join(os.path.expanduser('~'), path, "")
+        if not DriveUtilities.folder_exists(save_path):
+            save_path = None
+
+        with self.__lock:
+            self.__in_assembly[request.general_work_id()] = self.__new_session(save_path, False)
+
+    def read_in_memory(self, request: CoapPacket):
+        """
+        Assemble the response of a download request in memory instead of a file.
+
+        Parameters:
+        - request (CoapPacket): The download request, with its token already set.
+        """
+        with self.__lock:
+            self.__in_assembly[request.general_work_id()] = self.__new_session(None, True)
+
+    def pop_read(self, request: CoapPacket) -> bytes | None:
+        """
+        Take the bytes of a finished read in memory.
+
+        Parameters:
+        - request (CoapPacket): The download request.
+
+        Returns:
+        - bytes | None: The bytes of the response; None if the read did not finish.
+        """
+        with self.__lock:
+            read = self.__reads.pop(request.general_work_id(), None)
+        return read and read[0]
+
+    def handle_valid(self, response: CoapPacket):
+        """
+        Close the session of a download answered 2.03 Valid: the copy of the client did not change, so nothing is
+        sent and its file is kept as it is.
+
+        Parameters:
+        - response (CoapPacket): The 2.03 Valid response.
+        """
+        with self.__lock:
+            operation_dict = self.__in_assembly.pop(response.general_work_id(), None)
+            if operation_dict:
+                self.__validated.add(response.general_work_id())
+
+        if operation_dict:
+            with operation_dict["LOCK"]:
+                operation_dict["CLOSED"] = True
+            logger.debug(f"<{response.token}> Validated in {operation_dict['TIMER'].elapsed_time()}", LogColor.CYAN)
+        self.__transaction_pool.finish_overall_transaction(response)
+
+    def pop_valid(self, request: CoapPacket) -> bool:
+        """
+        Check if a download was answered 2.03 Valid.
 
-    def reset_save_path(self):
-        self.__save_path = None
+        Parameters:
+        - request (CoapPacket): The download request.
+
+        Returns:
+        - bool: True if the copy of the client did not change.
+        """
+        with self.__lock:
+            if request.general_work_id() not in self.__validated:
+                return False
+            self.__validated.remove(request.general_work_id())
+            return True
+
+    def cancel(self, packet: CoapPacket):
+        """
+        Drop the assembly of a transfer that was canceled or failed. The progress already saved next to
+        the file is kept, so the transfer can be resumed; the entries of a folder unpacked so far are removed.
+
+        Parameters:
+        - packet (CoapPacket): A CoAP packet of the transfer.
+        """
+        with self.__lock:
+            operation_dict = self.__in_assembly.pop(packet.general_work_id(), None)
+            self.__reads.pop(packet.general_work_id(), None)
+
+        if operation_dict:
+            with operation_dict["LOCK"]:
+                operation_dict["CLOSED"] = True
+                if operation_dict["FD"] is not None:
+                    # The blocks received so far are kept for a later resume
+                    self.__save_progress(operation_dict)
+                    os.close(operation_dict["FD"])
+                    operation_dict["FD"] = None
+                if operation_dict["STREAM"] is not None:
+                    # A folder or a delta is sent again from the start, what was unpacked or rebuilt is removed
+                    operation_dict["STREAM"].discard()
+            logger.debug(f"<{packet.token}> Assembly dropped with {len(operation_dict['RECEIVED_PACKETS'])} "
+                         f"blocks not written.", LogColor.YELLOW)
+
+    def __close_session(self, packet: CoapPacket, operation_dict: dict):
+        """
+        Close the assembly session of a finished transfer, keeping the bytes of a read in memory.
+
+        Parameters:
+        - packet (CoapPacket): A CoAP packet of the transfer.
+        - operation_dict (dict): The assembly state of the transfer, whose lock is held.
+        """
+        operation_dict["CLOSED"] = True
+        if operation_dict["FD"] is not None:
+            os.close(operation_dict["FD"])
+            operation_dict["FD"] = None
+        if operation_dict["STREAM"] is not None:
+            operation_dict["STREAM"].close()
+
+        with self.__lock:
+            if self.__in_assembly.get(packet.general_work_id()) is operation_dict:
+                del self.__in_assembly[packet.general_work_id()]
+            self.__assembled.append(packet.general_work_id())
+
+            if operation_dict["BUFFER"] is not None:
+                # The reads nobody took (e.g. the recipe of an upload that never asked for the missing chunks)
+                # are dropped
+                now = time.monotonic()
+                for work_id in [work_id for work_id, read in self.__reads.items()
+                                if now - read[1] > DRIVE_READ_EXPIRY]:
+                    del self.__reads[work_id]
+                self.__reads[packet.general_work_id()] = (bytes(operation_dict["BUFFER"]), now)
 
     def handle_paths(self, response: CoapPacket):
         """
@@ -85,77 +295,571 @@ class DriveAssembler(CoapSingletonBase):
 
         Parameters:
         - packet (CoapPacket): The CoAP packet containing file content.
-        - path (str): The path for saving the file.
+        - path (str): The absolute path of the file, used if its session has no folder (the transfer was not
+          opened by this side, or its folder does not exist).
         """
+        # Decode the block-related options from the CoAP packet
+        option = CoapPacket.decode_option_block(packet.options[packet.get_option_code()])
+        num = packet.get_block_id()
+
+        # Transfers that were not opened by a request of this side are saved at the given path
         with self.__lock:
-            # Decode the block-related options from the CoAP packet
-            option = CoapPacket.decode_option_block(packet.options[packet.get_option_code()])
-
-            # Register file operation-related packets
-            if packet.general_work_id() not in self.__in_assembly:
-                self.__in_assembly[packet.general_work_id()] = {
-                    "TOTAL_RESPONSES": -1,
-                    "WRITE_INDEX": 0,
-                    "RECEIVED_PACKETS": {}
-                }
-                self.__work_timer.reset()
-
-                # If the file already exists, delete it before downloading
-                if DriveUtilities.file_exists(path):
-                    DriveUtilities.delete_file(path)
-
-            # Log download progress
-            if packet.get_block_id() == 0:
-                logger.log(f"> Downloading {packet.options[packet.get_size_code()]} packets...", LogColor.CYAN)
-
-            operation_dict = self.__in_assembly[packet.general_work_id()]
-
-            # Register the total number of responses if not already set
-            if not option["M"]:
-                operation_dict["TOTAL_RESPONSES"] = option["NUM"]
-
-            # Process received packets and write to the file
-            if operation_dict["WRITE_INDEX"] == option["NUM"]:
-                operation_dict["RECEIVED_PACKETS"][option["NUM"]] = packet.payload
-                index = operation_dict["WRITE_INDEX"]
-
-                while operation_dict["WRITE_INDEX"] + 1 in operation_dict["RECEIVED_PACKETS"]:
-                    operation_dict["WRITE_INDEX"] += 1
-
-                # Set the full path for saving the file
-                if self.__save_path:
-                    path = self.__save_path + packet.options[CoapOptionDelta.LOCATION_PATH.value]
-
-                # Write received packets to the file
-                for i in range(index, operation_dict["WRITE_INDEX"] + 1):
-                    with open(path, 'ab') as file:
-                        file.write(operation_dict["RECEIVED_PACKETS"][i])
-                        operation_dict["RECEIVED_PACKETS"].pop(i)
-                operation_dict["WRITE_INDEX"] += 1
+            operation_dict = self.__in_assembly.get(packet.general_work_id())
+            if not operation_dict:
+                operation_dict = self.__in_assembly[packet.general_work_id()] = self.__new_session(None, False)
+
+        with operation_dict["LOCK"]:
+            if operation_dict["CLOSED"]:
+                return
+
+            # Set the full path for saving the file, and load the progress saved by an interrupted transfer
+            if operation_dict["PATH"] is None:
+                operation_dict["PATH"] = path
+                if operation_dict["SAVE_PATH"]:
+                    operation_dict["PATH"] = operation_dict["SAVE_PATH"] + \
+                                             packet.options[CoapOptionDelta.LOCATION_PATH.value]
+                content_format = packet.options.get(CoapOptionDelta.CONTENT_FORMAT.value)
+                if content_format == CoapContentFormat.APPLICATION_TAR.value:
+                    operation_dict["STREAM"] = DriveArchiveExtractor(operation_dict["PATH"])
+                elif content_format == CoapContentFormat.APPLICATION_DELTA.value:
+                    operation_dict["STREAM"] = DriveDeltaPatcher(operation_dict["PATH"], operation_dict["PATH"])
+                elif content_format == CoapContentFormat.APPLICATION_CHUNKS.value:
+                    operation_dict["STREAM"] = DriveChunkWriter(operation_dict["PATH"])
+                elif operation_dict["BUFFER"] is None:
+                    operation_dict["RESUME"] = DriveResume.load(operation_dict["PATH"])
+            path = operation_dict["PATH"]
+
+            if CoapOptionDelta.CONTENT_HASH.value in packet.options:
+                operation_dict["EXPECTED_HASH"] = packet.options[CoapOptionDelta.CONTENT_HASH.value]
+            if CoapOptionDelta.COMPRESSION.value in packet.options:
+                operation_dict["COMPRESSED"] = True
+
+            if CoapOptionDelta.FEC_PARITY.value in packet.options:
+                recovered = self.__store_parity(operation_dict, packet, num)
             else:
-                operation_dict["RECEIVED_PACKETS"][option["NUM"]] = packet.payload
+                # The first block sent tells where the file starts
+                if packet.get_size_code() in packet.options and operation_dict["WRITE_INDEX"] is None:
+                    if not self.__start_file(operation_dict, packet, num, path):
+                        logger.log(f"> The partial file {path} cannot be resumed, try again.", LogColor.YELLOW)
+                        self.__close_session(packet, operation_dict)
+                        self.__transaction_pool.set_overall_transaction_failure(packet)
+                        self.__transaction_pool.finish_overall_transaction(packet)
+                        return
+
+                # Register the total number of responses if not already set
+                if not option["M"]:
+                    operation_dict["TOTAL_RESPONSES"] = num
+
+                decoded = self.__decode(operation_dict, packet.payload, packet)
+                stored = self.__store_block(operation_dict, num, decoded, path)
+                recovered = self.__store_fec_block(operation_dict, packet, num) \
+                    if stored and CoapOptionDelta.FEC.value in packet.options else []
+
+            # Blocks rebuilt from the parity blocks are stored as if they were received
+            for recovered_num, payload in recovered:
+                logger.debug(f"<{packet.token}> Block {recovered_num} rebuilt from parity.")
+                if recovered_num + 1 == operation_dict["TOTAL_PACKETS"]:
+                    operation_dict["TOTAL_RESPONSES"] = recovered_num
+                decoded = self.__decode(operation_dict, payload, packet)
+                self.__store_block(operation_dict, recovered_num, decoded, path)
 
             # Finish the overall transaction when all packets are received
-            if operation_dict["TOTAL_RESPONSES"] != -1:
+            if operation_dict["TOTAL_RESPONSES"] != -1 and operation_dict["WRITE_INDEX"] is not None:
                 if operation_dict["WRITE_INDEX"] - 1 == operation_dict["TOTAL_RESPONSES"]:
 
+                    if not self.__check_content_hash(operation_dict, packet) \
+                            or not self.__check_stream(operation_dict, packet):
+                        return
+
                     # Cleanup and finish the transaction
-                    del self.__in_assembly[packet.general_work_id()]
-                    self.__assembled.append(packet.general_work_id())
-                    self.__transaction_pool.finish_overall_transaction(packet)
-
-                    # If the file has a ".zip" extension, unzip it and delete the original compressed file
-                    if path.__contains__(".zip"):
-                        logger.debug(f"<{packet.token}> Unzipping the folder: {path}")
-                        logger.log(f"> Unzipping the folder: {path}")
-                        DriveUtilities.decompress_folder(path)
-                        DriveUtilities.delete_file(path)
-                    self.__save_path = None
-
-                    # Log completion time
-                    logger.log(f"> Download finished in {self.__work_timer.elapsed_time()}", LogColor.CYAN)
-                    logger.debug(f"<{packet.token}> Request finished in {self.__work_timer.elapsed_time()}",
-                                 LogColor.CYAN)
+                    if operation_dict["FD"] is not None:
+                        self.__finish_file(operation_dict)
+                    self.__close_session(packet, operation_dict)
+                    work_timer = operation_dict["TIMER"]
+
+                    # The last round of a read is answered too, so its sender finishes
+                    if operation_dict["BUFFER"] is not None:
+                        self.__transaction_pool.finish_overall_transaction(packet)
+                        logger.debug(f"<{packet.token}> Read finished in {work_timer.elapsed_time()}",
+                                     LogColor.CYAN)
+                    else:
+                        if operation_dict["STREAM"] is None:
+                            DriveResume.discard(path)
+                            # The bytes were checked against their digest, so the file keeps the ETag it was sent with
+                            if operation_dict["RESUME"]["etag"]:
+                                DriveETag().put(path, operation_dict["RESUME"]["etag"])
+
+                        # The chunks of the written file (or folder) are indexed for the next uploads; a file
+                        # rebuilt from chunks indexed itself
+                        if not isinstance(operation_dict["STREAM"], DriveChunkWriter):
+                            DriveChunkStore().index_later(path)
+                        self.__transaction_pool.finish_overall_transaction(packet)
+
+                        # Log completion time
+                        logger.log(f"> Download finished in {work_timer.elapsed_time()}", LogColor.CYAN)
+                        logger.debug(f"<{packet.token}> Request finished in {work_timer.elapsed_time()}",
+                                     LogColor.CYAN)
+
+        # The CON blocks of a Q-Block transfer close a round and must be answered with the missing blocks
+        if packet.message_type == CoapType.CON.value and packet.is_q_block():
+            self.__report_missing_blocks(packet, num)
+
+    @staticmethod
+    def __decode(operation_dict: dict, payload: bytes, packet: CoapPacket) -> bytes:
+        """
+        Decode a block of a compressed transfer; the blocks of other transfers are kept as they are.
+        A block that cannot be decoded, or that decodes to more than a block, is stored empty, and the transfer
+        fails its integrity check.
+
+        Parameters:
+        - operation_dict (dict): The assembly state of the file.
+        - payload (bytes): The block as it was sent.
+        - packet (CoapPacket): A CoAP packet of the transfer, with its block size.
+
+        Returns:
+        - bytes: The block content.
+        """
+        if not operation_dict["COMPRESSED"]:
+            return payload
+
+        decoded = DriveCompression.decompress(payload, DriveSpliter.get_requested_block_size(packet))
+        return b"" if decoded is None else decoded
+
+    @staticmethod
+    def __start_file(operation_dict: dict, packet: CoapPacket, num: int, path: str) -> bool:
+        """
+        Prepare the file for the first block sent: keep the blocks of a partial file that are continued,
+        or start the file over. The file is opened for the whole transfer and preallocated.
+
+        Parameters:
+        - operation_dict (dict): The assembly state of the file.
+        - packet (CoapPacket): The first block sent, with the total number of blocks and the ETag of the file.
+        - num (int): The block number.
+        - path (str): The path for saving the file.
+
+        Returns:
+        - bool: False if the transfer starts after the first block but does not continue the saved progress.
+        """
+        total_packets = packet.options[packet.get_size_code()]
+        etag = packet.options.get(CoapOptionDelta.ETAG.value)
+        block_size = DriveSpliter.get_requested_block_size(packet)
+
+        # Reads in memory start at the first block of their range and keep no progress, nor do folders, deltas
+        # and chunks
+        if isinstance(operation_dict["STREAM"], DriveArchiveExtractor):
+            logger.log(f"> Downloading the folder in {total_packets} packets...", LogColor.CYAN)
+        elif isinstance(operation_dict["STREAM"], DriveChunkWriter):
+            logger.log(f"> Downloading the chunks of the file in {total_packets} packets...", LogColor.CYAN)
+        elif operation_dict["STREAM"] is not None:
+            logger.log(f"> Downloading the changes of the file in {total_packets} packets...", LogColor.CYAN)
+        elif operation_dict["BUFFER"] is None:
+            flags = os.O_RDWR | os.O_CREAT
+            if DriveResume.is_resumable(operation_dict["RESUME"], path, etag, block_size, total_packets, num):
+                logger.log(f"> Resuming the download of {total_packets} packets at block {num}...", LogColor.CYAN)
+            elif num == 0:
+                logger.log(f"> Downloading {total_packets} packets...", LogColor.CYAN)
+                # If the file already exists, it is written from the start
+                flags |= os.O_TRUNC
+            else:
+                DriveResume.discard(path)
+                return False
+
+            operation_dict["FD"] = os.open(path, flags, 0o644)
+            DriveUtilities.preallocate(operation_dict["FD"], num * block_size, (total_packets - num) * block_size)
+
+            operation_dict["RESUME"] = {
+                "path": packet.options[CoapOptionDelta.LOCATION_PATH.value],
+                "etag": etag,
+                "block_size": block_size,
+                "total_packets": total_packets,
+                "next_block": num
+            }
+            DriveResume.save(path, operation_dict["RESUME"])
+
+        operation_dict["TOTAL_PACKETS"] = total_packets
+        operation_dict["BLOCK_SIZE"] = block_size
+        operation_dict["WRITE_INDEX"] = num
+
+        # Blocks received before the first block sent are outdated, the others are stored now
+        received_packets = operation_dict["RECEIVED_PACKETS"]
+        operation_dict["RECEIVED_PACKETS"] = {}
+        for received in sorted(received_packets):
+            if received >= num:
+                DriveAssembler.__store_block(operation_dict, received, received_packets[received], path)
+        return True
+
+    @staticmethod
+    def __store_block(operation_dict: dict, num: int, payload: bytes, path: str) -> bool:
+        """
+        Store a block of the file at its offset; the blocks of a read in memory, a folder archive or a delta are
+        kept until all the blocks before them are received. The blocks received before the first block sent are kept
+        in memory.
+
+        Parameters:
+        - operation_dict (dict): The assembly state of the file.
+        - num (int): The block number.
+        - payload (bytes): The block content.
+        - path (str): The path for saving the file.
+
+        Returns:
+        - bool: False if the block is a duplicate of a block that was already stored, True otherwise.
+        """
+        if operation_dict["WRITE_INDEX"] is not None and num < operation_dict["WRITE_INDEX"]:
+            # Duplicate of a block that was already written
+            return False
+        if num in operation_dict["RECEIVED_PACKETS"]:
+            return False
+
+        if operation_dict["WRITE_INDEX"] is None or operation_dict["BUFFER"] is not None \
+                or operation_dict["STREAM"] is not None:
+            operation_dict["RECEIVED_PACKETS"][num] = payload
+        else:
+            DriveAssembler.__write_block(operation_dict, num, payload)
+            if num + 1 == operation_dict["TOTAL_PACKETS"]:
+                operation_dict["END"] = num * operation_dict["BLOCK_SIZE"] + len(payload)
+
+            if num == operation_dict["WRITE_INDEX"]:
+                operation_dict["CONTENT_HASH"].update(payload)
+                operation_dict["WRITE_INDEX"] += 1
+            else:
+                # Only the number of a block written out of order is kept
+                operation_dict["RECEIVED_PACKETS"][num] = None
+
+        if operation_dict["WRITE_INDEX"] is None:
+            return True
+
+        # Move past the consecutive blocks received so far, appending them to the buffer of a read in memory
+        # or feeding them to the extractor of a folder or the patcher of a delta
+        while operation_dict["WRITE_INDEX"] in operation_dict["RECEIVED_PACKETS"]:
+            payload = operation_dict["RECEIVED_PACKETS"].pop(operation_dict["WRITE_INDEX"])
+            if payload is None:
+                payload = DriveAssembler.__read_written_block(operation_dict, operation_dict["WRITE_INDEX"])
+
+            operation_dict["CONTENT_HASH"].update(payload)
+            if operation_dict["BUFFER"] is not None:
+                operation_dict["BUFFER"] += payload
+            elif operation_dict["STREAM"] is not None:
+                operation_dict["STREAM"].feed(payload)
+            operation_dict["WRITE_INDEX"] += 1
+
+        # Save the progress every few blocks
+        resume = operation_dict["RESUME"]
+        if resume and operation_dict["WRITE_INDEX"] - resume["next_block"] >= DRIVE_RESUME_SAVE_INTERVAL:
+            DriveAssembler.__save_progress(operation_dict)
+        return True
+
+    @staticmethod
+    def __write_block(operation_dict: dict, num: int, payload: bytes):
+        """
+        Add a block to the run of consecutive blocks being gathered, writing the run when the block does not
+        follow it or the run is large enough.
+
+        Parameters:
+        - operation_dict (dict): The assembly state of the file.
+        - num (int): The block number.
+        - payload (bytes): The block content.
+        """
+        run_start, run_buffer = operation_dict["RUN_START"], operation_dict["RUN_BUFFER"]
+        if run_start is not None and run_start * operation_dict["BLOCK_SIZE"] + len(run_buffer) != \
+                num * operation_dict["BLOCK_SIZE"]:
+            DriveAssembler.__flush_run(operation_dict)
+
+        if operation_dict["RUN_START"] is None:
+            operation_dict["RUN_START"] = num
+        operation_dict["RUN_BUFFER"] += payload
+
+        if len(operation_dict["RUN_BUFFER"]) >= DRIVE_WRITE_COALESCE_SIZE:
+            DriveAssembler.__flush_run(operation_dict)
+
+    @staticmethod
+    def __read_written_block(operation_dict: dict, num: int) -> bytes:
+        """
+        Read back a block that was written out of order, from the run being gathered or from the file.
+
+        Parameters:
+        - operation_dict (dict): The assembly state of the file.
+        - num (int): The block number.
+
+        Returns:
+        - bytes: The block content.
+        """
+        block_size = operation_dict["BLOCK_SIZE"]
+        offset = num * block_size
+        length = operation_dict["END"] - offset if num + 1 == operation_dict["TOTAL_PACKETS"] else block_size
+
+        # The blocks out of the run being gathered were already written to the file
+        if operation_dict["RUN_START"] is not None:
+            start = offset - operation_dict["RUN_START"] * block_size
+            if 0 <= start < len(operation_dict["RUN_BUFFER"]):
+                return bytes(operation_dict["RUN_BUFFER"][start:start + length])
+        return os.pread(operation_dict["FD"], length, offset)
+
+    def __check_content_hash(self, operation_dict: dict, packet: CoapPacket) -> bool:
+        """
+        Check the digest of a finished transfer against the one sent with its last block. A transfer that does
+        not match is dropped, together with its file, and fails.
+
+        Parameters:
+        - operation_dict (dict): The assembly state of the transfer.
+        - packet (CoapPacket): A CoAP packet of the transfer.
+
+        Returns:
+        - bool: True if the digest matches or the sender did not send one; False otherwise.
+        """
+        expected = operation_dict["EXPECTED_HASH"]
+        if expected is None:
+            logger.debug(f"<{packet.token}> No content hash received, the transfer is not checked.")
+            return True
+        if operation_dict["CONTENT_HASH"].digest() == expected:
+            logger.debug(f"<{packet.token}> Content hash verified.")
+            return True
+
+        logger.log(f"> Integrity check failed for {operation_dict['PATH']}, the transfer is dropped.", LogColor.RED)
+        self.__drop_transfer(operation_dict, packet)
+        return False
+
+    def __check_stream(self, operation_dict: dict, packet: CoapPacket) -> bool:
+        """
+        Check that the archive of a finished folder transfer was unpacked up to its end, or that the delta of a file
+        was applied. A folder that was not is dropped, together with the files unpacked so far, as is the file
+        rebuilt from a delta that was not, and the transfer fails.
+
+        Parameters:
+        - operation_dict (dict): The assembly state of the transfer.
+        - packet (CoapPacket): A CoAP packet of the transfer.
+
+        Returns:
+        - bool: True if the archive was unpacked or the delta applied, or the transfer is neither; False otherwise.
+        """
+        stream = operation_dict["STREAM"]
+        if stream is None or stream.finished:
+            return True
+
+        logger.log(f"> The {'folder' if isinstance(stream, DriveArchiveExtractor) else 'file'} "
+                   f"{operation_dict['PATH']} is incomplete, the transfer is dropped.", LogColor.RED)
+        self.__drop_transfer(operation_dict, packet)
+        return False
+
+    def __drop_transfer(self, operation_dict: dict, packet: CoapPacket):
+        """
+        Drop a finished transfer that cannot be kept, together with its file or unpacked folder, and fail it.
+
+        Parameters:
+        - operation_dict (dict): The assembly state of the transfer.
+        - packet (CoapPacket): A CoAP packet of the transfer.
+        """
+        operation_dict["BUFFER"] = None
+        if operation_dict["FD"] is not None:
+            os.close(operation_dict["FD"])
+            operation_dict["FD"] = None
+            DriveUtilities.delete_file(operation_dict["PATH"])
+            DriveResume.discard(operation_dict["PATH"])
+        if operation_dict["STREAM"] is not None:
+            operation_dict["STREAM"].discard()
+
+        self.__close_session(packet, operation_dict)
+        self.__transaction_pool.set_overall_transaction_failure(packet)
+        self.__transaction_pool.finish_overall_transaction(packet)
+
+    @staticmethod
+    def __flush_run(operation_dict: dict):
+        """
+        Write the run of consecutive blocks gathered so far at its offset.
+
+        Parameters:
+        - operation_dict (dict): The assembly state of the file.
+        """
+        if operation_dict["RUN_START"] is None:
+            return
+
+        os.pwrite(operation_dict["FD"], operation_dict["RUN_BUFFER"],
+                  operation_dict["RUN_START"] * operation_dict["BLOCK_SIZE"])
+        operation_dict["RUN_START"] = None
+        operation_dict["RUN_BUFFER"] = bytearray()
+
+    @staticmethod
+    def __save_progress(operation_dict: dict):
+        """
+        Save the number of blocks written contiguously, once they are written (and synced) to the file.
+
+        Parameters:
+        - operation_dict (dict): The assembly state of the file.
+        """
+        DriveAssembler.__flush_run(operation_dict)
+        if DRIVE_WRITE_SYNC:
+            os.fsync(operation_dict["FD"])
+
+        operation_dict["RESUME"]["next_block"] = operation_dict["WRITE_INDEX"]
+        DriveResume.save(operation_dict["PATH"], operation_dict["RESUME"])
+
+    @staticmethod
+    def __finish_file(operation_dict: dict):
+        """
+        Write the last run of blocks and cut the preallocated file to its exact size.
+
+        Parameters:
+        - operation_dict (dict): The assembly state of the file.
+        """
+        DriveAssembler.__flush_run(operation_dict)
+        if operation_dict["END"] is not None:
+            os.ftruncate(operation_dict["FD"], operation_dict["END"])
+        if DRIVE_WRITE_SYNC:
+            os.fsync(operation_dict["FD"])
+
+        os.close(operation_dict["FD"])
+        operation_dict["FD"] = None
+
+    def __store_fec_block(self, operation_dict: dict, packet: CoapPacket, num: int) -> list[tuple[int, bytes]]:
+        """
+        Keep a data block of a FEC transfer until its group is complete, and rebuild the blocks it unlocks.
+
+        Parameters:
+        - operation_dict (dict): The assembly state of the file.
+        - packet (CoapPacket): The CoAP packet carrying the data block.
+        - num (int): The block number.
+
+        Returns:
+        - list: The rebuilt blocks, as (block number, content) pairs.
+        """
+        fec = DriveFec.decode_option(packet.options[CoapOptionDelta.FEC.value])
+        if not fec or num // fec[0] in operation_dict["FEC_COMPLETED"]:
+            return []
+
+        operation_dict["FEC_BLOCKS"][num] = packet.payload
+        return self.__recover_group(operation_dict, fec, num // fec[0])
+
+    def __store_parity(self, operation_dict: dict, packet: CoapPacket, group: int) -> list[tuple[int, bytes]]:
+        """
+        Keep a parity block until its group is complete, and rebuild the blocks it unlocks.
+
+        Parameters:
+        - operation_dict (dict): The assembly state of the file.
+        - packet (CoapPacket): The CoAP packet carrying the parity block.
+        - group (int): The group number.
+
+        Returns:
+        - list: The rebuilt blocks, as (block number, content) pairs.
+        """
+        fec = DriveFec.decode_option(packet.options.get(CoapOptionDelta.FEC.value))
+        if not fec or group in operation_dict["FEC_COMPLETED"]:
+            return []
+
+        operation_dict["TOTAL_PACKETS"] = packet.options[packet.get_size_code()]
+        operation_dict["FEC_PARITY"][(group, packet.options[CoapOptionDelta.FEC_PARITY.value])] = packet.payload
+        return self.__recover_group(operation_dict, fec, group)
+
+    @staticmethod
+    def __recover_group(operation_dict: dict, fec: tuple, group: int) -> list[tuple[int, bytes]]:
+        """
+        Rebuild the missing blocks of a group that are the only missing block covered by a parity block.
+        Once the group is complete, its blocks and parity blocks are released.
+
+        Parameters:
+        - operation_dict (dict): The assembly state of the file.
+        - fec (tuple): The group size (K) and parity count (M).
+        - group (int): The group number.
+
+        Returns:
+        - list: The rebuilt blocks, as (block number, content) pairs.
+        """
+        group_size, parity_count = fec
+        blocks = operation_dict["FEC_BLOCKS"]
+        total_packets = operation_dict["TOTAL_PACKETS"]
+        if total_packets == -1:
+            return []
+
+        recovered = []
+        for parity_index in range(parity_count):
+            parity = operation_dict["FEC_PARITY"].get((group, parity_index))
+            if parity is None:
+                continue
+
+            members = DriveFec.group_members(group, parity_index, group_size, parity_count, total_packets)
+            missing = [num for num in members if num not in blocks]
+            if len(missing) != 1:
+                continue
+
+            payload = DriveFec.recover(parity, [blocks[num] for num in members if num != missing[0]])
+            if payload is not None:
+                blocks[missing[0]] = payload
+                recovered.append((missing[0], payload))
+
+        # Release the group once all its blocks are known
+        first, last = group * group_size, min((group + 1) * group_size, total_packets)
+        if all(num in blocks for num in range(first, last)):
+            operation_dict["FEC_COMPLETED"].add(group)
+            for num in range(first, last):
+                blocks.pop(num)
+            for parity_index in range(parity_count):
+                operation_dict["FEC_PARITY"].pop((group, parity_index), None)
+
+        return recovered
+
+    @staticmethod
+    def __get_missing_blocks(operation_dict: dict, last_num: int) -> list[list[int]]:
+        """
+        Get the ranges of blocks that were not received yet, up to a given block.
+
+        Parameters:
+        - operation_dict (dict): The assembly state of the transfer.
+        - last_num (int): The last block number to be checked.
+
+        Returns:
+        - list: The missing blocks as [first, last] ranges.
+        """
+        if operation_dict["CLOSED"]:
+            return []
+
+        # Before the first block sent arrives, any block may be missing
+        missing = []
+        for num in range(operation_dict["WRITE_INDEX"] or 0, last_num + 1):
+            if num in operation_dict["RECEIVED_PACKETS"]:
+                continue
+            if missing and missing[-1][1] == num - 1:
+                missing[-1][1] = num
+            else:
+                missing.append([num, num])
+        return missing
+
+    def __report_missing_blocks(self, packet: CoapPacket, last_num: int):
+        """
+        Report the missing blocks of a Q-Block round to the sender, in pages of at most
+        DRIVE_Q_BLOCK_MAX_REPORTED_RANGES ranges.
+
+        The NON blocks of the round may still be queued on other workers when the CON block arrives,
+        so the report waits until no block is missing or no progress is made for DRIVE_Q_BLOCK_REPORT_DELAY.
+
+        Parameters:
+        - packet (CoapPacket): The CON block that closed the round.
+        - last_num (int): The block number of the CON block.
+        """
+        with self.__lock:
+            operation_dict = self.__in_assembly.get(packet.general_work_id())
+
+        missing, progress, last_progress = [], None, time.time()
+        while operation_dict:
+            with operation_dict["LOCK"]:
+                missing = self.__get_missing_blocks(operation_dict, last_num)
+                current_progress = (operation_dict["WRITE_INDEX"], len(operation_dict["RECEIVED_PACKETS"]))
+
+            if not missing:
+                break
+            if current_progress != progress:
+                progress, last_progress = current_progress, time.time()
+            elif time.time() - last_progress > DRIVE_Q_BLOCK_REPORT_DELAY:
+                break
+            time.sleep(DRIVE_Q_BLOCK_REPORT_DELAY / 5)
+
+        # Long lists of ranges are split in pages, the sender waits for all of them
+        pages = [missing[start:start + DRIVE_Q_BLOCK_MAX_REPORTED_RANGES]
+                 for start in range(0, len(missing), DRIVE_Q_BLOCK_MAX_REPORTED_RANGES)] or [[]]
+        for index, page in enumerate(pages):
+            report = DriveTemplates.MISSING_BLOCKS.value_with(
+                packet.token, self.__transaction_pool.next_message_id(packet.sender_ip_port),
+                packet.skt, packet.sender_ip_port
+            )
+            report.payload = {"block": last_num, "missing": page, "page": index, "pages": len(pages)}
+            self.__transaction_pool.add_transaction(report)
 
     def get_files_list(self) -> list:
         """
@@ -0,0 +1,69 @@
+import threading
+
+from share_drive.share_drive_helpers import DRIVE_BUFFER_POOL_SIZE
+from coap_core.coap_utilities.coap_singleton import CoapSingletonBase
+
+
+class DriveBuffer(bytearray):
+    """
+    DriveBuffer is a buffer handed out by the DriveBufferPool, so only its own buffers are taken back.
+
+    Author: Damir Denis-Tudor
+    """
+    __slots__ = ()
+
+
+class DriveBufferPool(CoapSingletonBase):
+    """
+    DriveBufferPool recycles the buffers the blocks of the files are read into. A block is kept until it is
+    acknowledged, for its retransmissions, so its buffer is returned only then (see
+    CoapTransactionPool.add_transaction), and is read into again by the next block of any transfer instead of
+    allocating a new one.
+
+    The idle buffers are kept by size, up to DRIVE_BUFFER_POOL_SIZE bytes; the buffers not returned (a transfer
+    that stops, a block sent in a round of NON blocks and as a CON) are freed as any other object.
+
+    Author: Damir Denis-Tudor
+    """
+
+    def __init__(self):
+        """
+        Constructor for DriveBufferPool.
+        """
+        self.__lock = threading.Lock()
+        self.__idle: dict[int, list[DriveBuffer]] = {}
+        self.__idle_bytes = 0
+
+    def acquire(self, size: int) -> DriveBuffer:
+        """
+        Get a buffer, idle or new.
+
+        Parameters:
+        - size (int): The size of the buffer.
+
+        Returns:
+        - DriveBuffer: The buffer, with the bytes of its previous block.
+        """
+        with self.__lock:
+            buffers = self.__idle.get(size)
+            if buffers:
+                self.__idle_bytes -= size
+                return buffers.pop()
+        return DriveBuffer(size)
+
+    def release(self, block):
+        """
+        Return the buffer of a block, once nothing reads the block anymore. The blocks that are not read into a
+        buffer of the pool (compressed blocks, deltas) are ignored.
+
+        Parameters:
+        - block: The block, a memoryview of its buffer.
+        """
+        buffer = block.obj if isinstance(block, memoryview) else block
+        if not isinstance(buffer, DriveBuffer):
+            return
+
+        with self.__lock:
+            if self.__idle_bytes + len(buffer) <= DRIVE_BUFFER_POOL_SIZE:
+                self.__idle.setdefault(len(buffer), []).append(buffer)
+                self.__idle_bytes += len(buffer)
@@ -0,0 +1,714 @@
+import hashlib
+import json
+import os
+import queue
+import sqlite3
+import struct
+import threading
+from collections import deque
+from contextlib import closing
+
+from share_drive.share_drive_helpers import DRIVE_CHUNK_MIN_SIZE, DRIVE_CHUNK_AVG_SIZE, DRIVE_CHUNK_MAX_SIZE, \
+    DRIVE_CHUNK_SUFFIX, DRIVE_CONTENT_HASH_SIZE, DRIVE_RESUME_SUFFIX, DRIVE_DELTA_SUFFIX, \
+    DRIVE_ARCHIVE_SUFFIX
+from share_drive.share_drive_helpers.drive_utils import DriveFileReader
+from coap_core.coap_utilities.coap_logger import logger, LogColor
+from coap_core.coap_utilities.coap_singleton import CoapSingletonBase
+
+# A chunk may end after the bytes whose tabulation hash (of the last FILTER_WINDOW bytes) is zero, if the bits of
+# the mask are zero in the BLAKE2b digest of the last HASH_WINDOW bytes: the strict mask holds every 2 ** 15 bytes
+# on average, the loose one every 2 ** 11 bytes, for chunks of about DRIVE_CHUNK_AVG_SIZE (2 ** 13) bytes
+FILTER_WINDOW = 8
+HASH_WINDOW = 32
+STRICT_MASK = (1 << (DRIVE_CHUNK_AVG_SIZE.bit_length() - 7)) - 1
+LOOSE_MASK = (1 << (DRIVE_CHUNK_AVG_SIZE.bit_length() - 11)) - 1
+
+# Bytes of a file hashed at once, and the window of the reader of a file: the boundaries are found up to a segment
+# past the chunk whose bytes are hashed, so both are read from the window
+SEGMENT_SIZE = 1024 * 1024
+WINDOW_SIZE = 2 * (SEGMENT_SIZE + DRIVE_CHUNK_MAX_SIZE)
+
+# The files of unfinished transfers are not indexed
+TRANSFER_SUFFIXES = (DRIVE_RESUME_SUFFIX, DRIVE_DELTA_SUFFIX, DRIVE_CHUNK_SUFFIX, DRIVE_ARCHIVE_SUFFIX)
+
+# The recipe of a file: its size and digest, then the digest and length of every chunk
+RECIPE_HEADER = struct.Struct(">Q16s")
+RECIPE_ENTRY = struct.Struct(">16sI")
+
+# The operations of a chunked upload: a chunk the receiver has, a chunk it misses, or the end of the file
+REF = b"R"
+DATA = b"D"
+END = b"E"
+REF_OPERATION = struct.Struct(">c16sI")
+DATA_OPERATION = struct.Struct(">cI")
+END_OPERATION = struct.Struct(">cQ16s")
+
+# Seconds a process waits for the index while another one writes it
+INDEX_TIMEOUT = 30
+
+
+class DriveChunker:
+    """
+    DriveChunker splits files into content-defined chunks, so the chunks of a file are found again in another
+    file holding the same bytes, wherever they are: the boundaries depend only on the bytes before them, and an
+    insertion or a deletion moves the boundaries of the chunks around it only.
+
+    The boundaries are chosen FastCDC like, with normalized chunking: a strict condition between
+    DRIVE_CHUNK_MIN_SIZE bytes and the average size, a loose one above it, and a cut at DRIVE_CHUNK_MAX_SIZE bytes.
+    Rolling a hash byte by byte is too slow in Python, so a tabulation hash of every FILTER_WINDOW bytes is computed
+    for a whole segment at once, with `bytes.translate` and the XOR of large integers, and only the offsets where
+    it is zero (one in 256) are hashed with BLAKE2b to check the conditions.
+
+    A file is read through a DriveFileReader window, never whole: a chunk ends at most DRIVE_CHUNK_MAX_SIZE bytes
+    after its start, so the boundaries are only looked for a segment ahead.
+
+    The recipe of a file lists the BLAKE2b digest and the length of its chunks.
+
+    Author: Damir Denis-Tudor
+    """
+
+    # A table of random bytes for every byte of the window
+    TABLES = [bytes(hashlib.blake2b(bytes((value,)), key=f"chunk:{index}".encode(), digest_size=1).digest()[0]
+                    for value in range(256)) for index in range(FILTER_WINDOW)]
+
+    @staticmethod
+    def __get_boundaries(reader):
+        """
+        Find the offsets where a chunk may end, reading the file one segment at a time.
+
+        Parameters:
+        - reader (DriveFileReader): The file, read through a window of WINDOW_SIZE bytes.
+
+        Yields:
+        - tuple: The offset, in increasing order, and whether the strict condition holds there too.
+        """
+        size = reader.size
+        for start in range(0, max(size - FILTER_WINDOW + 1, 0), SEGMENT_SIZE):
+            length = min(SEGMENT_SIZE, size - FILTER_WINDOW + 1 - start)
+            # The segment is read with the bytes hashed before its first offsets
+            base = max(0, start - HASH_WINDOW)
+            data = bytes(reader.view(base, start - base + length + FILTER_WINDOW - 1))
+            segment = data[start - base:]
+
+            # The byte i of the hash is the XOR of the table bytes of the window starting at i
+            hashes = 0
+            for index, table in enumerate(DriveChunker.TABLES):
+                hashes ^= int.from_bytes(segment[index:index + length].translate(table), 'little')
+            hashes = hashes.to_bytes(length, 'little')
+
+            position = hashes.find(0)
+            while position >= 0:
+                end = start + position + FILTER_WINDOW
+                digest = hashlib.blake2b(data[max(0, end - HASH_WINDOW) - base:end - base], digest_size=2).digest()
+                value = int.from_bytes(digest, 'big')
+                if not value & LOOSE_MASK:
+                    yield end, not value & STRICT_MASK
+                position = hashes.find(0, position + 1)
+
+    @staticmethod
+    def get_chunks(reader):
+        """
+        Split a file into chunks, looking at most DRIVE_CHUNK_MAX_SIZE bytes past the start of every chunk.
+
+        Parameters:
+        - reader (DriveFileReader): The file, read through a window of WINDOW_SIZE bytes.
+
+        Yields:
+        - tuple: The offset and length of every chunk.
+        """
+        size = reader.size
+        boundaries = DriveChunker.__get_boundaries(reader)
+        # The boundaries found after the start of the current chunk, all of them up to `scanned`
+        loose, strict, scanned = deque(), deque(), 0
+
+        start = 0
+        while start < size:
+            end = min(start + DRIVE_CHUNK_MAX_SIZE, size)
+            while scanned < end:
+                offset, is_strict = next(boundaries, (size, False))
+                if offset < size:
+                    loose.append(offset)
+                    if is_strict:
+                        strict.append(offset)
+                scanned = offset
+            for offsets in (loose, strict):
+                while offsets and offsets[0] < start + DRIVE_CHUNK_MIN_SIZE:
+                    offsets.popleft()
+
+            cut = end
+            if end - start > DRIVE_CHUNK_MIN_SIZE:
+                if strict and strict[0] <= min(start + DRIVE_CHUNK_AVG_SIZE, end):
+                    cut = strict[0]
+                else:
+                    cut = min(next((offset for offset in loose if offset >= start + DRIVE_CHUNK_AVG_SIZE), end), end)
+
+            yield start, cut - start
+            start = cut
+
+    @staticmethod
+    def get_digest(data) -> bytes:
+        return hashlib.blake2b(data if data is not None else b"", digest_size=DRIVE_CONTENT_HASH_SIZE).digest()
+
+    @staticmethod
+    def get_recipe(reader) -> dict:
+        """
+        Compute the recipe of a file in one pass.
+
+        Parameters:
+        - reader (DriveFileReader): The file, read through a window of WINDOW_SIZE bytes.
+
+        Returns:
+        - dict: The size and digest of the file, its chunks as (digest, length) tuples, and the status of the
+          file it was computed from, checked when its chunks are read again.
+
+        Raises:
+        - OSError: If the file changes while it is read.
+        """
+        digest, chunks = hashlib.blake2b(digest_size=DRIVE_CONTENT_HASH_SIZE), []
+        for offset, length in DriveChunker.get_chunks(reader):
+            chunk = reader.view(offset, length)
+            digest.update(chunk)
+            chunks.append((DriveChunker.get_digest(chunk), length))
+        reader.check()
+        return {"size": reader.size, "digest": digest.digest(), "chunks": chunks, "stat": reader.stat}
+
+    @staticmethod
+    def encode_recipe(recipe: dict) -> bytes:
+        return RECIPE_HEADER.pack(recipe["size"], recipe["digest"]) + \
+            b"".join(RECIPE_ENTRY.pack(digest, length) for digest, length in recipe["chunks"])
+
+    @staticmethod
+    def parse_recipe(data: bytes | None) -> dict | None:
+        """
+        Parse a recipe.
+
+        Parameters:
+        - data (bytes | None): The encoded recipe.
+
+        Returns:
+        - dict | None: The recipe; None if it is invalid.
+        """
+        if not data or len(data) < RECIPE_HEADER.size or (len(data) - RECIPE_HEADER.size) % RECIPE_ENTRY.size:
+            return None
+
+        size, digest = RECIPE_HEADER.unpack_from(data)
+        chunks = list(RECIPE_ENTRY.iter_unpack(data[RECIPE_HEADER.size:]))
+        if sum(length for _, length in chunks) != size or \
+                any(not 0 < length <= DRIVE_CHUNK_MAX_SIZE for _, length in chunks):
+            return None
+        return {"size": size, "digest": digest, "chunks": chunks}
+
+    @staticmethod
+    def encode_missing(indexes: list[int]) -> bytes:
+        """
+        Encode the indexes of the missing chunks of a recipe as ranges.
+
+        Parameters:
+        - indexes (list): The indexes, in increasing order.
+
+        Returns:
+        - bytes: The JSON list of the [first, last] ranges.
+        """
+        ranges = []
+        for index in indexes:
+            if ranges and ranges[-1][1] + 1 == index:
+                ranges[-1][1] = index
+            else:
+                ranges.append([index, index])
+        return json.dumps(ranges).encode()
+
+    @staticmethod
+    def parse_missing(data: bytes | None) -> set[int] | None:
+        """
+        Parse the indexes of the missing chunks of a recipe.
+
+        Parameters:
+        - data (bytes | None): The JSON list of the [first, last] ranges.
+
+        Returns:
+        - set | None: The indexes; None if the list is invalid.
+        """
+        try:
+            return {index for first, last in json.loads(data) for index in range(first, last + 1)}
+        except (TypeError, ValueError):
+            return None
+
+    @staticmethod
+    def get_size(recipe: dict, missing: set[int]) -> int:
+        """
+        Compute the size of the chunked upload of a file.
+
+        Parameters:
+        - recipe (dict): The recipe of the file.
+        - missing (set): The indexes of the chunks sent whole.
+
+        Returns:
+        - int: The size in bytes.
+        """
+        size = END_OPERATION.size
+        for index, (_, length) in enumerate(recipe["chunks"]):
+            size += DATA_OPERATION.size + length if index in missing else REF_OPERATION.size
+        return size
+
+    @staticmethod
+    def split_on_packets(recipe: dict, missing: set[int], path: str, block_size: int):
+        """
+        Generate the chunked upload of a file in blocks of the specified size: the chunks the receiver misses
+        are read from the file and sent whole, the others by their digest.
+
+        Parameters:
+        - recipe (dict): The recipe of the file, as computed by `get_recipe`.
+        - missing (set): The indexes of the chunks sent whole.
+        - path (str): The path of the file.
+        - block_size (int): The size of each packet in bytes.
+
+        Yields:
+        - bytes: Blocks of the upload; only the last one may be shorter.
+
+        Raises:
+        - OSError: If the file changed since its recipe was computed, so the transfer fails instead of sending
+          chunks of another version.
+        """
+        buffer, offset = bytearray(), 0
+        with DriveFileReader(path, WINDOW_SIZE, recipe["stat"]) as reader:
+            for index, (digest, length) in enumerate(recipe["chunks"]):
+                if index in missing:
+                    buffer += DATA_OPERATION.pack(DATA, length)
+                    buffer += reader.view(offset, length)
+                else:
+                    buffer += REF_OPERATION.pack(REF, digest, length)
+                offset += length
+
+                while len(buffer) >= block_size:
+                    yield bytes(buffer[:block_size])
+                    del buffer[:block_size]
+            reader.check()
+
+        buffer += END_OPERATION.pack(END, recipe["size"], recipe["digest"])
+        while buffer:
+            yield bytes(buffer[:block_size])
+            del buffer[:block_size]
+
+
+class DriveChunkStore(CoapSingletonBase):
+    """
+    DriveChunkStore is the index of the chunks of the files of the server (see DriveChunker), kept in an SQLite
+    database shared by the processes of the server: for every chunk, the file, offset and length where it is
+    found, and for every file its size, modification time and digest.
+
+    The files stay where they are, so they are still read, resumed and patched as before; the index only tells
+    where the bytes of a chunk are. The chunks of a file that changed since it was indexed are never used. A file
+    uploaded with the same digest as another one is stored as a hard link to it.
+
+    The files are indexed in the background, by a thread of every process: the tree when the server starts, and
+    every file when a transfer writes it, so an upload never waits for the tree to be walked. The files changed
+    by other programs while the server runs are indexed again only when the folder of a chunked upload is
+    refreshed before its missing chunks are found; until then, or until the server restarts for the other
+    folders, their chunks are reported missing.
+
+    Author: Damir Denis-Tudor
+    """
+
+    def __init__(self):
+        """
+        Constructor for DriveChunkStore. The index is disabled until `set_store` is called.
+        """
+        self.__path = None
+
+        # Every thread has its own connection to the index
+        self.__local = threading.local()
+
+        # The files and folders waiting to be indexed, and the thread indexing them, started with the first one
+        self.__lock = threading.Lock()
+        self.__pending = None
+
+        # A forked process starts its own indexing thread
+        os.register_at_fork(after_in_child=self.__reset_indexer)
+
+    def __reset_indexer(self):
+        """
+        Forget the indexing thread of the parent process, which does not exist in a forked one.
+        """
+        self.__lock = threading.Lock()
+        self.__pending = None
+
+    def set_store(self, path: str):
+        """
+        Enable the index.
+
+        Parameters:
+        - path (str): The path of the database, created if it does not exist.
+        """
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.__path = path
+
+        # The connection is not kept, as the processes of the server are forked afterward
+        with closing(sqlite3.connect(path, timeout=INDEX_TIMEOUT)) as db, db:
+            db.execute("CREATE TABLE IF NOT EXISTS files "
+                       "(path TEXT PRIMARY KEY, size INTEGER, mtime INTEGER, digest BLOB)")
+            db.execute("CREATE TABLE IF NOT EXISTS chunks (digest BLOB, path TEXT, offset INTEGER, length INTEGER)")
+            db.execute("CREATE INDEX IF NOT EXISTS files_digest ON files (digest)")
+            db.execute("CREATE INDEX IF NOT EXISTS chunks_digest ON chunks (digest)")
+            db.execute("CREATE INDEX IF NOT EXISTS chunks_path ON chunks (path)")
+
+    def is_enabled(self) -> bool:
+        return self.__path is not None
+
+    def __connect(self) -> sqlite3.Connection:
+        """
+        Get the connection of this thread to the index, used as a context manager for every transaction.
+
+        Returns:
+        - sqlite3.Connection: The connection.
+        """
+        db = getattr(self.__local, "db", None)
+        if db is None:
+            db = self.__local.db = sqlite3.connect(self.__path, timeout=INDEX_TIMEOUT)
+        return db
+
+    @staticmethod
+    def __is_current(path: str, size: int, mtime: int) -> bool:
+        """
+        Check that a file did not change since it was indexed.
+
+        Parameters:
+        - path (str): The path of the file.
+        - size (int): The size of the file when it was indexed.
+        - mtime (int): The modification time of the file when it was indexed, in nanoseconds.
+
+        Returns:
+        - bool: True if the file did not change.
+        """
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        return (stat.st_size, stat.st_mtime_ns) == (size, mtime)
+
+    def add_file(self, path: str, recipe: dict, stat: os.stat_result = None):
+        """
+        Index the chunks of a file, replacing the ones indexed before.
+
+        Parameters:
+        - path (str): The path of the file.
+        - recipe (dict): The recipe of the file.
+        - stat (os.stat_result): The status of the file when its recipe was computed; the current one by default.
+        """
+        path = os.path.abspath(path)
+        stat = stat or os.stat(path)
+
+        rows, offset, seen = [], 0, set()
+        for digest, length in recipe["chunks"]:
+            if digest not in seen:
+                seen.add(digest)
+                rows.append((digest, path, offset, length))
+            offset += length
+
+        with self.__connect() as db:
+            db.execute("DELETE FROM chunks WHERE path = ?", (path,))
+            db.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)",
+                       (path, stat.st_size, stat.st_mtime_ns, recipe["digest"]))
+            db.executemany("INSERT INTO chunks VALUES (?, ?, ?, ?)", rows)
+
+    def index_later(self, path: str):
+        """
+        Index a file, or the files of a folder, in the background.
+
+        Parameters:
+        - path (str): The path of the file or folder.
+        """
+        if not self.is_enabled():
+            return
+
+        with self.__lock:
+            if self.__pending is None:
+                self.__pending = queue.Queue()
+                threading.Thread(target=self.__index_pending, args=(self.__pending,), daemon=True).start()
+            self.__pending.put(os.path.abspath(path))
+
+    def __index_pending(self, pending: queue.Queue):
+        """
+        Index the files and folders queued by `index_later`, one at a time.
+
+        Parameters:
+        - pending (queue.Queue): The queue of the paths.
+        """
+        while True:
+            path = pending.get()
+            if os.path.isdir(path):
+                self.refresh(path)
+            else:
+                self.__index_file(path)
+
+    def __index_file(self, path: str, indexed: tuple[int, int] | tuple = None) -> bool:
+        """
+        Index a file if it is new or changed since it was indexed. Partial files, the files being rebuilt and
+        links are skipped.
+
+        Parameters:
+        - path (str): The absolute path of the file.
+        - indexed (tuple): The size and modification time the file was indexed with, empty if it was not;
+          looked up by default.
+
+        Returns:
+        - bool: True if the file exists and is not skipped.
+        """
+        if os.path.basename(path).endswith(TRANSFER_SUFFIXES) or \
+                os.path.islink(path) or os.path.exists(path + DRIVE_RESUME_SUFFIX):
+            return False
+
+        try:
+            stat = os.stat(path)
+            if indexed is None:
+                indexed = self.__connect().execute("SELECT size, mtime FROM files WHERE path = ?",
+                                                   (path,)).fetchone()
+            if indexed is None or tuple(indexed) != (stat.st_size, stat.st_mtime_ns):
+                with DriveFileReader(path, WINDOW_SIZE) as reader:
+                    recipe = DriveChunker.get_recipe(reader)
+                self.add_file(path, recipe, recipe["stat"])
+                logger.debug(f"Chunks of {path} indexed.")
+            return True
+        except OSError as e:
+            logger.debug(f"Error indexing '{path}': {e}", LogColor.YELLOW)
+            return False
+
+    def refresh(self, root: str):
+        """
+        Index the files of a folder that are new or changed since they were indexed, and forget the removed ones.
+
+        Parameters:
+        - root (str): The folder.
+        """
+        root = os.path.join(os.path.abspath(root), "")
+        db = self.__connect()
+        indexed = {path: (size, mtime) for path, size, mtime in db.execute(
+            "SELECT path, size, mtime FROM files WHERE substr(path, 1, ?) = ?", (len(root), root))}
+
+        seen = set()
+        for folder, _, names in os.walk(root):
+            for name in names:
+                path = os.path.join(folder, name)
+                if self.__index_file(path, indexed.get(path, ())):
+                    seen.add(path)
+
+        with db:
+            for path in indexed.keys() - seen:
+                db.execute("DELETE FROM chunks WHERE path = ?", (path,))
+                db.execute("DELETE FROM files WHERE path = ?", (path,))
+
+    def locate(self, digest: bytes, length: int) -> list[tuple[str, int]]:
+        """
+        Find where a chunk is, in the files that did not change since they were indexed.
+
+        Parameters:
+        - digest (bytes): The digest of the chunk.
+        - length (int): The length of the chunk.
+
+        Returns:
+        - list: The path and offset of every copy of the chunk.
+        """
+        rows = self.__connect().execute(
+            "SELECT chunks.path, chunks.offset, files.size, files.mtime FROM chunks JOIN files "
+            "ON files.path = chunks.path WHERE chunks.digest = ? AND chunks.length = ?", (digest, length))
+        return [(path, offset) for path, offset, size, mtime in rows if self.__is_current(path, size, mtime)]
+
+    def get_missing(self, recipe: dict) -> list[int]:
+        """
+        Find the chunks of a recipe that are not in the index. A chunk found more than once in the recipe is
+        missing at its first index only, as the receiver copies it from there afterward.
+
+        Parameters:
+        - recipe (dict): The recipe.
+
+        Returns:
+        - list: The indexes of the missing chunks, in increasing order.
+        """
+        found, missing = set(), []
+        for index, chunk in enumerate(recipe["chunks"]):
+            if chunk in found:
+                continue
+            if not self.locate(*chunk):
+                missing.append(index)
+            found.add(chunk)
+        return missing
+
+    def find_file(self, size: int, digest: bytes) -> str | None:
+        """
+        Find a file with the given size and digest, that did not change since it was indexed.
+
+        Parameters:
+        - size (int): The size of the file.
+        - digest (bytes): The digest of the file.
+
+        Returns:
+        - str | None: The path of the file; None if there is none.
+        """
+        rows = self.__connect().execute("SELECT path, mtime FROM files WHERE digest = ? AND size = ?",
+                                        (digest, size))
+        return next((path for path, mtime in rows if self.__is_current(path, size, mtime)), None)
+
+
+class DriveChunkWriter:
+    """
+    DriveChunkWriter rebuilds a file from its chunked upload, as the bytes of the upload arrive, in order: the
+    chunks sent by their digest are copied from the files where the index found them, or from the file itself.
+
+    The file is written with the DRIVE_CHUNK_SUFFIX suffix, and is renamed only once its size and digest match
+    the END operation. If a file with the same digest is indexed, the upload is replaced with a hard link to
+    it. The chunks of the file are then indexed.
+
+    Author: Damir Denis-Tudor
+    """
+
+    def __init__(self, path: str):
+        """
+        Constructor for DriveChunkWriter.
+
+        Parameters:
+        - path (str): The path of the file.
+        """
+        self.__path = path
+        self.__buffer = bytearray()
+        self.__chunks = []
+        self.__offsets: dict[bytes, int] = {}
+        self.__written = 0
+        self.__digest = hashlib.blake2b(digest_size=DRIVE_CONTENT_HASH_SIZE)
+        self.__sources = {}
+        self.__file = None
+
+        self.finished = False
+        self.failed = False
+
+        try:
+            self.__file = open(path + DRIVE_CHUNK_SUFFIX, 'w+b')
+        except OSError as e:
+            logger.log(f"> The chunks of {path} cannot be written: {e}", LogColor.RED)
+            self.failed = True
+
+    def feed(self, data: bytes):
+        """
+        Apply the next bytes of the upload.
+
+        Parameters:
+        - data (bytes): The bytes, following the ones fed before.
+        """
+        if self.finished or self.failed:
+            return
+
+        self.__buffer += data
+        try:
+            self.__process()
+        except (ValueError, OSError, struct.error) as e:
+            logger.log(f"> The chunks of {self.__path} cannot be written: {e}", LogColor.RED)
+            self.failed = True
+            self.discard()
+
+    def __process(self):
+        """
+        Consume the buffered operations.
+        """
+        while self.__buffer:
+            operation = bytes(self.__buffer[:1])
+            if operation == REF:
+                if len(self.__buffer) < REF_OPERATION.size:
+                    return
+                _, digest, length = REF_OPERATION.unpack_from(self.__buffer)
+                del self.__buffer[:REF_OPERATION.size]
+                self.__write(digest, self.__read(digest, length))
+            elif operation == DATA:
+                if len(self.__buffer) < DATA_OPERATION.size:
+                    return
+                length = DATA_OPERATION.unpack_from(self.__buffer)[1]
+                if length > DRIVE_CHUNK_MAX_SIZE:
+                    raise ValueError(f"chunk of {length} bytes")
+                if len(self.__buffer) < DATA_OPERATION.size + length:
+                    return
+                chunk = bytes(self.__buffer[DATA_OPERATION.size:DATA_OPERATION.size + length])
+                del self.__buffer[:DATA_OPERATION.size + length]
+                self.__write(DriveChunker.get_digest(chunk), chunk)
+            elif operation == END:
+                if len(self.__buffer) < END_OPERATION.size:
+                    return
+                _, size, digest = END_OPERATION.unpack_from(self.__buffer)
+                self.__finish(size, digest)
+                return
+            else:
+                raise ValueError(f"unknown operation {operation!r}")
+
+    def __read(self, digest: bytes, length: int) -> bytes:
+        """
+        Read a chunk sent by its digest, from the file itself if it was written before, or from the index.
+
+        Parameters:
+        - digest (bytes): The digest of the chunk.
+        - length (int): The length of the chunk.
+
+        Returns:
+        - bytes: The chunk.
+        """
+        if digest in self.__offsets:
+            self.__file.flush()
+            return os.pread(self.__file.fileno(), length, self.__offsets[digest])
+
+        for path, offset in DriveChunkStore().locate(digest, length):
+            if path not in self.__sources:
+                self.__sources[path] = open(path, 'rb')
+            chunk = os.pread(self.__sources[path].fileno(), length, offset)
+            # The file may have changed since it was checked
+            if DriveChunker.get_digest(chunk) == digest:
+                return chunk
+        raise ValueError(f"chunk {digest.hex()} not found")
+
+    def __write(self, digest: bytes, chunk: bytes):
+        self.__chunks.append((digest, len(chunk)))
+        self.__offsets.setdefault(digest, self.__written)
+        self.__file.write(chunk)
+        self.__digest.update(chunk)
+        self.__written += len(chunk)
+
+    def __finish(self, size: int, digest: bytes):
+        """
+        Check the file against its size and digest, store it or link it to the same file, and index it.
+
+        Parameters:
+        - size (int): The size of the file.
+        - digest (bytes): The digest of the file.
+        """
+        if size != self.__written or digest != self.__digest.digest():
+            raise ValueError("the rebuilt file does not match")
+        self.close()
+
+        source = DriveChunkStore().find_file(size, digest)
+        try:
+            if source is None:
+                raise OSError("no file with the same digest")
+            link = self.__path + ".link" + DRIVE_CHUNK_SUFFIX
+            os.link(source, link)
+            os.replace(link, self.__path)
+            os.remove(self.__file.name)
+            logger.debug(f"{self.__path} stored as a link to {source}.")
+        except OSError:
+            os.replace(self.__file.name, self.__path)
+
+        self.finished = True
+        DriveChunkStore().add_file(self.__path, {"size": size, "digest": digest, "chunks": self.__chunks})
+
+    def close(self):
+        """
+        Close the files, if any.
+        """
+        for file in [self.__file, *self.__sources.values()]:
+            if file:
+                file.close()
+        self.__sources.clear()
+
+    def discard(self):
+        """
+        Remove the file written so far.
+        """
+        self.close()
+        if self.__file and not self.finished and os.path.exists(self.__file.name):
+            try:
+                os.remove(self.__file.name)
+            except OSError as e:
+                logger.debug(f"Error removing '{self.__file.name}': {e}")
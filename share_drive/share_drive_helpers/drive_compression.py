@@ -0,0 +1,183 @@
+import lzma
+import os
+import zlib
+
+from share_drive.share_drive_helpers import DRIVE_COMPRESSED_SUFFIXES, DRIVE_COMPRESSION_SAMPLE_SIZE, \
+    DRIVE_COMPRESSION_MIN_SAVING
+from coap_core.coap_utilities.coap_logger import logger
+
+# A folder is sampled from the first bytes of up to this many of its files, in the order they are archived
+FOLDER_SAMPLE_FILES = 16
+
+
+class DriveCompression:
+    """
+    DriveCompression compresses the blocks of a transfer, one by one, when the requester offers it with the
+    COMPRESSION option (method and level).
+
+    Every block is compressed on its own, so it is still written at its offset, rebuilt from the parity blocks
+    and resumed like any other block; the larger the blocks, the better the ratio. The compressed blocks start
+    with one byte telling how the rest was encoded: RAW for blocks that do not shrink, ZLIB (raw deflate)
+    or LZMA (raw LZMA2). The blocks of a transfer are marked with the COMPRESSION option, so a sender that does
+    not support it sends the blocks as they are, unmarked.
+
+    Files that are compressed already (by their suffix) or whose first bytes do not shrink are sent as they are,
+    and so are folders whose files do not shrink.
+
+    Author: Damir Denis-Tudor
+    """
+
+    RAW = 0
+    ZLIB = 1
+    LZMA = 2
+
+    METHODS = {"zlib": ZLIB, "lzma": LZMA}
+
+    @staticmethod
+    def encode_option(method: int, level: int) -> int:
+        """
+        Encode the compression parameters into the value of the COMPRESSION option.
+
+        Parameters:
+        - method (int): The compression method, ZLIB or LZMA.
+        - level (int): The compression level, 0 to 9.
+
+        Returns:
+        - int: The option value.
+        """
+        return (method << 4) | level
+
+    @staticmethod
+    def decode_option(option: int) -> tuple[int, int] | None:
+        """
+        Decode the value of the COMPRESSION option, validating the parameters.
+
+        Parameters:
+        - option (int): The option value.
+
+        Returns:
+        - tuple | None: The method and level; None if the parameters are invalid.
+        """
+        if not option:
+            return None
+
+        method, level = option >> 4, option & 0x0F
+        if method not in (DriveCompression.ZLIB, DriveCompression.LZMA) or level > 9:
+            return None
+        return method, level
+
+    @staticmethod
+    def __sample(path: str) -> bytes:
+        """
+        Read a sample of the content of a file, or of the files of a folder: the first bytes of every file,
+        an equal share of the sample each.
+
+        Parameters:
+        - path (str): The path of the file or folder.
+
+        Returns:
+        - bytes: The sample, at most DRIVE_COMPRESSION_SAMPLE_SIZE bytes long.
+        """
+        if not os.path.isdir(path):
+            with open(path, 'rb') as file:
+                return file.read(DRIVE_COMPRESSION_SAMPLE_SIZE)
+
+        share = DRIVE_COMPRESSION_SAMPLE_SIZE // FOLDER_SAMPLE_FILES
+        sample = bytearray()
+        for root, folders, files in os.walk(path):
+            folders.sort()
+            for name in sorted(files):
+                try:
+                    with open(os.path.join(root, name), 'rb') as file:
+                        sample += file.read(share)
+                except OSError as e:
+                    logger.debug(f"Error sampling '{os.path.join(root, name)}': {e}")
+                if len(sample) >= DRIVE_COMPRESSION_SAMPLE_SIZE:
+                    return bytes(sample)
+        return bytes(sample)
+
+    @staticmethod
+    def is_compressible(path: str, method: int, level: int) -> bool:
+        """
+        Check if the content of a file or folder is worth compressing: it is not a compressed type, and a sample
+        of its first bytes (of the first bytes of its files, for a folder) shrinks enough.
+
+        Parameters:
+        - path (str): The path of the file or folder.
+        - method (int): The compression method.
+        - level (int): The compression level.
+
+        Returns:
+        - bool: True if the blocks of the file or folder should be compressed.
+        """
+        if not os.path.isdir(path) and os.path.splitext(path)[1].lower() in DRIVE_COMPRESSED_SUFFIXES:
+            return False
+
+        try:
+            sample = DriveCompression.__sample(path)
+        except OSError as e:
+            logger.debug(f"Error sampling '{path}': {e}")
+            return False
+
+        return len(DriveCompression.compress(sample, method, level)) <= len(sample) * (1 - DRIVE_COMPRESSION_MIN_SAVING)
+
+    @staticmethod
+    def compress(payload: bytes, method: int, level: int) -> bytes:
+        """
+        Compress a block, or keep it as it is if it does not shrink.
+
+        Parameters:
+        - payload (bytes): The block content.
+        - method (int): The compression method.
+        - level (int): The compression level.
+
+        Returns:
+        - bytes: The method byte followed by the encoded block.
+        """
+        if method == DriveCompression.ZLIB:
+            compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+            compressed = compressor.compress(payload) + compressor.flush()
+        else:
+            compressed = lzma.compress(payload, format=lzma.FORMAT_RAW,
+                                       filters=[{"id": lzma.FILTER_LZMA2, "preset": level}])
+
+        if len(compressed) >= len(payload):
+            return bytes((DriveCompression.RAW,)) + payload
+        return bytes((method,)) + compressed
+
+    @staticmethod
+    def decompress(payload: bytes, block_size: int) -> bytes | None:
+        """
+        Decode a block encoded by `compress`. The decoded block is never larger than a block, so a payload that
+        would expand further (e.g. a decompression bomb) is rejected without being expanded.
+
+        Parameters:
+        - payload (bytes): The method byte followed by the encoded block.
+        - block_size (int): The block size of the transfer.
+
+        Returns:
+        - bytes | None: The block content; None if the block cannot be decoded.
+        """
+        if not payload:
+            return None
+
+        method, data = payload[0], payload[1:]
+        try:
+            if method == DriveCompression.RAW:
+                return bytes(data) if len(data) <= block_size else None
+            if method == DriveCompression.ZLIB:
+                decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+            elif method == DriveCompression.LZMA:
+                decompressor = lzma.LZMADecompressor(format=lzma.FORMAT_RAW, filters=[{"id": lzma.FILTER_LZMA2}])
+            else:
+                return None
+
+            # One byte more than a block tells a block that expands further; a block that is not decoded whole
+            # (truncated, or with bytes left) is rejected too
+            decoded = decompressor.decompress(data, block_size + 1)
+            if len(decoded) > block_size or not decompressor.eof or decompressor.unused_data:
+                return None
+            return decoded
+        except (zlib.error, lzma.LZMAError) as e:
+            logger.debug(f"Error decompressing a block: {e}")
+        return None
@@ -0,0 +1,542 @@
+import hashlib
+import os
+import stat
+import struct
+import zlib
+
+from share_drive.share_drive_helpers import DRIVE_DELTA_MAX_BLOCKS, DRIVE_DELTA_MIN_BLOCK_SIZE, \
+    DRIVE_DELTA_SLIDE_BUDGET, DRIVE_DELTA_DATA_SIZE, DRIVE_DELTA_SUFFIX, DRIVE_CONTENT_HASH_SIZE
+from share_drive.share_drive_helpers.drive_utils import DriveFileReader
+from coap_core.coap_utilities.coap_logger import logger, LogColor
+
+# Modulus of the Adler-32 sums
+ADLER_MODULUS = 65521
+
+# Size in bytes of the BLAKE2b digest of every block of a signature
+STRONG_SIZE = 8
+
+# The signature: the size, block size and digest of the file, then the weak and strong checksums of every block
+SIGNATURE_HEADER = struct.Struct(">QI16s")
+SIGNATURE_ENTRY = struct.Struct(">I8s")
+
+# The operations of a delta: copy a range of the old file, insert the bytes that follow, or end the file
+COPY = b"C"
+DATA = b"D"
+END = b"E"
+COPY_OPERATION = struct.Struct(">cQQ")
+DATA_OPERATION = struct.Struct(">cI")
+END_OPERATION = struct.Struct(">cQ16s")
+
+
+class DriveDelta:
+    """
+    DriveDelta computes the delta of a file against an older copy of it, rsync like, so a file that changed is sent
+    as the ranges to copy from the copy of the receiver and the bytes that are not found in it.
+
+    The signature of a file holds the weak (Adler-32) and strong (BLAKE2b) checksums of its blocks. The block size
+    grows with the file, so the signature never holds more than DRIVE_DELTA_MAX_BLOCKS blocks. The new file is
+    scanned for the blocks of the signature: at the offsets where the previous block ended first, then, after a
+    block that is not found, at every byte of the next block with a rolling checksum, so the blocks moved by
+    an insertion or a deletion are found again. Rolling is costly in Python, so it stops after
+    DRIVE_DELTA_SLIDE_BUDGET bytes and only the aligned offsets are checked afterward. The file is read through a
+    DriveFileReader window of a block and the bytes rolled over after it, never whole.
+
+    A file whose first bytes are the whole older copy (an append) is recognized by the digest of the signature,
+    without checking its blocks.
+
+    The delta is a stream of operations: COPY (offset and length in the older copy), DATA (length, then the bytes)
+    and END (size and digest of the new file), rebuilt by a DriveDeltaPatcher.
+
+    Author: Damir Denis-Tudor
+    """
+
+    @staticmethod
+    def get_block_size(size: int) -> int:
+        """
+        Get the block size of the signature of a file.
+
+        Parameters:
+        - size (int): The size of the file in bytes.
+
+        Returns:
+        - int: The block size in bytes.
+        """
+        return max(DRIVE_DELTA_MIN_BLOCK_SIZE, -(-size // DRIVE_DELTA_MAX_BLOCKS))
+
+    @staticmethod
+    def __strong(data) -> bytes:
+        return hashlib.blake2b(data, digest_size=STRONG_SIZE).digest()
+
+    @staticmethod
+    def signature(path: str) -> bytes:
+        """
+        Compute the signature of a file, reading it block by block in the same buffer.
+
+        Parameters:
+        - path (str): The path of the file.
+
+        Returns:
+        - bytes: The signature.
+
+        Raises:
+        - OSError: If the file shrinks while it is read.
+        """
+        with open(path, 'rb') as file:
+            size = os.fstat(file.fileno()).st_size
+            block_size = DriveDelta.get_block_size(size)
+            digest = hashlib.blake2b(digest_size=DRIVE_CONTENT_HASH_SIZE)
+            buffer = memoryview(bytearray(block_size))
+
+            entries = []
+            for offset in range(0, size, block_size):
+                block = buffer[:min(block_size, size - offset)]
+                if file.readinto(block) != len(block):
+                    raise OSError(f"{path} shrank while it was read")
+                digest.update(block)
+                entries.append(SIGNATURE_ENTRY.pack(zlib.adler32(block), DriveDelta.__strong(block)))
+        return SIGNATURE_HEADER.pack(size, block_size, digest.digest()) + b"".join(entries)
+
+    @staticmethod
+    def parse_signature(data: bytes | None) -> dict | None:
+        """
+        Parse a signature.
+
+        Parameters:
+        - data (bytes | None): The signature.
+
+        Returns:
+        - dict | None: The size, block size and digest of the file, and its blocks as (weak, strong) tuples;
+          None if the signature is invalid.
+        """
+        if not data or len(data) < SIGNATURE_HEADER.size:
+            return None
+
+        size, block_size, digest = SIGNATURE_HEADER.unpack_from(data)
+        if not block_size or len(data) != SIGNATURE_HEADER.size + -(-size // block_size) * SIGNATURE_ENTRY.size:
+            return None
+
+        return {
+            "size": size,
+            "block_size": block_size,
+            "digest": digest,
+            "blocks": list(SIGNATURE_ENTRY.iter_unpack(data[SIGNATURE_HEADER.size:]))
+        }
+
+    @staticmethod
+    def get_window_size(signature: dict) -> int:
+        """
+        Get the capacity of the DriveFileReader of a scan: a block, and the bytes rolled over after it.
+
+        Parameters:
+        - signature (dict): The parsed signature.
+
+        Returns:
+        - int: The capacity in bytes.
+        """
+        return signature["block_size"] + min(signature["block_size"], DRIVE_DELTA_SLIDE_BUDGET)
+
+    @staticmethod
+    def __digests(reader, prefix_size: int, whole: bool = True) -> tuple:
+        """
+        Hash a file in one pass: its first bytes, as many as the file of a signature, and the whole file.
+
+        Parameters:
+        - reader (DriveFileReader): The file.
+        - prefix_size (int): The number of first bytes hashed apart.
+        - whole (bool): Whether the whole file is hashed, or only its first bytes.
+
+        Returns:
+        - tuple: The digest of the first bytes (None if the file is shorter) and of the file (None if not whole).
+        """
+        digest, prefix = hashlib.blake2b(digest_size=DRIVE_CONTENT_HASH_SIZE), None
+        for offset in range(0, reader.size, reader.capacity):
+            view = reader.view(offset, reader.capacity)
+            if offset <= prefix_size < offset + len(view):
+                digest.update(view[:prefix_size - offset])
+                prefix = digest.digest()
+                if not whole:
+                    return prefix, None
+                digest.update(view[prefix_size - offset:])
+            else:
+                digest.update(view)
+
+        if prefix_size == reader.size:
+            prefix = digest.digest()
+        return prefix, digest.digest() if whole else None
+
+    @staticmethod
+    def match(signature: dict, reader, prefix: bytes = None):
+        """
+        Find the blocks of a signature in a file, reading at most a block and the bytes rolled over after it at once.
+
+        Parameters:
+        - signature (dict): The parsed signature.
+        - reader (DriveFileReader): The file, read through a window of `get_window_size` bytes.
+        - prefix (bytes): The digest of the first bytes of the file, as many as the file of the signature, if
+          already computed.
+
+        Yields:
+        - tuple: The offset in the file and the index in the signature of every block found, in the order of
+          the file, without overlapping.
+        """
+        size, block_size, blocks = signature["size"], signature["block_size"], signature["blocks"]
+        length = reader.size
+        if not size or not length:
+            return
+
+        # The file starts with the whole file of the signature
+        if prefix is None and size <= length:
+            prefix, _ = DriveDelta.__digests(reader, size, whole=False)
+        if prefix == signature["digest"]:
+            for index in range(len(blocks)):
+                yield index * block_size, index
+            return
+
+        # Only the whole blocks are looked for at any offset, the first one of equal blocks being kept
+        table = {}
+        for index, (weak, strong) in enumerate(blocks[:size // block_size]):
+            table.setdefault(weak, {}).setdefault(strong, index)
+
+        budget = DRIVE_DELTA_SLIDE_BUDGET
+        position = 0
+        while position + block_size <= length:
+            block = reader.view(position, block_size)
+            weak = zlib.adler32(block)
+            strongs = table.get(weak)
+            index = strongs.get(DriveDelta.__strong(block)) if strongs else None
+
+            if index is None and budget > 0:
+                # Roll the checksum over the next block, one byte at a time, within the window
+                start, last = position, min(position + block_size, position + budget, length - block_size)
+                window = reader.view(start, last - start + block_size)
+                a, b = weak & 0xFFFF, weak >> 16
+                while position < last:
+                    removed, added = window[position - start], window[position - start + block_size]
+                    a = (a - removed + added) % ADLER_MODULUS
+                    b = (b - block_size * removed + a - 1) % ADLER_MODULUS
+                    position += 1
+
+                    strongs = table.get((b << 16) | a)
+                    if strongs:
+                        index = strongs.get(DriveDelta.__strong(window[position - start:position - start + block_size]))
+                        if index is not None:
+                            break
+                budget -= position - start
+                if index is None:
+                    position = start
+
+            if index is None:
+                position += block_size
+                continue
+
+            yield position, index
+            position += block_size
+
+        # The last block of the signature is shorter, and only looked for at the end of the file
+        tail = size % block_size
+        if tail and length - tail >= position:
+            block = reader.view(length - tail, tail)
+            if (zlib.adler32(block), DriveDelta.__strong(block)) == blocks[-1]:
+                yield length - tail, len(blocks) - 1
+
+    @staticmethod
+    def __get_length(signature: dict, index: int) -> int:
+        return min(signature["block_size"], signature["size"] - index * signature["block_size"])
+
+    @staticmethod
+    def get_operations(signature: dict, reader) -> list[tuple]:
+        """
+        Compute the delta of a file against the older copy of the signature.
+
+        Parameters:
+        - signature (dict): The parsed signature of the older copy.
+        - reader (DriveFileReader): The new file, read through a window of `get_window_size` bytes.
+
+        Returns:
+        - list: The operations, as (COPY, offset in the older copy, length), (DATA, offset in the new file, length)
+          and (END, size, digest) tuples.
+
+        Raises:
+        - OSError: If the file changes while it is scanned.
+        """
+        length = reader.size
+        prefix, digest = DriveDelta.__digests(reader, signature["size"])
+
+        operations, position = [], 0
+        for offset, index in DriveDelta.match(signature, reader, prefix):
+            if offset > position:
+                operations.append((DATA, position, offset - position))
+
+            copy_offset, copy_length = index * signature["block_size"], DriveDelta.__get_length(signature, index)
+            if operations and operations[-1][0] == COPY and sum(operations[-1][1:]) == copy_offset:
+                operations[-1] = (COPY, operations[-1][1], operations[-1][2] + copy_length)
+            else:
+                operations.append((COPY, copy_offset, copy_length))
+            position = offset + copy_length
+        reader.check()
+
+        if length > position:
+            operations.append((DATA, position, length - position))
+        operations.append((END, length, digest))
+        return operations
+
+    @staticmethod
+    def get_rebuild_operations(signature: dict, reader) -> list[tuple]:
+        """
+        Compute how the file of a signature is rebuilt from an older copy of it: the blocks found in the copy
+        are copied, the others must be fetched from the file of the signature.
+
+        Parameters:
+        - signature (dict): The parsed signature of the new file.
+        - reader (DriveFileReader): The older copy, read through a window of `get_window_size` bytes.
+
+        Returns:
+        - list: The operations, as (COPY, offset in the older copy, length), (DATA, offset in the new file, length)
+          and (END, size, digest) tuples.
+
+        Raises:
+        - OSError: If the older copy changes while it is scanned.
+        """
+        found = {}
+        for offset, index in DriveDelta.match(signature, reader):
+            found.setdefault(signature["blocks"][index], offset)
+        reader.check()
+
+        operations = []
+        for index, block in enumerate(signature["blocks"]):
+            offset, length = found.get(block), DriveDelta.__get_length(signature, index)
+            if offset is not None and operations and operations[-1][0] == COPY \
+                    and sum(operations[-1][1:]) == offset:
+                operations[-1] = (COPY, operations[-1][1], operations[-1][2] + length)
+            elif offset is not None:
+                operations.append((COPY, offset, length))
+            elif operations and operations[-1][0] == DATA:
+                operations[-1] = (DATA, operations[-1][1], operations[-1][2] + length)
+            else:
+                operations.append((DATA, index * signature["block_size"], length))
+
+        operations.append((END, signature["size"], signature["digest"]))
+        return operations
+
+    @staticmethod
+    def get_size(operations: list[tuple]) -> int:
+        """
+        Compute the size of the encoded delta.
+
+        Parameters:
+        - operations (list): The operations of the delta.
+
+        Returns:
+        - int: The size in bytes.
+        """
+        size = 0
+        for operation, _, length in operations:
+            if operation == COPY:
+                size += COPY_OPERATION.size
+            elif operation == DATA:
+                size += length + -(-length // DRIVE_DELTA_DATA_SIZE) * DATA_OPERATION.size
+            else:
+                size += END_OPERATION.size
+        return size
+
+    @staticmethod
+    def encode_copy(offset: int, length: int) -> bytes:
+        return COPY_OPERATION.pack(COPY, offset, length)
+
+    @staticmethod
+    def encode_data(data) -> bytes:
+        return DATA_OPERATION.pack(DATA, len(data)) + data
+
+    @staticmethod
+    def encode_end(size: int, digest: bytes) -> bytes:
+        return END_OPERATION.pack(END, size, digest)
+
+    @staticmethod
+    def split_on_packets(operations: list[tuple], path: str, snapshot: os.stat_result, block_size: int):
+        """
+        Generate the encoded delta of a file in blocks of the specified size, reading the bytes of its DATA
+        operations as they are sent.
+
+        Parameters:
+        - operations (list): The operations of the delta, as computed by `get_operations`.
+        - path (str): The path of the new file.
+        - snapshot (os.stat_result): The status of the new file when its delta was computed.
+        - block_size (int): The size of each packet in bytes.
+
+        Yields:
+        - bytes: Blocks of the delta; only the last one may be shorter.
+
+        Raises:
+        - OSError: If the file changed since its delta was computed, so the transfer fails instead of sending
+          bytes of another version.
+        """
+        buffer = bytearray()
+        with DriveFileReader(path, DRIVE_DELTA_DATA_SIZE, snapshot) as reader:
+            for operation, offset, length in operations:
+                if operation == COPY:
+                    buffer += DriveDelta.encode_copy(offset, length)
+                elif operation == DATA:
+                    for start in range(offset, offset + length, DRIVE_DELTA_DATA_SIZE):
+                        data = reader.view(start, min(DRIVE_DELTA_DATA_SIZE, offset + length - start))
+                        buffer += DriveDelta.encode_data(data)
+                        while len(buffer) >= block_size:
+                            yield bytes(buffer[:block_size])
+                            del buffer[:block_size]
+                else:
+                    reader.check()
+                    buffer += DriveDelta.encode_end(offset, length)
+
+                while len(buffer) >= block_size:
+                    yield bytes(buffer[:block_size])
+                    del buffer[:block_size]
+
+        if buffer:
+            yield bytes(buffer)
+
+
+class DriveDeltaPatcher:
+    """
+    DriveDeltaPatcher rebuilds a file from its older copy and a delta, as the bytes of the delta arrive, in order.
+
+    The new file is written next to the older copy, with the DRIVE_DELTA_SUFFIX suffix, and replaces it only once
+    its size and digest match the END operation; a delta that does not apply leaves the older copy untouched.
+
+    Author: Damir Denis-Tudor
+    """
+
+    def __init__(self, base_path: str, path: str):
+        """
+        Constructor for DriveDeltaPatcher.
+
+        Parameters:
+        - base_path (str): The path of the older copy.
+        - path (str): The path of the rebuilt file, replaced when the delta is applied.
+        """
+        self.__path = path
+        self.__buffer = bytearray()
+        self.__remaining = 0
+        self.__written = 0
+        self.__digest = hashlib.blake2b(digest_size=DRIVE_CONTENT_HASH_SIZE)
+        self.__base = None
+        self.__file = None
+
+        self.finished = False
+        self.failed = False
+
+        try:
+            self.__base = open(base_path, 'rb')
+            self.__file = open(path + DRIVE_DELTA_SUFFIX, 'wb')
+            os.chmod(self.__file.name, stat.S_IMODE(os.fstat(self.__base.fileno()).st_mode))
+        except OSError as e:
+            logger.log(f"> The delta of {path} cannot be applied: {e}", LogColor.RED)
+            self.failed = True
+            self.discard()
+
+    def feed(self, data: bytes):
+        """
+        Apply the next bytes of the delta.
+
+        Parameters:
+        - data (bytes): The bytes, following the ones fed before.
+        """
+        if self.finished or self.failed:
+            return
+
+        self.__buffer += data
+        try:
+            self.__process()
+        except (ValueError, OSError, struct.error) as e:
+            logger.log(f"> The delta of {self.__path} cannot be applied: {e}", LogColor.RED)
+            self.failed = True
+            self.discard()
+
+    def __process(self):
+        """
+        Consume the buffered operations.
+        """
+        while self.__buffer or self.__remaining:
+            if self.__remaining:
+                length = min(self.__remaining, len(self.__buffer))
+                if not length:
+                    return
+                self.__write(self.__buffer[:length])
+                del self.__buffer[:length]
+                self.__remaining -= length
+                continue
+
+            operation = bytes(self.__buffer[:1])
+            if operation == COPY:
+                if len(self.__buffer) < COPY_OPERATION.size:
+                    return
+                _, offset, length = COPY_OPERATION.unpack_from(self.__buffer)
+                del self.__buffer[:COPY_OPERATION.size]
+                self.__copy(offset, length)
+            elif operation == DATA:
+                if len(self.__buffer) < DATA_OPERATION.size:
+                    return
+                self.__remaining = DATA_OPERATION.unpack_from(self.__buffer)[1]
+                del self.__buffer[:DATA_OPERATION.size]
+            elif operation == END:
+                if len(self.__buffer) < END_OPERATION.size:
+                    return
+                _, size, digest = END_OPERATION.unpack_from(self.__buffer)
+                self.__finish(size, digest)
+                return
+            else:
+                raise ValueError(f"unknown operation {operation!r}")
+
+    def __write(self, data):
+        self.__file.write(data)
+        self.__digest.update(data)
+        self.__written += len(data)
+
+    def __copy(self, offset: int, length: int):
+        """
+        Copy a range of the older copy to the new file.
+
+        Parameters:
+        - offset (int): The offset of the range in the older copy.
+        - length (int): The length of the range.
+        """
+        while length:
+            data = os.pread(self.__base.fileno(), min(length, DRIVE_DELTA_DATA_SIZE), offset)
+            if not data:
+                raise ValueError("the range to copy is outside the older copy")
+            self.__write(data)
+            offset += len(data)
+            length -= len(data)
+
+    def __finish(self, size: int, digest: bytes):
+        """
+        Check the new file against its size and digest, and replace the older copy with it.
+
+        Parameters:
+        - size (int): The size of the new file.
+        - digest (bytes): The digest of the new file.
+        """
+        if size != self.__written or digest != self.__digest.digest():
+            raise ValueError("the rebuilt file does not match")
+
+        self.__file.close()
+        self.__base.close()
+        os.replace(self.__file.name, self.__path)
+        self.finished = True
+
+    def close(self):
+        """
+        Close the files, if any.
+        """
+        for file in (self.__file, self.__base):
+            if file:
+                file.close()
+
+    def discard(self):
+        """
+        Remove the new file, keeping the older copy.
+        """
+        self.close()
+        if self.__file and not self.finished and os.path.exists(self.__file.name):
+            try:
+                os.remove(self.__file.name)
+            except OSError as e:
+                logger.debug(f"Error removing '{self.__file.name}': {e}")
@@ -0,0 +1,157 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from contextlib import closing
+
+from share_drive.share_drive_helpers import DRIVE_ETAG_SIZE
+from coap_core.coap_utilities.coap_singleton import CoapSingletonBase
+
+# Seconds a process waits for the index locked by another one
+INDEX_TIMEOUT = 30
+
+# Bytes of a file hashed at once
+READ_SIZE = 1024 * 1024
+
+
+class DriveETag(CoapSingletonBase):
+    """
+    DriveETag gives the ETag of a file: the BLAKE2b digest of its content, so the same bytes have the same ETag on
+    both sides of a transfer, whatever their modification time. The ETag tells a partial transfer which source
+    it continues (see DriveResume), and a download whether the copy of the client is still current.
+
+    The ETags are cached with the size and modification time of the file they were computed for, so a file is
+    hashed again only once it changed. The cache may be kept in an SQLite index shared by the processes of the side,
+    so the ETags outlive them.
+
+    Author: Damir Denis-Tudor
+    """
+
+    def __init__(self):
+        """
+        Constructor for DriveETag. The ETags are cached in memory only until `set_index` is called.
+        """
+        self.__path = None
+
+        # ETags by path, with the size and modification time of the file they were computed for
+        self.__etags: dict[str, tuple[int, int, int]] = {}
+        self.__lock = threading.Lock()
+
+        # Every thread has its own connection to the index
+        self.__local = threading.local()
+
+    def set_index(self, path: str):
+        """
+        Keep the ETags in an index.
+
+        Parameters:
+        - path (str): The path of the database, created if it does not exist.
+        """
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.__path = path
+
+        # The connection is not kept, as the processes of the server are forked afterward
+        with closing(sqlite3.connect(path, timeout=INDEX_TIMEOUT)) as db, db:
+            db.execute("CREATE TABLE IF NOT EXISTS etags (path TEXT PRIMARY KEY, size INTEGER, mtime INTEGER, "
+                       "etag BLOB)")
+
+    def __connect(self) -> sqlite3.Connection:
+        """
+        Get the connection of this thread to the index, used as a context manager for every transaction.
+
+        Returns:
+        - sqlite3.Connection: The connection.
+        """
+        db = getattr(self.__local, "db", None)
+        if db is None:
+            db = self.__local.db = sqlite3.connect(self.__path, timeout=INDEX_TIMEOUT)
+        return db
+
+    def __lookup(self, path: str, stat: os.stat_result) -> int | None:
+        """
+        Get the cached ETag of a file, if it was computed for its current size and modification time.
+
+        Parameters:
+        - path (str): The absolute path of the file.
+        - stat (os.stat_result): The current status of the file.
+
+        Returns:
+        - int | None: The ETag; None if it is not cached or the file changed since.
+        """
+        with self.__lock:
+            entry = self.__etags.get(path)
+
+        if entry is None and self.__path is not None:
+            row = self.__connect().execute("SELECT size, mtime, etag FROM etags WHERE path = ?", (path,)).fetchone()
+            entry = row and (row[0], row[1], int.from_bytes(row[2], 'big'))
+
+        if entry is None or (entry[0], entry[1]) != (stat.st_size, stat.st_mtime_ns):
+            return None
+
+        with self.__lock:
+            self.__etags[path] = entry
+        return entry[2]
+
+    def get(self, path: str) -> int:
+        """
+        Get the ETag of a file, hashing it if it changed since its ETag was cached.
+
+        Parameters:
+        - path (str): The path of the file.
+
+        Returns:
+        - int: The ETag, DRIVE_ETAG_SIZE bytes long.
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        etag = self.__lookup(path, stat)
+        if etag is not None:
+            return etag
+
+        # The file is read in the same buffer, as it may shrink meanwhile
+        digest = hashlib.blake2b(digest_size=DRIVE_ETAG_SIZE)
+        buffer = memoryview(bytearray(READ_SIZE))
+        with open(path, 'rb') as file:
+            while length := file.readinto(buffer):
+                digest.update(buffer[:length])
+        etag = int.from_bytes(digest.digest(), 'big')
+
+        # A file written while it was hashed is hashed again next time
+        current = os.stat(path)
+        if (current.st_size, current.st_mtime_ns) == (stat.st_size, stat.st_mtime_ns):
+            self.put(path, etag, stat)
+        return etag
+
+    def cached(self, path: str) -> int | None:
+        """
+        Get the ETag of a file only if it is cached for its current content, without hashing it.
+
+        Parameters:
+        - path (str): The path of the file.
+
+        Returns:
+        - int | None: The ETag; None if it is not cached or the file changed since.
+        """
+        path = os.path.abspath(path)
+        return self.__lookup(path, os.stat(path))
+
+    def put(self, path: str, etag: int, stat: os.stat_result = None):
+        """
+        Cache the ETag of a file, known without hashing it (e.g. the one of a file that was just received).
+
+        Parameters:
+        - path (str): The path of the file.
+        - etag (int): The ETag of the file.
+        - stat (os.stat_result): The status of the file the ETag is of; the current one by default.
+        """
+        path = os.path.abspath(path)
+        stat = stat or os.stat(path)
+        entry = (stat.st_size, stat.st_mtime_ns, etag)
+
+        with self.__lock:
+            self.__etags[path] = entry
+
+        if self.__path is not None:
+            with self.__connect() as db:
+                db.execute("INSERT OR REPLACE INTO etags VALUES (?, ?, ?, ?)",
+                           (path, stat.st_size, stat.st_mtime_ns, etag.to_bytes(DRIVE_ETAG_SIZE, 'big')))
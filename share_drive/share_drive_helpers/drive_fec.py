@@ -0,0 +1,124 @@
+class DriveFec:
+    """
+    DriveFec provides the forward error correction used by Q-Block transfers.
+
+    The data blocks are split in groups of K blocks, and every group is followed by M parity blocks.
+    The parity blocks are interleaved: the parity block j is the XOR of the blocks i of the group with
+    i % M == j, so up to M missing blocks of a group can be rebuilt, as long as they have different indexes
+    modulo M. Each block is prefixed with its length before the XOR, so that a shorter last block of the
+    file is rebuilt with its exact length.
+
+    Author: Damir Denis-Tudor
+    """
+
+    @staticmethod
+    def encode_option(group_size: int, parity_count: int) -> int:
+        """
+        Encode the FEC parameters into the value of the FEC option.
+
+        Parameters:
+        - group_size (int): The number of data blocks in a group (K).
+        - parity_count (int): The number of parity blocks of a group (M).
+
+        Returns:
+        - int: The option value.
+        """
+        return (group_size << 8) | parity_count
+
+    @staticmethod
+    def decode_option(option: int) -> tuple[int, int] | None:
+        """
+        Decode the value of the FEC option, validating the parameters.
+
+        Parameters:
+        - option (int): The option value.
+
+        Returns:
+        - tuple | None: The group size (K) and parity count (M); None if the parameters are invalid.
+        """
+        if not option:
+            return None
+
+        group_size, parity_count = (option >> 8) & 0xFF, option & 0xFF
+        if not 1 <= parity_count <= group_size:
+            return None
+        return group_size, parity_count
+
+    @staticmethod
+    def __xor(buffers: list[bytes], length: int) -> bytes:
+        """
+        XOR a list of buffers, padding them with zeros to the same length.
+
+        Parameters:
+        - buffers (list): The buffers.
+        - length (int): The length of the result.
+
+        Returns:
+        - bytes: The XOR of the buffers.
+        """
+        result = 0
+        for buffer in buffers:
+            result ^= int.from_bytes(buffer.ljust(length, b"\0"), 'big')
+        return result.to_bytes(length, 'big')
+
+    @staticmethod
+    def group_members(group: int, parity_index: int, group_size: int, parity_count: int,
+                      total_packets: int) -> list[int]:
+        """
+        Get the block numbers covered by a parity block.
+
+        Parameters:
+        - group (int): The group number.
+        - parity_index (int): The index of the parity block within the group.
+        - group_size (int): The number of data blocks in a group (K).
+        - parity_count (int): The number of parity blocks of a group (M).
+        - total_packets (int): The total number of data blocks of the file.
+
+        Returns:
+        - list: The covered block numbers.
+        """
+        first = group * group_size
+        last = min(first + group_size, total_packets)
+        return list(range(first + parity_index, last, parity_count))
+
+    @staticmethod
+    def make_parity(blocks: list[bytes], parity_count: int) -> list[bytes]:
+        """
+        Compute the parity blocks of a group.
+
+        Parameters:
+        - blocks (list): The data blocks of the group, in order.
+        - parity_count (int): The number of parity blocks of the group (M).
+
+        Returns:
+        - list: The parity blocks, each as long as the longest length-prefixed block it covers.
+        """
+        prefixed = [len(block).to_bytes(2, 'big') + block for block in blocks]
+
+        parity = []
+        for parity_index in range(min(parity_count, len(prefixed))):
+            covered = prefixed[parity_index::parity_count]
+            parity.append(DriveFec.__xor(covered, max(map(len, covered))))
+        return parity
+
+    @staticmethod
+    def recover(parity: bytes, received: list[bytes]) -> bytes | None:
+        """
+        Rebuild the single missing block covered by a parity block.
+
+        Parameters:
+        - parity (bytes): The parity block.
+        - received (list): The received data blocks covered by the parity block.
+
+        Returns:
+        - bytes | None: The missing block; None if the parity block is corrupted.
+        """
+        prefixed = [len(block).to_bytes(2, 'big') + block for block in received]
+        if any(len(block) > len(parity) for block in prefixed):
+            return None
+        missing = DriveFec.__xor(prefixed + [parity], len(parity))
+
+        length = int.from_bytes(missing[:2], 'big')
+        if length > len(missing) - 2:
+            return None
+        return missing[2:2 + length]
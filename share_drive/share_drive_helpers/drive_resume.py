@@ -0,0 +1,106 @@
+import json
+import os
+
+from share_drive.share_drive_helpers import DRIVE_RESUME_SUFFIX
+from coap_core.coap_utilities.coap_logger import logger
+
+
+class DriveResume:
+    """
+    DriveResume keeps the progress of a partial transfer, so an interrupted transfer continues from the next
+    missing block instead of starting over.
+
+    The progress is kept in a JSON sidecar file next to the target file, holding:
+    - path: the remote path of the transfer;
+    - etag: the ETag of the source file (see DriveETag), the transfer resumes only if the source did not change;
+    - block_size, total_packets: the layout of the blocks;
+    - next_block: the number of blocks written contiguously to the target file.
+
+    Author: Damir Denis-Tudor
+    """
+
+    @staticmethod
+    def sidecar_path(path: str) -> str:
+        """
+        Get the path of the sidecar file of a target file.
+
+        Parameters:
+        - path (str): The path of the target file.
+
+        Returns:
+        - str: The path of the sidecar file.
+        """
+        return path + DRIVE_RESUME_SUFFIX
+
+    @staticmethod
+    def load(path: str) -> dict | None:
+        """
+        Load the progress of a partial transfer.
+
+        Parameters:
+        - path (str): The path of the target file.
+
+        Returns:
+        - dict | None: The saved progress; None if there is none or it cannot be read.
+        """
+        try:
+            with open(DriveResume.sidecar_path(path), 'r') as file:
+                state = json.load(file)
+        except (OSError, ValueError):
+            return None
+
+        if not isinstance(state, dict) or not {"etag", "block_size", "total_packets", "next_block"} <= state.keys():
+            return None
+        return state
+
+    @staticmethod
+    def save(path: str, state: dict):
+        """
+        Save the progress of a partial transfer, replacing the sidecar file atomically.
+
+        Parameters:
+        - path (str): The path of the target file.
+        - state (dict): The progress to be saved.
+        """
+        sidecar = DriveResume.sidecar_path(path)
+        try:
+            with open(sidecar + ".tmp", 'w') as file:
+                json.dump(state, file)
+            os.replace(sidecar + ".tmp", sidecar)
+        except OSError as e:
+            logger.debug(f"Error saving the progress of '{path}': {e}")
+
+    @staticmethod
+    def discard(path: str):
+        """
+        Delete the progress of a transfer, if any.
+
+        Parameters:
+        - path (str): The path of the target file.
+        """
+        if os.path.exists(DriveResume.sidecar_path(path)):
+            os.remove(DriveResume.sidecar_path(path))
+
+    @staticmethod
+    def is_resumable(state: dict | None, path: str, etag: int, block_size: int, total_packets: int,
+                     first_block: int) -> bool:
+        """
+        Check if a transfer starting at a given block continues the saved progress.
+
+        Parameters:
+        - state (dict | None): The saved progress.
+        - path (str): The path of the target file.
+        - etag (int): The ETag of the source file.
+        - block_size (int): The block size of the transfer.
+        - total_packets (int): The total number of blocks of the transfer.
+        - first_block (int): The first block that will be received.
+
+        Returns:
+        - bool: True if the blocks before the first block are already in the target file.
+        """
+        if not state or not os.path.isfile(path):
+            return False
+
+        return (state["etag"] == etag and state["block_size"] == block_size
+                and state["total_packets"] == total_packets and first_block <= state["next_block"]
+                and os.path.getsize(path) >= first_block * block_size)
@@ -1,13 +1,30 @@
+import hashlib
 import os
+import queue
+import threading
+from functools import partial
+from itertools import islice
 
-from coap_core.coap_packet.coap_config import CoapOptionDelta
+from coap_core.coap_packet.coap_config import CoapOptionDelta, CoapType, CoapContentFormat
 from coap_core.coap_packet.coap_packet import CoapPacket
+from coap_core.coap_transaction import MAX_RETRANSMISSION_WAIT
 from coap_core.coap_transaction.coap_transaction_pool import CoapTransactionPool
 from coap_core.coap_utilities.coap_logger import logger, LogColor
 from coap_core.coap_utilities.coap_singleton import CoapSingletonBase
 from coap_core.coap_utilities.coap_timer import CoapTimer
+from share_drive.share_drive_helpers import DRIVE_Q_BLOCK_MIN_ROUND, DRIVE_BLOCK_SIZE, DRIVE_CONTENT_HASH_SIZE, \
+    DRIVE_MANIFEST_QUERY, DRIVE_DELTA_SIGNATURE_QUERY
+from share_drive.share_drive_helpers.drive_buffer_pool import DriveBufferPool
+from share_drive.share_drive_helpers.drive_chunks import DriveChunker
+from share_drive.share_drive_helpers.drive_archive import DriveArchive
+from share_drive.share_drive_helpers.drive_archive_cache import DriveArchiveCache
+from share_drive.share_drive_helpers.drive_compression import DriveCompression
+from share_drive.share_drive_helpers.drive_delta import DriveDelta
+from share_drive.share_drive_helpers.drive_etag import DriveETag
+from share_drive.share_drive_helpers.drive_fec import DriveFec
+from share_drive.share_drive_helpers.drive_read_ahead import DriveReadAhead
 from share_drive.share_drive_helpers.drive_templates import DriveTemplates
-from share_drive.share_drive_helpers.drive_utils import DriveUtilities
+from share_drive.share_drive_helpers.drive_utils import DriveUtilities, DriveFileReader
 
 
 class DriveSpliter(CoapSingletonBase):
@@ -15,6 +32,45 @@ class DriveSpliter(CoapSingletonBase):
     DriveSpliter is a class responsible for splitting and sending CoAP packets based on certain conditions.
     It utilizes CoapTransactionPool and CoapTimer for managing transactions and timing, respectively.
 
+    Two transfer modes are supported, chosen by the block option of the request:
+    - Block1/Block2: every block is a CON with its own transaction;
+    - Q-Block1/Q-Block2: the blocks are sent in rounds of NON blocks, the last block of a round being a CON.
+      The receiver answers each round with the list of missing blocks, and only those are sent again.
+      If the request carries the FEC option, every group of K blocks is followed by M parity blocks,
+      so the receiver can rebuild lost blocks without waiting for the next round.
+
+    The block size is the one asked by the request (SZX, or the LOCAL_BLOCK_SIZE option for blocks larger than
+    1024 bytes), capped to the maximum block size of this side.
+
+    Interrupted transfers resume: a download request asks for its first block with the NUM of the block option,
+    valid only if its If-Match option still matches the ETag of the file; an upload starts at the resume point
+    answered by the receiver to the upload request. The first block sent carries the total number of blocks and
+    the ETag, so the receiver can check that it continues the same file.
+
+    A download request with a range in its Uri-Query option ("bytes=first-last", "bytes=-count" for the tail,
+    or "blocks=first-last") reads only a part of the file: only the blocks of the range are sent, the first and
+    the last one trimmed to the range.
+
+    The blocks are read ahead of the sender by a thread of their own (see DriveReadAhead), so disk reads and
+    network sends overlap. The blocks are hashed with BLAKE2b as they are read, and the last block carries
+    the digest of the bytes of the transfer in the CONTENT_HASH option, so the receiver checks them without
+    reading the file again.
+
+    If the request offers the COMPRESSION option, the blocks of a compressible file are compressed one by one
+    after they are hashed (see DriveCompression), and carry the option so the receiver decodes them.
+
+    A download request with the `signature` Uri-Query reads the signature of the file (see DriveDelta). An upload
+    given the signature of the copy of the receiver (`set_delta_signature`) sends the delta of the file against
+    that copy instead of the file (content format APPLICATION_DELTA), from its first block.
+
+    Bytes computed by the caller (`set_content`), such as the recipe of a file or the chunks missing from the
+    server, are sent instead of the file. An upload given the chunks missing from the receiver
+    (`set_chunk_upload`) sends those chunks whole and the others by their digest (content format
+    APPLICATION_CHUNKS, see DriveChunker), from its first block.
+
+    A transfer canceled by the receiver (an empty RST with the token of the transfer) stops before its next block,
+    even in the middle of a round; the bytes that were never sent are counted in the saved bytes.
+
     Author: Damir Denis-Tudor
     """
 
@@ -22,10 +78,260 @@ class DriveSpliter(CoapSingletonBase):
         """
         Constructor for DriveSpliter.
 
-        Initializes the transaction pool and work timer.
+        Initializes the transaction pool and the queues of missing blocks reports.
         """
         self.__transaction_pool = CoapTransactionPool()
-        self.__work_timer = CoapTimer()
+
+        # Reports of missing blocks for each Q-Block transfer in progress
+        self.__reports: dict[tuple, queue.Queue] = {}
+        self.__reports_lock = threading.Lock()
+
+        # Blocks where the uploads in progress resume, as answered by the receiver
+        self.__resume_points: dict[tuple, int] = {}
+
+        # Signatures of the copies of the receivers, for the uploads sent as a delta
+        self.__delta_signatures: dict[tuple, dict] = {}
+
+        # Bytes sent instead of the file, and recipes of the uploads sent as the chunks missing from the receiver
+        self.__contents: dict[tuple, bytes] = {}
+        self.__chunk_uploads: dict[tuple, tuple] = {}
+
+        self.__max_block_size = DRIVE_BLOCK_SIZE
+
+        # Bytes not sent because the transfers were stopped before their end
+        self.__saved_bytes = 0
+
+    def set_max_block_size(self, block_size: int):
+        """
+        Set the largest block size that this side sends or accepts.
+
+        Parameters:
+        - block_size (int): The block size in bytes; above 1024 bytes the local block size mode is used.
+        """
+        self.__max_block_size = block_size
+
+    def get_saved_bytes(self) -> int:
+        """
+        Get the number of bytes not sent because the transfers were canceled or failed before their end.
+
+        Returns:
+        - int: The number of bytes.
+        """
+        return self.__saved_bytes
+
+    def get_max_block_size(self) -> int:
+        return self.__max_block_size
+
+    @staticmethod
+    def encode_block_size(block_size: int) -> tuple[int, int | None]:
+        """
+        Get the block option fields that ask for a block size.
+
+        Block sizes up to 1024 bytes are rounded down to a power of two and encoded in SZX; larger ones
+        are sent in the LOCAL_BLOCK_SIZE option, with SZX = 6.
+
+        Parameters:
+        - block_size (int): The block size in bytes.
+
+        Returns:
+        - tuple: The SZX and the value of the LOCAL_BLOCK_SIZE option, None if not needed.
+        """
+        if block_size > DRIVE_BLOCK_SIZE:
+            return 6, block_size
+        return max(0, min(6, block_size.bit_length() - 5)), None
+
+    @staticmethod
+    def get_requested_block_size(request: CoapPacket) -> int:
+        """
+        Get the block size asked by a transfer request.
+
+        Parameters:
+        - request (CoapPacket): The download or upload request.
+
+        Returns:
+        - int: The block size in bytes.
+        """
+        local_block_size = request.options.get(CoapOptionDelta.LOCAL_BLOCK_SIZE.value)
+        if local_block_size:
+            return local_block_size
+        return CoapPacket.decode_option_block(request.options[request.get_option_code()])["BLOCK_SIZE"]
+
+    def get_block_size(self, request: CoapPacket) -> int:
+        """
+        Get the block size of a transfer: the one asked by the request, capped to the maximum of this side.
+
+        Parameters:
+        - request (CoapPacket): The download or upload request.
+
+        Returns:
+        - int: The block size in bytes.
+        """
+        szx, local_block_size = self.encode_block_size(min(self.get_requested_block_size(request),
+                                                           self.__max_block_size))
+        return local_block_size or 2 ** (szx + 4)
+
+    @staticmethod
+    def get_requested_range(request: CoapPacket, file_size: int, block_size: int) -> tuple[int, int] | None:
+        """
+        Get the byte range asked by the Uri-Query option of a download request.
+
+        Parameters:
+        - request (CoapPacket): The download request.
+        - file_size (int): The size of the file in bytes.
+        - block_size (int): The block size of the transfer, for ranges of blocks.
+
+        Returns:
+        - tuple | None: The first and last byte of the range, included; None if the range is invalid or
+          outside the file.
+        """
+        unit, _, bounds = request.options.get(CoapOptionDelta.URI_QUERY.value, "").partition("=")
+        first, _, last = bounds.partition("-")
+        if unit not in ("bytes", "blocks") or not (first + last).isdigit() or not (first or unit == "bytes"):
+            return None
+
+        if not first:
+            # The last bytes of the file
+            first, last = max(0, file_size - int(last)), file_size - 1
+        elif unit == "blocks":
+            first, last = int(first) * block_size, (int(last) + 1) * block_size - 1 if last else file_size - 1
+        else:
+            first, last = int(first), int(last) if last else file_size - 1
+
+        last = min(last, file_size - 1)
+        if not 0 <= first <= last:
+            return None
+        return first, last
+
+    @staticmethod
+    def __make_block(request: CoapPacket, path: str, num: int, payload: bytes, total_packets: int,
+                     block_fields: dict, message_id: int):
+        """
+        Create a CoAP response packet carrying a block of the file.
+
+        Parameters:
+        - request (CoapPacket): The original CoAP packet that triggered the splitting and sending.
+        - path (str): The path of the file being sent.
+        - num (int): The block number.
+        - payload (bytes): The block content.
+        - total_packets (int): The total number of blocks.
+        - block_fields (dict): The decoded block option of the request.
+        - message_id (int): The message ID of the response.
+
+        Returns:
+        - CoapPacket: The response packet.
+        """
+        send_block_option = request.get_option_code()
+
+        response = DriveTemplates.CONTENT_RESPONSE.value_with(
+            request.token, message_id,
+            request.skt, request.sender_ip_port
+        )
+        response.payload = payload
+        response.options[CoapOptionDelta.LOCATION_PATH.value] = os.path.basename(path)
+        if "CONTENT_FORMAT" in block_fields:
+            response.options[CoapOptionDelta.CONTENT_FORMAT.value] = block_fields["CONTENT_FORMAT"]
+        if "COMPRESSION" in block_fields:
+            response.options[CoapOptionDelta.COMPRESSION.value] = block_fields["COMPRESSION"]
+        response.set_option_block(send_block_option, num, int(num + 1 != total_packets), block_fields["SZX"])
+
+        # For the first response send the total number of expected packets and the ETag of the file
+        if num == block_fields["FIRST_BLOCK"]:
+            response.options[request.get_size_code_based_on_option()] = total_packets
+            response.options[CoapOptionDelta.ETAG.value] = block_fields["ETAG"]
+        if block_fields.get("LOCAL_BLOCK_SIZE"):
+            response.options[CoapOptionDelta.LOCAL_BLOCK_SIZE.value] = block_fields["LOCAL_BLOCK_SIZE"]
+
+        # The last block is read after all the others, so the digest covers all the bytes of the transfer
+        if num + 1 == total_packets and "CONTENT_HASH" in block_fields:
+            response.options[CoapOptionDelta.CONTENT_HASH.value] = block_fields["CONTENT_HASH"].digest()
+
+        return response
+
+    @staticmethod
+    def __hash_blocks(generator, content_hash):
+        """
+        Hash the blocks of a file as they are read.
+
+        Parameters:
+        - generator: The generator of the file blocks.
+        - content_hash: The hash updated with every block.
+
+        Yields:
+        - bytes: The blocks of the file.
+        """
+        try:
+            for payload in generator:
+                content_hash.update(payload)
+                yield payload
+        finally:
+            generator.close()
+
+    @staticmethod
+    def __compress_blocks(generator, compression: tuple, block_fields: dict):
+        """
+        Compress the blocks of a file as they are read.
+
+        Parameters:
+        - generator: The generator of the file blocks.
+        - compression (tuple): The compression method and level.
+        - block_fields (dict): The decoded block option of the request, counting the compressed bytes.
+
+        Yields:
+        - bytes: The compressed blocks.
+        """
+        try:
+            for payload in generator:
+                compressed = DriveCompression.compress(payload, *compression)
+                DriveBufferPool().release(payload)
+                payload = compressed
+                block_fields["COMPRESSED_BYTES"] += len(payload)
+                yield payload
+        finally:
+            generator.close()
+
+    @staticmethod
+    def __make_parity_block(request: CoapPacket, path: str, group: int, parity_index: int, payload: bytes,
+                            total_packets: int, block_fields: dict, message_id: int):
+        """
+        Create a NON CoAP response packet carrying a parity block of a group.
+
+        Parameters:
+        - request (CoapPacket): The original CoAP packet that triggered the splitting and sending.
+        - path (str): The path of the file being sent.
+        - group (int): The group number, sent as the NUM of the block option.
+        - parity_index (int): The index of the parity block within the group.
+        - payload (bytes): The parity block content.
+        - total_packets (int): The total number of data blocks, needed to rebuild the last blocks.
+        - block_fields (dict): The decoded block option of the request.
+        - message_id (int): The message ID of the response.
+
+        Returns:
+        - CoapPacket: The parity packet.
+        """
+        response = DriveTemplates.CONTENT_RESPONSE.value_with(
+            request.token, message_id,
+            request.skt, request.sender_ip_port
+        )
+        response.message_type = CoapType.NON.value
+        response.payload = payload
+        response.options[CoapOptionDelta.LOCATION_PATH.value] = os.path.basename(path)
+        if "CONTENT_FORMAT" in block_fields:
+            response.options[CoapOptionDelta.CONTENT_FORMAT.value] = block_fields["CONTENT_FORMAT"]
+        if "COMPRESSION" in block_fields:
+            response.options[CoapOptionDelta.COMPRESSION.value] = block_fields["COMPRESSION"]
+        response.set_option_block(request.get_option_code(), group, 1, block_fields["SZX"])
+        response.options[request.get_size_code_based_on_option()] = total_packets
+        response.options[CoapOptionDelta.FEC.value] = request.options[CoapOptionDelta.FEC.value]
+        response.options[CoapOptionDelta.FEC_PARITY.value] = parity_index
+        if block_fields.get("LOCAL_BLOCK_SIZE"):
+            response.options[CoapOptionDelta.LOCAL_BLOCK_SIZE.value] = block_fields["LOCAL_BLOCK_SIZE"]
+
+        # The parity of the last group also carries the digest, in case the last block is rebuilt from it
+        group_size = DriveFec.decode_option(request.options[CoapOptionDelta.FEC.value])[0]
+        if (group + 1) * group_size >= total_packets and "CONTENT_HASH" in block_fields:
+            response.options[CoapOptionDelta.CONTENT_HASH.value] = block_fields["CONTENT_HASH"].digest()
+
+        return response
 
     def split_on_bytes_and_send(self, request: CoapPacket, path: str):
         """
@@ -35,71 +341,477 @@ class DriveSpliter(CoapSingletonBase):
         - request (CoapPacket): The original CoAP packet that triggered the splitting and sending.
         - path (str): The path to the file or folder to be split and sent.
         """
-        # Extract block-related options from the CoAP packet
+        # Extract block-related options from the CoAP packet, capping the block size to the local maximum
         send_block_option = request.get_option_code()
         block_fields = CoapPacket.decode_option_block(request.options[send_block_option])
 
-        # Check if the path is a folder and compress it
-        to_be_deleted = None
-        if DriveUtilities.folder_exists(path):
-            logger.debug(f"<{request.token}> Zipping the folder: {path}")
-            logger.log(f"> Zipping the folder: {path}")
-            path = DriveUtilities.compress_folder(path)
-            to_be_deleted = path
-
-        # Get total packets based on block size
-        total_packets = DriveUtilities.get_total_packets(path, block_fields["BLOCK_SIZE"])
-        logger.debug(f"<{request.token}> Number of packets that will be sent: {total_packets}")
-        logger.log(f"> Uploading the file with {total_packets} packets...", LogColor.CYAN)
-
-        # Generate file data packets using a generator
-        generator = DriveUtilities.split_on_packets(path, block_fields["BLOCK_SIZE"])
-        if generator:
-            self.__work_timer.reset()
-            for index, payload in enumerate(generator, start=1):
-
-                # Create a CoAP response packet with payload and necessary options
-                response = DriveTemplates.CONTENT_RESPONSE.value_with(
-                    request.token, request.message_id + index,
-                    request.skt, request.sender_ip_port
-                )
-                response.payload = payload
-                response.options[CoapOptionDelta.LOCATION_PATH.value] = os.path.basename(path)
-                response.options[send_block_option] = (
-                    CoapPacket.encode_option_block(index - 1, int(index != total_packets), block_fields["SZX"])
+        block_fields["BLOCK_SIZE"] = self.get_block_size(request)
+        block_fields["SZX"], block_fields["LOCAL_BLOCK_SIZE"] = self.encode_block_size(block_fields["BLOCK_SIZE"])
+
+        is_folder = DriveUtilities.folder_exists(path)
+        query = request.options.get(CoapOptionDelta.URI_QUERY.value)
+        delta_signature = self.__delta_signatures.pop(request.general_work_id(), None)
+        chunk_upload = self.__chunk_uploads.pop(request.general_work_id(), None)
+
+        # The bytes set by the caller may stand for a file that does not exist yet
+        content = self.__contents.pop(request.general_work_id(), None)
+        # Only a whole file is hashed for its ETag (see below); the other reads of a file carry the ETag if it is
+        # cached already
+        block_fields["ETAG"] = (DriveETag().cached(path) or 0) if content is None and not is_folder else 0
+
+        byte_range = None
+        if content is None and query and query != DRIVE_DELTA_SIGNATURE_QUERY and not is_folder:
+            byte_range = self.get_requested_range(request, os.path.getsize(path), block_fields["BLOCK_SIZE"])
+
+        if content is None and is_folder and query == DRIVE_MANIFEST_QUERY:
+            # The list of the files of a folder, downloaded one by one by the client
+            content = DriveUtilities.get_manifest(path)
+        elif content is None and not is_folder and query == DRIVE_DELTA_SIGNATURE_QUERY:
+            # The checksums of the blocks of a file, for the client to send or fetch only what changed
+            content = DriveDelta.signature(path)
+
+        if content is not None:
+            block_fields["FIRST_BLOCK"] = 0
+            block_fields["TOTAL_BYTES"] = len(content)
+            total_packets = -(-len(content) // block_fields["BLOCK_SIZE"])
+            logger.debug(f"<{request.token}> Sending the {query.partition('=')[0]} of {path} in {total_packets} "
+                         f"packets")
+
+            generator = (content[offset:offset + block_fields["BLOCK_SIZE"]]
+                         for offset in range(0, len(content), block_fields["BLOCK_SIZE"]))
+        elif delta_signature is not None and not is_folder:
+            # Only the bytes missing from the copy of the receiver are sent, the rest is copied from that copy
+            with DriveFileReader(path, DriveDelta.get_window_size(delta_signature)) as reader:
+                operations = DriveDelta.get_operations(delta_signature, reader)
+            block_fields["CONTENT_FORMAT"] = CoapContentFormat.APPLICATION_DELTA.value
+            # The delta is applied while it is received, so its transfer always starts at the first block
+            block_fields["FIRST_BLOCK"] = 0
+            self.__resume_points.pop(request.general_work_id(), None)
+            block_fields["TOTAL_BYTES"] = DriveDelta.get_size(operations)
+            total_packets = -(-block_fields["TOTAL_BYTES"] // block_fields["BLOCK_SIZE"])
+
+            logger.log(f"> Uploading the changes of the file with {total_packets} packets...", LogColor.CYAN)
+            logger.debug(f"<{request.token}> Sending {path} as a delta of {block_fields['TOTAL_BYTES']} bytes "
+                         f"instead of {reader.size} bytes")
+            generator = DriveDelta.split_on_packets(operations, path, reader.stat, block_fields["BLOCK_SIZE"])
+        elif chunk_upload is not None and not is_folder:
+            # Only the chunks missing from the receiver are sent, the others are copied from its files
+            recipe, missing = chunk_upload
+            block_fields["CONTENT_FORMAT"] = CoapContentFormat.APPLICATION_CHUNKS.value
+            # The chunks are written while they are received, so their transfer always starts at the first block
+            block_fields["FIRST_BLOCK"] = 0
+            self.__resume_points.pop(request.general_work_id(), None)
+            block_fields["TOTAL_BYTES"] = DriveChunker.get_size(recipe, missing)
+            total_packets = -(-block_fields["TOTAL_BYTES"] // block_fields["BLOCK_SIZE"])
+
+            logger.log(f"> Uploading {len(missing)} of the {len(recipe['chunks'])} chunks of the file with "
+                       f"{total_packets} packets...", LogColor.CYAN)
+            logger.debug(f"<{request.token}> Sending {path} as chunks of {block_fields['TOTAL_BYTES']} bytes "
+                         f"instead of {recipe['size']} bytes")
+            generator = DriveChunker.split_on_packets(recipe, missing, path, block_fields["BLOCK_SIZE"])
+        elif is_folder:
+            # A folder is sent as a tar archive, generated while its blocks are sent, or from the cache if the
+            # folder did not change since it was last archived
+            entries, fingerprint = DriveArchive.walk(path)
+            block_fields["ETAG"] = int(fingerprint[:16], 16)
+            block_fields["CONTENT_FORMAT"] = CoapContentFormat.APPLICATION_TAR.value
+            # The archive is unpacked while it is received, so its transfer always starts at the first block
+            block_fields["FIRST_BLOCK"] = 0
+            self.__resume_points.pop(request.general_work_id(), None)
+            block_fields["TOTAL_BYTES"] = DriveArchive.get_size(entries)
+            total_packets = -(-block_fields["TOTAL_BYTES"] // block_fields["BLOCK_SIZE"])
+
+            logger.log(f"> Uploading the folder with {total_packets} packets...", LogColor.CYAN)
+            cached_archive = DriveArchiveCache().get(fingerprint)
+            if cached_archive:
+                logger.debug(f"<{request.token}> Sending the cached archive of {path} in {total_packets} packets")
+                generator = DriveUtilities.split_on_packets(cached_archive, block_fields["BLOCK_SIZE"], 0)
+            else:
+                logger.debug(f"<{request.token}> Archiving the folder {path} in {total_packets} packets")
+                generator = DriveArchiveCache().cache_blocks(
+                    fingerprint, path, DriveArchive.split_on_packets(entries, block_fields["BLOCK_SIZE"]),
+                    block_fields["TOTAL_BYTES"]
                 )
+        elif byte_range:
+            # Only the blocks of the range are sent, the transfer ends with the last one
+            block_fields["FIRST_BLOCK"] = byte_range[0] // block_fields["BLOCK_SIZE"]
+            total_packets = byte_range[1] // block_fields["BLOCK_SIZE"] + 1
+            logger.debug(f"<{request.token}> Sending the bytes {byte_range[0]}-{byte_range[1]} in the blocks "
+                         f"{block_fields['FIRST_BLOCK']}-{total_packets - 1}")
 
-                # For the first response send the total number of expected packets
-                if index == 1:
-                    response.options[request.get_size_code_based_on_option()] = total_packets
+            generator = DriveUtilities.split_on_range(path, block_fields["BLOCK_SIZE"], *byte_range)
+            block_fields["TOTAL_BYTES"] = byte_range[1] - byte_range[0] + 1
+        else:
+            # Get total packets based on block size
+            total_packets = DriveUtilities.get_total_packets(path, block_fields["BLOCK_SIZE"])
+            logger.debug(f"<{request.token}> Number of packets that will be sent: {total_packets}")
+            logger.log(f"> Uploading the file with {total_packets} packets...", LogColor.CYAN)
+
+            # The receiver keeps the ETag of the file, and a partial transfer resumes only from the same one
+            block_fields["ETAG"] = DriveETag().get(path)
+            block_fields["FIRST_BLOCK"] = self.__get_first_block(request, block_fields["ETAG"], total_packets)
+            if block_fields["FIRST_BLOCK"]:
+                logger.log(f"> Resuming at block {block_fields['FIRST_BLOCK']}", LogColor.CYAN)
 
-                response.encode()
+            # Generate file data packets using a generator
+            generator = DriveUtilities.split_on_packets(path, block_fields["BLOCK_SIZE"],
+                                                        block_fields["FIRST_BLOCK"])
+            block_fields["TOTAL_BYTES"] = (os.path.getsize(path)
+                                           - block_fields["FIRST_BLOCK"] * block_fields["BLOCK_SIZE"])
 
-                # Handle congestion and add the transaction to the pool
-                if self.__transaction_pool.handle_congestions(response, index == total_packets):
-                    generator.close()
-                    return
+        # An empty file is sent as one empty block, so the receiver creates it and the transfer ends
+        empty = not total_packets
+        if empty:
+            total_packets = 1
+            block_fields["FIRST_BLOCK"] = 0
+            generator = (payload for payload in (b"",))
 
-                # add transaction
-                self.__transaction_pool.add_transaction(response, request.message_id)
+        # The bytes sent at least once, to report the bytes saved by a canceled transfer
+        block_fields["SENT_BYTES"] = 0
 
-            del generator
-            retransmissions = self.__transaction_pool.get_number_of_retransmissions(request)
+        block_fields["CONTENT_HASH"] = hashlib.blake2b(digest_size=DRIVE_CONTENT_HASH_SIZE)
+        generator = self.__hash_blocks(generator, block_fields["CONTENT_HASH"])
 
-            logger.debug(f"<{request.token}> Request finished in {self.__work_timer.elapsed_time()}"
-                         f" with {retransmissions} retransmission.", LogColor.CYAN)
+        compression = DriveCompression.decode_option(request.options.get(CoapOptionDelta.COMPRESSION.value))
+        if compression and DriveCompression.is_compressible(path, *compression):
+            logger.debug(f"<{request.token}> Compressing the blocks with method {compression[0]}, "
+                         f"level {compression[1]}")
+            block_fields["COMPRESSION"] = request.options[CoapOptionDelta.COMPRESSION.value]
+            block_fields["COMPRESSED_BYTES"] = 0
+            generator = self.__compress_blocks(generator, compression, block_fields)
 
-            logger.log(f"> Upload completed in {self.__work_timer.elapsed_time()} with {retransmissions}"
-                       f" retransmission.", LogColor.CYAN)
+        # The blocks are read, hashed and compressed ahead of the sender, by a thread of their own, unless there
+        # is nothing to read
+        if not empty:
+            generator = DriveReadAhead(generator, block_fields["BLOCK_SIZE"])
 
-            # Delete the compressed file if applicable
-            if to_be_deleted:
-                DriveUtilities.delete_file(to_be_deleted)
+        # Every transfer has its own timer, as many transfers are sent at once
+        work_timer = CoapTimer()
+        work_timer.reset()
 
-            # Finish the overall transaction in the transaction pool
-            self.__transaction_pool.finish_overall_transaction(request)
+        if request.is_q_block():
+            completed = self.__send_q_blocks(request, path, generator, total_packets, block_fields)
         else:
-            pass
+            completed = self.__send_blocks(request, path, generator, total_packets, block_fields)
+
+        if not completed:
+            # The file is closed and the blocks not sent yet are dropped right away
+            generator.close()
+            saved_bytes = block_fields["TOTAL_BYTES"] - block_fields["SENT_BYTES"]
+            self.__saved_bytes += saved_bytes
+            logger.log(f"> Transfer stopped, {saved_bytes} bytes were not sent.", LogColor.YELLOW)
+            logger.debug(f"<{request.token}> Transfer stopped after {block_fields['SENT_BYTES']} bytes, "
+                         f"{saved_bytes} bytes were not sent.", LogColor.YELLOW)
+            return
+
+        generator.close()
+        if not empty:
+            logger.debug(f"<{request.token}> Read {generator.read_time:.2f}s, sender waited for the disk "
+                         f"{generator.sender_wait_time:.2f}s, reader waited for the network "
+                         f"{generator.reader_wait_time:.2f}s.", LogColor.CYAN)
+        if "COMPRESSION" in block_fields:
+            logger.debug(f"<{request.token}> {block_fields['TOTAL_BYTES']} bytes sent in "
+                         f"{block_fields['COMPRESSED_BYTES']} compressed bytes.", LogColor.CYAN)
+        retransmissions = self.__transaction_pool.get_number_of_retransmissions(request)
+
+        logger.debug(f"<{request.token}> Request finished in {work_timer.elapsed_time()}"
+                     f" with {retransmissions} retransmission.", LogColor.CYAN)
+
+        logger.log(f"> Upload completed in {work_timer.elapsed_time()} with {retransmissions}"
+                   f" retransmission.", LogColor.CYAN)
+
+        # Finish the overall transaction in the transaction pool
+        self.__transaction_pool.finish_overall_transaction(request)
+
+    def __send_blocks(self, request: CoapPacket, path: str, generator, total_packets: int,
+                      block_fields: dict) -> bool:
+        """
+        Send every block of a file as a CON with its own transaction.
+
+        Parameters:
+        - request (CoapPacket): The original CoAP packet that triggered the splitting and sending.
+        - path (str): The path of the file being sent.
+        - generator: The generator of the file blocks.
+        - total_packets (int): The total number of blocks.
+        - block_fields (dict): The decoded block option of the request.
+
+        Returns:
+        - bool: True if all the blocks were acknowledged; False if the overall transaction failed.
+        """
+        for num, payload in enumerate(generator, start=block_fields["FIRST_BLOCK"]):
+
+            # Create a CoAP response packet with payload and necessary options
+            response = self.__make_block(
+                request, path, num, payload, total_packets, block_fields,
+                self.__transaction_pool.next_message_id(request.sender_ip_port)
+            )
+            response.encode_parts()
+
+            # Handle congestion and add the transaction to the pool
+            if self.__transaction_pool.handle_congestions(response, num + 1 == total_packets):
+                return False
+
+            # add transaction, whose block is read into a buffer returned once it is acknowledged
+            block_fields["SENT_BYTES"] += len(payload)
+            self.__transaction_pool.add_transaction(response, request.message_id,
+                                                    partial(DriveBufferPool().release, payload))
+
+        return True
+
+    def __send_q_blocks(self, request: CoapPacket, path: str, generator, total_packets: int,
+                        block_fields: dict) -> bool:
+        """
+        Send the blocks of a file in rounds of NON blocks (RFC 9177 like).
+
+        Each round holds as many blocks as the congestion window of the peer allows, but at least
+        DRIVE_Q_BLOCK_MIN_ROUND blocks, so random losses do not shrink the rounds to a few blocks each.
+        The last block of a round is a CON, after which the receiver reports the blocks it is still missing up to
+        that block, in as many pages as needed. Every block is kept until a report tells it was received: the missing
+        ones are sent again, as a smaller round, until none is missing.
+
+        Parameters:
+        - request (CoapPacket): The original CoAP packet that triggered the splitting and sending.
+        - path (str): The path of the file being sent.
+        - generator: The generator of the file blocks.
+        - total_packets (int): The total number of blocks.
+        - block_fields (dict): The decoded block option of the request.
+
+        Returns:
+        - bool: True if all the blocks were received; False if the overall transaction failed.
+        """
+        peer = request.sender_ip_port
+        reports = queue.Queue()
+        with self.__reports_lock:
+            self.__reports[request.general_work_id()] = reports
+
+        fec = DriveFec.decode_option(request.options.get(CoapOptionDelta.FEC.value))
+        if fec:
+            logger.debug(f"<{request.token}> Sending {fec[1]} parity blocks for every {fec[0]} blocks.")
+
+        try:
+            next_num = block_fields["FIRST_BLOCK"]
+
+            # The blocks sent and not reported as received yet, by block number, and the ones sent as a CON, kept by
+            # their transaction too
+            pending, confirmable = {}, set()
+            while next_num < total_packets:
+                round_blocks = {}
+                round_size = max(self.__transaction_pool.get_window_size(peer), DRIVE_Q_BLOCK_MIN_ROUND)
+                if fec:
+                    # Whole groups per round, so the parity of a group is sent before the CON block
+                    round_size = -(-round_size // fec[0]) * fec[0]
+                for payload in islice(generator, round_size):
+                    round_blocks[next_num] = payload
+                    next_num += 1
+                pending.update(round_blocks)
+
+                # Parity blocks are sent only with the first transmission of a round
+                parity = self.__make_round_parity(round_blocks, fec) if fec else {}
+
+                to_be_sent = sorted(round_blocks)
+                first_pass = True
+                while to_be_sent:
+                    for num in to_be_sent:
+                        # A canceled transfer stops in the middle of a round
+                        if self.__transaction_pool.is_overall_transaction_failed(request):
+                            return False
+
+                        response = self.__make_block(
+                            request, path, num, pending[num], total_packets, block_fields,
+                            self.__transaction_pool.next_message_id(peer)
+                        )
+                        if fec:
+                            response.options[CoapOptionDelta.FEC.value] = request.options[CoapOptionDelta.FEC.value]
+
+                        if num != to_be_sent[-1]:
+                            response.message_type = CoapType.NON.value
+                            self.__transaction_pool.send_unconfirmed(response)
+
+                            if fec and ((num + 1) % fec[0] == 0 or num + 1 == total_packets):
+                                self.__send_parity(request, path, num // fec[0], parity, total_packets, block_fields)
+                        else:
+                            if fec:
+                                self.__send_parity(request, path, num // fec[0], parity, total_packets, block_fields)
+
+                            if self.__transaction_pool.handle_congestions(response):
+                                return False
+                            confirmable.add(num)
+                            self.__transaction_pool.add_transaction(response, request.message_id)
+
+                        if first_pass:
+                            block_fields["SENT_BYTES"] += len(round_blocks[num])
+
+                    first_pass = False
+                    missing = self.__wait_missing_blocks(request, reports, to_be_sent[-1])
+                    if missing is None:
+                        return False
+
+                    # The report covers every block up to the CON block, so the blocks it does not list were received;
+                    # the blocks before the first block sent may be listed too, but they are not sent
+                    lost = sum(num in missing for num in to_be_sent)
+                    for num in [num for num in pending if num <= to_be_sent[-1] and num not in missing]:
+                        payload = pending.pop(num)
+                        if num not in confirmable:
+                            DriveBufferPool().release(payload)
+                    self.__transaction_pool.register_delivery(peer, len(to_be_sent) - lost, lost)
+                    to_be_sent = sorted(pending)
+            return True
+        finally:
+            with self.__reports_lock:
+                del self.__reports[request.general_work_id()]
+
+    def __get_first_block(self, request: CoapPacket, etag: int, total_packets: int) -> int:
+        """
+        Get the block where a transfer starts: the resume point of an upload, or the block asked by a download
+        whose If-Match option matches the ETag of the file.
+
+        Parameters:
+        - request (CoapPacket): The original CoAP packet that triggered the splitting and sending.
+        - etag (int): The ETag of the file being sent.
+        - total_packets (int): The total number of blocks.
+
+        Returns:
+        - int: The first block to be sent; 0 if the transfer starts over.
+        """
+        first_block = self.__resume_points.pop(request.general_work_id(), 0)
+
+        if_match = request.options.get(CoapOptionDelta.IF_MATCH.value)
+        if not first_block and if_match and int.from_bytes(if_match, 'big') == etag:
+            first_block = request.get_block_id()
+
+        if not 0 <= first_block < total_packets:
+            return 0
+
+        # Parity groups are aligned to the start of the file
+        fec = DriveFec.decode_option(request.options.get(CoapOptionDelta.FEC.value))
+        if request.is_q_block() and fec:
+            first_block -= first_block % fec[0]
+        return first_block
+
+    def handle_resume_point(self, response: CoapPacket):
+        """
+        Keep the block where an upload resumes, as answered by the receiver to the upload request.
+
+        Parameters:
+        - response (CoapPacket): The CoAP packet with the resume point.
+        """
+        if isinstance(response.payload, dict) and isinstance(response.payload.get("block"), int):
+            self.__resume_points[response.general_work_id()] = response.payload["block"]
+
+    def set_delta_signature(self, request: CoapPacket, signature: dict):
+        """
+        Send an upload as a delta against the copy of the receiver.
+
+        Parameters:
+        - request (CoapPacket): The upload request, with its token already set.
+        - signature (dict): The parsed signature of the copy of the receiver (see DriveDelta).
+        """
+        self.__delta_signatures[request.general_work_id()] = signature
+
+    def set_content(self, request: CoapPacket, content: bytes):
+        """
+        Send the given bytes instead of the file of a transfer.
+
+        Parameters:
+        - request (CoapPacket): The download or upload request, with its token already set.
+        - content (bytes): The bytes.
+        """
+        self.__contents[request.general_work_id()] = content
+
+    def set_chunk_upload(self, request: CoapPacket, recipe: dict, missing: set[int]):
+        """
+        Send an upload as the chunks missing from the receiver and the digests of the others.
+
+        Parameters:
+        - request (CoapPacket): The upload request, with its token already set.
+        - recipe (dict): The recipe of the file (see DriveChunker).
+        - missing (set): The indexes of the chunks missing from the receiver.
+        """
+        self.__chunk_uploads[request.general_work_id()] = recipe, missing
+
+    @staticmethod
+    def __make_round_parity(round_blocks: dict, fec: tuple) -> dict[int, list[bytes]]:
+        """
+        Compute the parity blocks of every group of a round.
+
+        Parameters:
+        - round_blocks (dict): The blocks of the round, by block number; the round holds whole groups.
+        - fec (tuple): The group size (K) and parity count (M).
+
+        Returns:
+        - dict: The parity blocks of each group, by group number.
+        """
+        group_size, parity_count = fec
+        groups = {}
+        for num in sorted(round_blocks):
+            groups.setdefault(num // group_size, []).append(round_blocks[num])
+        return {group: DriveFec.make_parity(blocks, parity_count) for group, blocks in groups.items()}
+
+    def __send_parity(self, request: CoapPacket, path: str, group: int, parity: dict, total_packets: int,
+                      block_fields: dict):
+        """
+        Send the parity blocks of a group, if they were not sent yet.
+
+        Parameters:
+        - request (CoapPacket): The original CoAP packet that triggered the splitting and sending.
+        - path (str): The path of the file being sent.
+        - group (int): The group number.
+        - parity (dict): The parity blocks of the round not sent yet, by group number.
+        - total_packets (int): The total number of data blocks.
+        - block_fields (dict): The decoded block option of the request.
+        """
+        for parity_index, payload in enumerate(parity.pop(group, [])):
+            self.__transaction_pool.send_unconfirmed(self.__make_parity_block(
+                request, path, group, parity_index, payload, total_packets, block_fields,
+                self.__transaction_pool.next_message_id(request.sender_ip_port)
+            ))
+
+    def __wait_missing_blocks(self, request: CoapPacket, reports: queue.Queue, sync_num: int) -> set | None:
+        """
+        Wait for the report of missing blocks that follows the CON block of a round, with all its pages.
+
+        Parameters:
+        - request (CoapPacket): The original CoAP packet that triggered the splitting and sending.
+        - reports (queue.Queue): The queue where the reports of the transfer are delivered.
+        - sync_num (int): The number of the CON block that closed the round.
+
+        Returns:
+        - set | None: The numbers of the missing blocks; None if the overall transaction failed.
+        """
+        pages = {}
+        timer = CoapTimer().reset()
+        while timer.elapsed_time() < MAX_RETRANSMISSION_WAIT:
+            if self.__transaction_pool.is_overall_transaction_failed(request):
+                return None
+            try:
+                report = reports.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+            # Reports triggered by older rounds are outdated
+            if report.get("block") != sync_num:
+                continue
+
+            pages[report.get("page", 0)] = report["missing"]
+            if len(pages) >= report.get("pages", 1):
+                return {num for page in pages.values() for first, last in page for num in range(first, last + 1)}
+
+        logger.debug(f"<{request.token}> No report of missing blocks received.", LogColor.YELLOW)
+        self.__transaction_pool.set_overall_transaction_failure(request)
+        return None
+
+    def handle_missing_blocks(self, report: CoapPacket):
+        """
+        Deliver a report of missing blocks to the transfer that waits for it.
+
+        Parameters:
+        - report (CoapPacket): The CoAP packet with the report, sent by the receiver of a Q-Block transfer.
+        """
+        with self.__reports_lock:
+            reports = self.__reports.get(report.general_work_id())
+
+        if reports and isinstance(report.payload, dict):
+            reports.put(report.payload)
 
     def split_on_paths_and_send(self, request: CoapPacket, path: str, relative_to: str):
         """
@@ -113,24 +825,26 @@ class DriveSpliter(CoapSingletonBase):
         # Split paths based on the source directory and common prefix
         paths = DriveUtilities.split_on_paths(path, relative_to)
 
-        self.__work_timer.reset()
+        work_timer = CoapTimer()
+        work_timer.reset()
         for index, path in enumerate(paths, start=1):
 
             # Create a CoAP response packet with payload and necessary options
-            response = DriveTemplates.PATH_RESPONSE.value_with(request.token, index)
+            response = DriveTemplates.PATH_RESPONSE.value_with(
+                request.token, self.__transaction_pool.next_message_id(request.sender_ip_port),
+                request.skt, request.sender_ip_port
+            )
             response.payload = path
-            response.skt = request.skt
-            response.sender_ip_port = request.sender_ip_port
             response.options[request.get_option_code()] = (
                 CoapPacket.encode_option_block(index - 1, int(index != len(paths)))
             )
 
             # Handle congestion and add the transaction to the pool
-            if self.__transaction_pool.handle_congestions(response, index - 1 == len(paths)):
+            if self.__transaction_pool.handle_congestions(response, index == len(paths)):
                 break
 
             # register transaction
             self.__transaction_pool.add_transaction(response, request.message_id)
 
         retransmissions = self.__transaction_pool.get_number_of_retransmissions(request)
-        logger.debug(f"Sync completed in {self.__work_timer.elapsed_time()} with {retransmissions}", LogColor.CYAN)
+        logger.debug(f"Sync completed in {work_timer.elapsed_time()} with {retransmissions}", LogColor.CYAN)
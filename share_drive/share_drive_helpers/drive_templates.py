@@ -108,6 +108,30 @@ class DriveTemplates(Enum):
         payload=""
     )
 
+    MISSING_BLOCKS = CoapPacket(
+        version=1,
+        message_type=CoapType.CON.value,
+        token=b"",
+        code=CoapCodeFormat.SUCCESS_CONTINUE.value(),
+        message_id=0,
+        options={
+            CoapOptionDelta.CONTENT_FORMAT.value: CoapContentFormat.APPLICATION_JSON.value,
+        },
+        payload=""
+    )
+
+    RESUME_POINT = CoapPacket(
+        version=1,
+        message_type=CoapType.CON.value,
+        token=b"",
+        code=CoapCodeFormat.SUCCESS_CONTINUE.value(),
+        message_id=0,
+        options={
+            CoapOptionDelta.CONTENT_FORMAT.value: CoapContentFormat.APPLICATION_JSON.value,
+        },
+        payload=""
+    )
+
     def __init__(self, coap_packet: CoapPacket):
         """
         Constructor for DriveTemplates Enum.
@@ -1,7 +1,9 @@
+import json
 import os
-import zipfile
 
 from coap_core.coap_utilities.coap_logger import logger
+from share_drive.share_drive_helpers import DRIVE_RESUME_SUFFIX
+from share_drive.share_drive_helpers.drive_buffer_pool import DriveBufferPool
 
 
 class DriveUtilities:
@@ -72,38 +74,6 @@ class DriveUtilities:
         total_packets = (file_size + block_size - 1) // block_size
         return total_packets
 
-    @staticmethod
-    def compress_folder(input_folder):
-        """
-        Compress the contents of the specified folder into a zip file.
-
-        Parameters:
-        - input_folder (str): The path to the input folder.
-
-        Returns:
-        - str: The path to the created zip file.
-        """
-        output_zip = f"{input_folder}.zip"
-        with zipfile.ZipFile(output_zip, 'w', zipfile.ZIP_STORED) as zip_file:
-            for folder, folders, filenames in os.walk(input_folder):
-                for filename in filenames:
-                    file_path = os.path.join(folder, filename)
-                    arcname = os.path.relpath(file_path, input_folder)
-                    zip_file.write(file_path, arcname)
-        return output_zip
-
-    @staticmethod
-    def decompress_folder(zip_file_path: str):
-        """
-        Decompress the contents of the specified zip file into a folder with the same name.
-
-        Parameters:
-        - zip_file_path (str): The path to the zip file.
-        """
-        output_folder = zip_file_path.split(".zip")[0]
-        with zipfile.ZipFile(zip_file_path, 'r') as zip_ref:
-            zip_ref.extractall(output_folder)
-
     @staticmethod
     def delete_file(file_path):
         """
@@ -117,6 +87,26 @@ class DriveUtilities:
         except OSError as e:
             logger.debug(f"Error deleting file '{file_path}': {e}")
 
+    @staticmethod
+    def preallocate(fd: int, offset: int, length: int):
+        """
+        Reserve the space of a file being written, falling back to extending it where the file system cannot
+        allocate the space.
+
+        Parameters:
+        - fd (int): The file descriptor, opened for writing.
+        - offset (int): The first byte to be reserved.
+        - length (int): The number of bytes to be reserved.
+        """
+        if length <= 0:
+            return
+        try:
+            os.posix_fallocate(fd, offset, length)
+        except (AttributeError, OSError) as e:
+            logger.debug(f"Cannot preallocate {length} bytes: {e}")
+            if os.fstat(fd).st_size < offset + length:
+                os.ftruncate(fd, offset + length)
+
     @staticmethod
     def split_on_paths(source: str, relative_to: str):
         """
@@ -138,6 +128,9 @@ class DriveUtilities:
                 dir_path = dir_path.split(relative_to)[1].removeprefix("/")
                 paths.append({"folder": dir_path})
             for file in files:
+                # The progress of partial transfers is not part of the drive
+                if file.endswith(DRIVE_RESUME_SUFFIX):
+                    continue
                 file_path = os.path.join(root, file)
                 # Remove the common prefix to get the relative path
                 file_path = file_path.split(relative_to)[1].removeprefix("/")
@@ -145,20 +138,189 @@ class DriveUtilities:
         return paths
 
     @staticmethod
-    def split_on_packets(file_path: str, block_size: int):
+    def get_manifest(source: str) -> bytes:
+        """
+        List the sub-folders and files of a folder, relative to it, for the client to download the files one by one.
+
+        Parameters:
+        - source (str): The path to the folder.
+
+        Returns:
+        - bytes: The manifest, as JSON: {"folders": [path, ...], "files": [{"path": path, "size": size}, ...]}.
+        """
+        manifest = {"folders": [], "files": []}
+        for root, dirs, files in os.walk(source):
+            for d in sorted(dirs):
+                manifest["folders"].append(os.path.relpath(os.path.join(root, d), source).replace(os.sep, "/"))
+            for file in sorted(files):
+                # The progress of partial transfers is not part of the drive
+                if file.endswith(DRIVE_RESUME_SUFFIX):
+                    continue
+                file_path = os.path.join(root, file)
+                manifest["files"].append({"path": os.path.relpath(file_path, source).replace(os.sep, "/"),
+                                          "size": os.path.getsize(file_path)})
+        return json.dumps(manifest).encode()
+
+    @staticmethod
+    def __read_block(fd: int, file_path: str, offset: int, length: int, block_size: int) -> memoryview:
+        """
+        Read a block of a file at its offset, in a buffer of the DriveBufferPool: the buffer is returned once the
+        block is acknowledged, and read into again by a later block.
+
+        Parameters:
+        - fd (int): The file descriptor.
+        - file_path (str): The path to the file.
+        - offset (int): The offset of the block.
+        - length (int): The length of the block.
+        - block_size (int): The block size of the transfer, the size of the buffers, so a short block still takes
+          a buffer shared with the others.
+
+        Returns:
+        - memoryview: The block, sent without being copied again.
+
+        Raises:
+        - OSError: If the file shrank below the end of the block since it was opened.
+        """
+        block = memoryview(DriveBufferPool().acquire(block_size))[:length]
+        if os.preadv(fd, [block], offset) != length:
+            DriveBufferPool().release(block)
+            raise OSError(f"{file_path} shrank while it was sent")
+        return block
+
+    @staticmethod
+    def split_on_packets(file_path: str, block_size: int, first_block: int = 0):
+        """
+        Generate chunks of a file with the specified block size, up to the size of the file when it is opened.
+
+        Parameters:
+        - file_path (str): The path to the file.
+        - block_size (int): The size of each packet in bytes.
+        - first_block (int): The number of the first chunk, for transfers that resume.
+
+        Yields:
+        - memoryview: Blocks of the file.
+
+        Raises:
+        - OSError: If the file shrinks while it is sent, so the transfer fails instead of sending a short file.
+        """
+        with open(file_path, 'rb') as file:
+            size = os.fstat(file.fileno()).st_size
+            for offset in range(first_block * block_size, size, block_size):
+                yield DriveUtilities.__read_block(file.fileno(), file_path, offset, min(block_size, size - offset),
+                                                  block_size)
+
+    @staticmethod
+    def split_on_range(file_path: str, block_size: int, first_byte: int, last_byte: int):
         """
-        Generate chunks of a file with the specified block size.
+        Generate the chunks of a byte range of a file, aligned to the blocks of the file:
+        the first and the last chunk are trimmed to the range.
 
         Parameters:
         - file_path (str): The path to the file.
         - block_size (int): The size of each packet in bytes.
+        - first_byte (int): The first byte of the range.
+        - last_byte (int): The last byte of the range, included.
 
         Yields:
-        - bytes: Chunks of the file data.
+        - memoryview: Chunks of the range.
+
+        Raises:
+        - OSError: If the file shrinks while it is sent.
         """
         with open(file_path, 'rb') as file:
-            while True:
-                file_data = file.read(block_size)
-                if not file_data:
-                    break
-                yield file_data
+            position, end = first_byte, min(last_byte + 1, os.fstat(file.fileno()).st_size)
+            while position < end:
+                chunk_end = min(position - position % block_size + block_size, end)
+                yield DriveUtilities.__read_block(file.fileno(), file_path, position, chunk_end - position, block_size)
+                position = chunk_end
+
+
+class DriveFileReader:
+    """
+    DriveFileReader reads a file through a window of a fixed capacity, for the scans of its content (deltas, chunks)
+    that only look a bounded number of bytes ahead: the window is refilled with pread at the offset requested, so
+    the memory of a scan does not grow with the file.
+
+    The size and modification time of the file are recorded when it is opened, and `check` fails if they changed,
+    so the reads of a scan, and the blocks sent after it, describe the same version of the file.
+
+    Author: Damir Denis-Tudor
+    """
+
+    def __init__(self, file_path: str, capacity: int, snapshot: os.stat_result = None):
+        """
+        Constructor for DriveFileReader.
+
+        Parameters:
+        - file_path (str): The path to the file.
+        - capacity (int): The size of the window, the most bytes returned by a `view`.
+        - snapshot (os.stat_result): The status of the file when it was scanned, checked when the file is opened
+          again to send the blocks of the scan.
+
+        Raises:
+        - OSError: If the file cannot be opened, or changed since the snapshot.
+        """
+        self.__path = file_path
+        self.__fd = os.open(file_path, os.O_RDONLY)
+        self.stat = snapshot or os.fstat(self.__fd)
+        self.size = self.stat.st_size
+        self.capacity = capacity
+
+        self.__window = memoryview(bytearray(capacity))
+        self.__start, self.__length = 0, 0
+
+        if snapshot is not None:
+            try:
+                self.check()
+            except OSError:
+                self.close()
+                raise
+
+    def view(self, offset: int, length: int) -> memoryview:
+        """
+        Read bytes of the file through the window, refilled only if they are not in it.
+
+        Parameters:
+        - offset (int): The offset of the first byte.
+        - length (int): The number of bytes, at most the capacity; fewer are returned past the end of the file.
+
+        Returns:
+        - memoryview: The bytes, valid until the next call.
+
+        Raises:
+        - OSError: If the file shrank since it was opened.
+        """
+        length = max(0, min(length, self.size - offset))
+        if length > self.capacity:
+            raise ValueError(f"{length} bytes do not fit the window of {self.capacity} bytes")
+
+        if not length:
+            return self.__window[:0]
+        if offset < self.__start or offset + length > self.__start + self.__length:
+            count = min(self.capacity, self.size - offset)
+            if os.preadv(self.__fd, [self.__window[:count]], offset) != count:
+                raise OSError(f"{self.__path} shrank while it was read")
+            self.__start, self.__length = offset, count
+        return self.__window[offset - self.__start:offset - self.__start + length]
+
+    def check(self):
+        """
+        Check that the file did not change since it was opened, or since its snapshot.
+
+        Raises:
+        - OSError: If the size or the modification time of the file changed.
+        """
+        current = os.fstat(self.__fd)
+        if (current.st_size, current.st_mtime_ns) != (self.stat.st_size, self.stat.st_mtime_ns):
+            raise OSError(f"{self.__path} changed while it was read")
+
+    def close(self):
+        if self.__fd is not None:
+            os.close(self.__fd)
+            self.__fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
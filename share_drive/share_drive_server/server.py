@@ -7,8 +7,15 @@ from socket import socket, AF_INET, SOCK_DGRAM
 from time import sleep
 from pyfiglet import Figlet
 
+from coap_core.coap_transaction.coap_transaction_pool import CoapTransactionPool
 from coap_core.coap_utilities.coap_logger import logger, LogColor
+from coap_core.coap_worker import COAP_MAX_DATAGRAM_SIZE, COAP_DATAGRAM_OVERHEAD
 from coap_core.coap_worker.coap_worker_pool import CoapWorkerPool
+from share_drive.share_drive_helpers import DRIVE_BLOCK_SIZE, DRIVE_MAX_LOCAL_BLOCK_SIZE, DRIVE_ARCHIVE_CACHE_SIZE
+from share_drive.share_drive_helpers.drive_archive_cache import DriveArchiveCache
+from share_drive.share_drive_helpers.drive_chunks import DriveChunkStore
+from share_drive.share_drive_helpers.drive_etag import DriveETag
+from share_drive.share_drive_helpers.drive_spliter import DriveSpliter
 from share_drive.share_drive_server.server_resource import ServerResource
 
 
@@ -21,20 +28,26 @@ def clean_terminal():
 
 
 class Server:
-    def __init__(self, ip_address, port):
+    def __init__(self, ip_address, port, max_datagram_size=COAP_MAX_DATAGRAM_SIZE):
         """
         Initializes the CoAP server with the given IP address and port.
 
         Args:
             ip_address (str): The IP address to bind the server socket.
             port (int): The port number to bind the server socket.
+            max_datagram_size (int): The size of the largest datagram that can be received.
         """
         self._skt = socket(AF_INET, SOCK_DGRAM)
         self._skt.bind((ip_address, port))
+        self._max_datagram_size = max_datagram_size
+        CoapWorkerPool.size_socket_buffers(self._skt, max_datagram_size)
 
         # Creating a ServerResource instance for handling CoAP requests
         self._resource = ServerResource("share_drive", f"{os.path.expanduser('~')}/coap/server/resources/")
 
+        # The files changed while the server was stopped are indexed in the background, if the index is enabled
+        DriveChunkStore().index_later(self._resource.get_path())
+
         # Dictionary to store data queues and client processes for each address
         self._processes_queues = {}
 
@@ -66,13 +79,18 @@ class Server:
 
                 if active_socket:
                     # Receiving data and address from the socket
-                    data, address = self._skt.recvfrom(1152)
+                    # One more byte than allowed, so truncated datagrams can be told apart
+                    data, address = self._skt.recvfrom(self._max_datagram_size + 1)
+                    if len(data) > self._max_datagram_size:
+                        logger.debug(f"Datagram from {address} larger than {self._max_datagram_size} bytes dropped.",
+                                     LogColor.YELLOW)
+                        continue
 
                     # Checking if there is an existing process for the client address
                     if address not in self._processes_queues:
                         # Creating a new data queue and CoapWorkerPool for the client
                         data_queue = Queue()
-                        pool = CoapWorkerPool(self._skt, self._resource, data_queue)
+                        pool = CoapWorkerPool(self._skt, self._resource, data_queue, self._max_datagram_size)
                         client_process = Process(target=pool.start)
                         client_process.start()
 
@@ -100,11 +118,30 @@ def main():
 
     parser.add_argument('--server_address', type=str, default='127.0.0.1', help='Server address')
     parser.add_argument('--server_port', type=int, default=5683, help='Server port')
+    parser.add_argument('--pacing', action='store_true', help='Pace the outgoing blocks per peer')
+    parser.add_argument('--bandwidth_cap', type=int, default=None, help='Pacing rate cap in bytes per second')
+    parser.add_argument('--block_size', type=int, default=DRIVE_BLOCK_SIZE,
+                        help='Largest block size in bytes; above 1024 the local (non RFC) block size mode is used')
+    parser.add_argument('--archive_cache_size', type=int, default=DRIVE_ARCHIVE_CACHE_SIZE,
+                        help='Size limit in bytes of the cache of folder archives; 0 disables the cache')
+    parser.add_argument('--chunk_store', action='store_true',
+                        help='Index the chunks of the files, so uploads send only the chunks the server lacks')
 
     args = parser.parse_args()
+    if not 16 <= args.block_size <= DRIVE_MAX_LOCAL_BLOCK_SIZE:
+        parser.error(f'--block_size must be between 16 and {DRIVE_MAX_LOCAL_BLOCK_SIZE}')
+
+    # Configuring the transfer behaviour before the client processes are forked
+    CoapTransactionPool().set_pacing(args.pacing, args.bandwidth_cap)
+    DriveSpliter().set_max_block_size(args.block_size)
+    DriveArchiveCache().set_cache(f"{os.path.expanduser('~')}/coap/server/archives/", args.archive_cache_size)
+    if args.chunk_store:
+        DriveChunkStore().set_store(f"{os.path.expanduser('~')}/coap/server/chunks.db")
+    DriveETag().set_index(f"{os.path.expanduser('~')}/coap/server/etags.db")
 
     # Creating and starting the CoAP server
-    Server(args.server_address, args.server_port).listen()
+    max_datagram_size = max(COAP_MAX_DATAGRAM_SIZE, args.block_size + COAP_DATAGRAM_OVERHEAD)
+    Server(args.server_address, args.server_port, max_datagram_size).listen()
 
 
 # Entry point for the script
@@ -1,13 +1,20 @@
 import os
 import shutil
 
+from share_drive.share_drive_helpers import DRIVE_MANIFEST_QUERY, DRIVE_DELTA_SIGNATURE_QUERY, DRIVE_DELTA_QUERY, \
+    DRIVE_CHUNK_RECIPE_QUERY, DRIVE_CHUNK_MISSING_QUERY, DRIVE_CHUNK_QUERY
 from share_drive.share_drive_helpers.drive_assembler import DriveAssembler
+from share_drive.share_drive_helpers.drive_chunks import DriveChunker, DriveChunkStore
+from share_drive.share_drive_helpers.drive_etag import DriveETag
+from share_drive.share_drive_helpers.drive_resume import DriveResume
 from share_drive.share_drive_helpers.drive_spliter import DriveSpliter
+from share_drive.share_drive_helpers.drive_templates import DriveTemplates
 from share_drive.share_drive_helpers.drive_utils import DriveUtilities
-from coap_core.coap_packet.coap_config import CoapOptionDelta, CoapCodeFormat
+from coap_core.coap_packet.coap_config import CoapOptionDelta, CoapCodeFormat, CoapType
 from coap_core.coap_packet.coap_packet import CoapPacket
 from coap_core.coap_packet.coap_templates import CoapTemplates
 from coap_core.coap_resource.resource import Resource
+from coap_core.coap_transaction.coap_responder import CoapResponder
 from coap_core.coap_utilities.coap_logger import logger, LogColor
 
 
@@ -41,12 +48,43 @@ class ServerResource(Resource):
         try:
             # Handling GET requests
             if request.options.get(CoapOptionDelta.LOCATION_PATH.value) and request.has_option_block():
-                os.chdir(self.get_path())
-                path = request.options[CoapOptionDelta.LOCATION_PATH.value]
-                if not DriveUtilities.file_exists(path) and not DriveUtilities.folder_exists(path):
+                path = os.path.join(self.get_path(), request.options[CoapOptionDelta.LOCATION_PATH.value])
+
+                # A download carrying the ETag of the copy of the client is answered 2.03 Valid, piggybacked,
+                # if the file did not change; otherwise the file is sent, its request acknowledged first
+                if CoapOptionDelta.ETAG.value in request.options:
+                    if self.__is_current(request, path):
+                        valid = CoapTemplates.SUCCESS_VALID.value_with(request.token, request.message_id)
+                        valid.options[CoapOptionDelta.ETAG.value] = request.options[CoapOptionDelta.ETAG.value]
+                        CoapResponder().respond(request, valid)
+                        return
+                    CoapResponder().flush_acknowledgment(request)
+
+                if request.options.get(CoapOptionDelta.URI_QUERY.value, "").startswith(
+                        DRIVE_CHUNK_MISSING_QUERY + "="):
+                    # The file of a chunked upload does not exist yet
+                    self.__send_missing_chunks(request, path)
+                elif not DriveUtilities.file_exists(path) and not DriveUtilities.folder_exists(path):
                     # If the file or folder doesn't exist, send a NOT FOUND response
                     invalid_request = CoapTemplates.NOT_FOUND.value_with(request.token, request.message_id)
                     request.skt.sendto(invalid_request.encode(), request.sender_ip_port)
+                elif DriveUtilities.folder_exists(path) and \
+                        request.options.get(CoapOptionDelta.URI_QUERY.value) == DRIVE_MANIFEST_QUERY:
+                    # The manifest of a folder lists its files, downloaded one by one by the client
+                    DriveSpliter().split_on_bytes_and_send(request, path)
+                elif request.options.get(CoapOptionDelta.URI_QUERY.value) == DRIVE_DELTA_SIGNATURE_QUERY:
+                    # A partial file is resumed instead of being patched, so it has no signature
+                    if DriveUtilities.file_exists(path) and not DriveResume.load(path):
+                        DriveSpliter().split_on_bytes_and_send(request, path)
+                    else:
+                        invalid_request = CoapTemplates.BAD_REQUEST.value_with(request.token, request.message_id)
+                        request.skt.sendto(invalid_request.encode(), request.sender_ip_port)
+                elif CoapOptionDelta.URI_QUERY.value in request.options and (
+                        not DriveUtilities.file_exists(path) or not DriveSpliter.get_requested_range(
+                            request, os.path.getsize(path), DriveSpliter().get_block_size(request))):
+                    # Ranges can be read from files only, and must be inside the file
+                    invalid_request = CoapTemplates.BAD_REQUEST.value_with(request.token, request.message_id)
+                    request.skt.sendto(invalid_request.encode(), request.sender_ip_port)
                 else:
                     # If the file or folder exists, split on bytes and send the content
                     DriveSpliter().split_on_bytes_and_send(request, path)
@@ -61,6 +99,53 @@ class ServerResource(Resource):
             request.skt.sendto(coap_response.encode(), request.sender_ip_port)
             raise e
 
+    @staticmethod
+    def __is_current(request, path) -> bool:
+        """
+        Checks if the copy of the client is the same as a file, as told by the ETag of a download. Only whole files
+        and their signatures are validated.
+
+        Args:
+            request: The CoAP request object.
+            path: The path of the file.
+
+        Returns:
+            bool: True if the file has the ETag of the request.
+        """
+        return request.options.get(CoapOptionDelta.URI_QUERY.value) in (None, DRIVE_DELTA_SIGNATURE_QUERY) and \
+            DriveUtilities.file_exists(path) and not DriveResume.load(path) and \
+            DriveETag().get(path) == request.options[CoapOptionDelta.ETAG.value]
+
+    def __send_missing_chunks(self, request, path):
+        """
+        Sends the chunks of a recipe that the server does not have. The recipe was uploaded in memory before,
+        over the token given in the Uri-Query option.
+
+        Args:
+            request: The CoAP request object.
+            path: The path of the file of the recipe.
+        """
+        try:
+            token = bytes.fromhex(request.options[CoapOptionDelta.URI_QUERY.value].partition("=")[2])
+        except ValueError:
+            token = None
+
+        recipe = DriveChunker.parse_recipe(DriveAssembler().pop_read(
+            CoapPacket(token=token, sender_ip_port=request.sender_ip_port)))
+        if recipe is None or not DriveChunkStore().is_enabled():
+            invalid_request = CoapTemplates.BAD_REQUEST.value_with(request.token, request.message_id)
+            request.skt.sendto(invalid_request.encode(), request.sender_ip_port)
+            return
+
+        # The index is kept up to date in the background for the files written by transfers; the files of the
+        # target folder changed by other programs meanwhile are indexed again now, the others are not used
+        DriveChunkStore().refresh(os.path.dirname(path))
+        missing = DriveChunkStore().get_missing(recipe)
+        logger.debug(f"<{request.token}> {len(missing)} of the {len(recipe['chunks'])} chunks of {path} are missing.")
+
+        DriveSpliter().set_content(request, DriveChunker.encode_missing(missing))
+        DriveSpliter().split_on_bytes_and_send(request, path)
+
     @logger
     def handle_post(self, request):
         """
@@ -73,33 +158,29 @@ class ServerResource(Resource):
             Exception: If an error occurs during handling.
         """
         try:
-            os.chdir(self.get_path())
-            path = request.options[CoapOptionDelta.LOCATION_PATH.value]
+            path = os.path.join(self.get_path(), request.options[CoapOptionDelta.LOCATION_PATH.value])
             if DriveUtilities.file_exists(path) or DriveUtilities.folder_exists(path):
                 if request.payload.get("rename"):
-                    dirs = os.path.dirname(path)
-                    if dirs:
-                        os.chdir(os.path.dirname(path))
-                    name = os.path.basename(path)
-                    new_name = request.payload["rename"]
-                    os.rename(src=name, dst=new_name)
+                    new_name = os.path.join(os.path.dirname(path), request.payload["rename"])
+                    os.rename(src=path, dst=new_name)
+                    DriveChunkStore().index_later(new_name)
                     coap_response = CoapTemplates.SUCCESS_CHANGED.value_with(request.token, request.message_id)
-                    request.skt.sendto(coap_response.encode(), request.sender_ip_port)
+                    CoapResponder().respond(request, coap_response)
                 elif request.payload.get("move"):
-                    new_path = request.payload["move"]
-                    shutil.move(src=path, dst=new_path)
+                    new_path = os.path.join(self.get_path(), request.payload["move"])
+                    DriveChunkStore().index_later(shutil.move(src=path, dst=new_path))
                     coap_response = CoapTemplates.SUCCESS_CHANGED.value_with(request.token, request.message_id)
-                    request.skt.sendto(coap_response.encode(), request.sender_ip_port)
+                    CoapResponder().respond(request, coap_response)
                 else:
                     invalid_request = CoapTemplates.BAD_REQUEST.value_with(request.token, request.message_id)
-                    request.skt.sendto(invalid_request.encode(), request.sender_ip_port)
+                    CoapResponder().respond(request, invalid_request)
             else:
                 invalid_request = CoapTemplates.BAD_REQUEST.value_with(request.token, request.message_id)
-                request.skt.sendto(invalid_request.encode(), request.sender_ip_port)
+                CoapResponder().respond(request, invalid_request)
         except Exception as e:
             # If an exception occurs, send an INTERNAL ERROR response and raise the exception
             coap_response = CoapTemplates.INTERNAL_ERROR.value_with(request.token, request.message_id)
-            request.skt.sendto(coap_response.encode(), request.sender_ip_port)
+            CoapResponder().respond(request, coap_response)
             raise e
 
     @logger
@@ -115,22 +196,63 @@ class ServerResource(Resource):
         """
         try:
             if (request.options.get(CoapOptionDelta.LOCATION_PATH.value) and
-                    request.options.get(CoapOptionDelta.BLOCK1.value)):
-                os.chdir(self.get_path())
-                DriveAssembler().set_save_path(request.payload["upload_path"], False)
-                relative_path = request.payload["upload_path"] + \
-                                request.options[CoapOptionDelta.LOCATION_PATH.value].split('/')[-1]
-                if DriveUtilities.file_exists(relative_path) or DriveUtilities.folder_exists(relative_path):
+                    request.get_option_code() in (CoapOptionDelta.BLOCK1.value, CoapOptionDelta.Q_BLOCK1.value)):
+                # Blocks larger than the local maximum would not fit in the receive buffer
+                if DriveSpliter.get_requested_block_size(request) > DriveSpliter().get_max_block_size():
+                    invalid_request = CoapTemplates.REQUEST_ENTITY_TOO_LARGE.value_with(request.token,
+                                                                                       request.message_id)
+                    invalid_request.options[CoapOptionDelta.SIZE1.value] = DriveSpliter().get_max_block_size()
+                    CoapResponder().respond(request, invalid_request)
+                    return
+
+                upload_path = os.path.join(self.get_path(), request.payload["upload_path"])
+                file_path = os.path.join(upload_path,
+                                         request.options[CoapOptionDelta.LOCATION_PATH.value].split('/')[-1])
+
+                # Files are uploaded as chunks only if the server keeps their index; the recipe of the file comes
+                # first, kept in memory until the client asks which chunks are missing
+                query = request.options.get(CoapOptionDelta.URI_QUERY.value)
+                if query in (DRIVE_CHUNK_RECIPE_QUERY, DRIVE_CHUNK_QUERY) and not DriveChunkStore().is_enabled():
+                    invalid_request = CoapTemplates.BAD_REQUEST.value_with(request.token, request.message_id)
+                    CoapResponder().respond(request, invalid_request)
+                    return
+                elif query == DRIVE_CHUNK_RECIPE_QUERY:
+                    DriveAssembler().read_in_memory(request)
+                    return
+
+                # A new version of a file is sent as a delta against the file, rebuilt next to it
+                if request.options.get(CoapOptionDelta.URI_QUERY.value) == DRIVE_DELTA_QUERY and \
+                        DriveUtilities.file_exists(file_path) and not DriveResume.load(file_path):
+                    DriveAssembler().open_session(request, upload_path)
+                    return
+
+                # A partial upload of the same file continues where it stopped; any other one is dropped
+                state = DriveResume.load(file_path)
+                if state and state["etag"] == request.options.get(CoapOptionDelta.ETAG.value) and \
+                        state["block_size"] == DriveSpliter.get_requested_block_size(request):
+                    resume_point = DriveTemplates.RESUME_POINT.value_with(request.token, request.message_id)
+                    resume_point.payload = {"block": state["next_block"]}
+                    DriveAssembler().open_session(request, upload_path)
+                    CoapResponder().respond(request, resume_point)
+                    return
+                elif state:
+                    DriveResume.discard(file_path)
+                    DriveUtilities.delete_file(file_path)
+
+                if DriveUtilities.file_exists(file_path) or DriveUtilities.folder_exists(file_path):
                     invalid_request = CoapTemplates.CONFLICT.value_with(request.token, request.message_id)
-                    request.skt.sendto(invalid_request.encode(), request.sender_ip_port)
+                    CoapResponder().respond(request, invalid_request)
+                else:
+                    # The blocks of this upload are saved in its folder, whatever the other uploads
+                    DriveAssembler().open_session(request, upload_path)
             else:
                 invalid_request = CoapTemplates.BAD_REQUEST.value_with(request.token, request.message_id)
-                request.skt.sendto(invalid_request.encode(), request.sender_ip_port)
+                CoapResponder().respond(request, invalid_request)
         except Exception as e:
-            # If an exception occurs, reset the save path, send an INTERNAL ERROR response, and raise the exception
-            DriveAssembler().reset_save_path()
+            # If an exception occurs, drop the upload session, send an INTERNAL ERROR response, and raise the exception
+            DriveAssembler().cancel(request)
             coap_response = CoapTemplates.INTERNAL_ERROR.value_with(request.token, request.message_id)
-            request.skt.sendto(coap_response.encode(), request.sender_ip_port)
+            CoapResponder().respond(request, coap_response)
             raise e
 
     @logger
@@ -145,23 +267,22 @@ class ServerResource(Resource):
             Exception: If an error occurs during handling.
         """
         try:
-            os.chdir(self.get_path())
-            path = request.options[CoapOptionDelta.LOCATION_PATH.value]
+            path = os.path.join(self.get_path(), request.options[CoapOptionDelta.LOCATION_PATH.value])
             if DriveUtilities.file_exists(path):
                 os.remove(path)
                 coap_response = CoapTemplates.SUCCESS_DELETED.value_with(request.token, request.message_id)
-                request.skt.sendto(coap_response.encode(), request.sender_ip_port)
+                CoapResponder().respond(request, coap_response)
             elif DriveUtilities.folder_exists(path):
                 shutil.rmtree(path)
                 coap_response = CoapTemplates.SUCCESS_DELETED.value_with(request.token, request.message_id)
-                request.skt.sendto(coap_response.encode(), request.sender_ip_port)
+                CoapResponder().respond(request, coap_response)
             else:
                 invalid_request = CoapTemplates.BAD_REQUEST.value_with(request.token, request.message_id)
-                request.skt.sendto(invalid_request.encode(), request.sender_ip_port)
+                CoapResponder().respond(request, invalid_request)
         except Exception as e:
             # If an exception occurs, send an INTERNAL ERROR response and raise the exception
             coap_response = CoapTemplates.INTERNAL_ERROR.value_with(request.token, request.message_id)
-            request.skt.sendto(coap_response.encode(), request.sender_ip_port)
+            CoapResponder().respond(request, coap_response)
             raise e
 
     @logger
@@ -176,7 +297,6 @@ class ServerResource(Resource):
             Exception: If an error occurs during handling.
         """
         try:
-            os.chdir(self.get_path())
             DriveSpliter().split_on_paths_and_send(request, self.get_path(), self.get_name())
         except Exception as e:
             # If an exception occurs, send an INTERNAL ERROR response and raise the exception
@@ -204,11 +324,14 @@ class ServerResource(Resource):
             Exception: If an error occurs during handling.
         """
         try:
-            if request.code == CoapCodeFormat.SUCCESS_CONTENT.value():
+            if request.message_type == CoapType.RST.value:  # upload canceled or rejected by the client
+                DriveAssembler().cancel(request)
+            elif request.code == CoapCodeFormat.SUCCESS_CONTENT.value():
                 if CoapOptionDelta.LOCATION_PATH.value in request.options:  # response of upload
-                    os.chdir(self.get_path())
-                    path = request.options[CoapOptionDelta.LOCATION_PATH.value]
+                    path = os.path.join(self.get_path(), request.options[CoapOptionDelta.LOCATION_PATH.value])
                     DriveAssembler().handle_packets(request, path)
+            elif request.code == CoapCodeFormat.SUCCESS_CONTINUE.value():  # missing blocks of a download
+                DriveSpliter().handle_missing_blocks(request)
         except Exception as e:
             # If an exception occurs, send an INTERNAL ERROR response and log the exception
             coap_response = CoapTemplates.INTERNAL_ERROR.value_with(request.token, request.message_id)
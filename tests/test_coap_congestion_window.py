@@ -0,0 +1,72 @@
+import itertools
+import unittest
+from unittest import mock
+
+from coap_core.coap_transaction import ACK_TIMEOUT, COAP_INITIAL_WINDOW, COAP_CONCURRENT_TRANSACTIONS, \
+    COAP_MIN_WINDOW, COAP_INITIAL_SLOW_START_THRESHOLD
+from coap_core.coap_transaction.coap_congestion_window import CoapCongestionWindow
+
+
+class TestCoapCongestionWindow(unittest.TestCase):
+
+    def setUp(self):
+        self.window = CoapCongestionWindow()
+
+    def test_acquire_up_to_size(self):
+        for _ in range(COAP_INITIAL_WINDOW):
+            self.assertTrue(self.window.acquire())
+        self.assertFalse(self.window.acquire())
+        self.assertFalse(self.window.has_room())
+        self.assertEqual(self.window.in_flight, COAP_INITIAL_WINDOW)
+
+        self.window.on_release()
+        self.assertTrue(self.window.has_room())
+
+    def test_slow_start(self):
+        self.window.on_send()
+        self.window.on_ack(True, 0.1)
+        self.assertEqual(self.window.size, COAP_INITIAL_WINDOW + 1)
+        self.assertEqual(self.window.in_flight, 0)
+
+    def test_late_ack_does_not_grow(self):
+        self.window.on_send()
+        self.window.on_ack(False, 5.0)
+        self.assertEqual(self.window.size, COAP_INITIAL_WINDOW)
+        self.assertIsNone(self.window.smoothed_rtt)
+
+    def test_congestion_avoidance(self):
+        self.window.on_delivered(COAP_INITIAL_SLOW_START_THRESHOLD)
+        size = self.window.size
+        self.window.on_delivered(size)
+        self.assertEqual(self.window.size, size + 1)
+
+    def test_loss_halves_once_per_timeout(self):
+        self.window.on_delivered(16)
+        size = self.window.size
+        self.window.on_loss()
+        self.assertEqual(self.window.size, size // 2)
+        self.assertEqual(self.window.threshold, size // 2)
+
+        # The losses of the same congestion event are not punished again
+        self.window.on_loss()
+        self.assertEqual(self.window.size, size // 2)
+
+    def test_bounds(self):
+        self.window.on_delivered(COAP_CONCURRENT_TRANSACTIONS ** 2)
+        self.assertEqual(self.window.size, COAP_CONCURRENT_TRANSACTIONS)
+
+        # Losses of distinct congestion events, one ACK_TIMEOUT apart
+        clock = itertools.count(start=ACK_TIMEOUT, step=ACK_TIMEOUT)
+        with mock.patch("coap_core.coap_transaction.coap_congestion_window.time.time", side_effect=clock):
+            for _ in range(20):
+                self.window.on_loss()
+        self.assertEqual(self.window.size, COAP_MIN_WINDOW)
+
+    def test_smoothed_rtt(self):
+        self.window.on_ack(True, 1.0)
+        self.window.on_ack(True, 2.0)
+        self.assertAlmostEqual(self.window.smoothed_rtt, 0.875 * 1.0 + 0.125 * 2.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import os
+import socket
+import time
+import unittest
+from unittest import mock
+
+from coap_core.coap_packet.coap_config import CoapType, CoapCodeFormat
+from coap_core.coap_packet.coap_packet import CoapPacket
+from coap_core.coap_transaction import EXCHANGE_LIFETIME, NON_LIFETIME
+from coap_core.coap_transaction.coap_deduplication_cache import CoapDeduplicationCache
+
+
+class TestCoapDeduplicationCache(unittest.TestCase):
+
+    def setUp(self):
+        # The messages come from the peer socket, so the replayed answers are received on it
+        self.peer = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.peer.bind(("127.0.0.1", 0))
+        self.peer.settimeout(1)
+        self.local = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.cache = CoapDeduplicationCache()
+
+    def tearDown(self):
+        self.peer.close()
+        self.local.close()
+
+    def make_request(self, message_type=CoapType.CON.value, payload=b"payload") -> CoapPacket:
+        return CoapPacket(version=1, message_type=message_type, token=os.urandom(8), code=CoapCodeFormat.PUT.value(),
+                          message_id=1234, payload=payload, sender_ip_port=self.peer.getsockname(), skt=self.local)
+
+    def make_ack(self, request: CoapPacket) -> CoapPacket:
+        return CoapPacket(version=1, message_type=CoapType.ACK.value, token=request.token,
+                          code=CoapCodeFormat.SUCCESS_CHANGED.value(), message_id=request.message_id)
+
+    def test_new_message(self):
+        self.assertFalse(self.cache.replay(self.make_request()))
+
+    def test_duplicate_replays_answer(self):
+        request = self.make_request()
+        ack = self.make_ack(request)
+        self.cache.register(request, ack)
+
+        self.assertTrue(self.cache.replay(request))
+        self.assertEqual(self.peer.recv(1024), ack.encode())
+
+    def test_duplicate_without_answer(self):
+        request = self.make_request(CoapType.NON.value)
+        self.cache.register(request)
+
+        self.assertTrue(self.cache.replay(request))
+        self.peer.settimeout(0.1)
+        with self.assertRaises(socket.timeout):
+            self.peer.recv(1024)
+
+    def test_recycled_message_id(self):
+        request = self.make_request()
+        self.cache.register(request, self.make_ack(request))
+
+        # The same message ID with another message is a new message
+        self.assertFalse(self.cache.replay(self.make_request(payload=b"other")))
+
+    def test_lifetime(self):
+        confirmable, non_confirmable = self.make_request(), self.make_request(CoapType.NON.value)
+        non_confirmable.message_id += 1
+        self.cache.register(confirmable)
+        self.cache.register(non_confirmable)
+
+        now = time.time()
+        with mock.patch("coap_core.coap_transaction.coap_deduplication_cache.time.time",
+                        return_value=now + NON_LIFETIME + 1):
+            self.assertTrue(self.cache.replay(confirmable))
+            self.assertFalse(self.cache.replay(non_confirmable))
+
+        with mock.patch("coap_core.coap_transaction.coap_deduplication_cache.time.time",
+                        return_value=now + EXCHANGE_LIFETIME + 1):
+            self.assertFalse(self.cache.replay(confirmable))
+
+
+if __name__ == '__main__':
+    unittest.main()
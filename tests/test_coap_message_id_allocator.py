@@ -0,0 +1,63 @@
+import unittest
+
+from coap_core.coap_packet.coap_config import gen_token, COAP_TOKEN_LENGTH
+from coap_core.coap_transaction.coap_message_id_allocator import CoapMessageIdAllocator
+
+PEER = ("127.0.0.1", 5683)
+OTHER_PEER = ("127.0.0.2", 5683)
+
+
+class TestCoapMessageIdAllocator(unittest.TestCase):
+
+    def setUp(self):
+        self.allocator = CoapMessageIdAllocator()
+
+    def test_sequence_wraps(self):
+        first = self.allocator.allocate(PEER)
+        ids = [first] + [self.allocator.allocate(PEER) for _ in range(CoapMessageIdAllocator.MESSAGE_ID_SPACE)]
+
+        self.assertEqual(ids[1], (first + 1) % CoapMessageIdAllocator.MESSAGE_ID_SPACE)
+        self.assertEqual(ids[-1], first)
+        self.assertTrue(all(0 <= message_id < CoapMessageIdAllocator.MESSAGE_ID_SPACE for message_id in ids))
+
+    def test_reserved_ids_are_skipped(self):
+        first = self.allocator.allocate(PEER)
+        self.allocator.reserve(PEER, first)
+        self.allocator.reserve(PEER, (first + 2) % CoapMessageIdAllocator.MESSAGE_ID_SPACE)
+
+        for _ in range(CoapMessageIdAllocator.MESSAGE_ID_SPACE - 2):
+            self.assertNotIn(self.allocator.allocate(PEER),
+                             (first, (first + 2) % CoapMessageIdAllocator.MESSAGE_ID_SPACE))
+
+        self.allocator.release(PEER, first)
+        self.assertEqual(self.allocator.allocate(PEER), first)
+
+    def test_peers_are_independent(self):
+        for message_id in range(CoapMessageIdAllocator.MESSAGE_ID_SPACE):
+            self.allocator.reserve(PEER, message_id)
+
+        with self.assertRaises(RuntimeError):
+            self.allocator.allocate(PEER)
+        self.allocator.allocate(OTHER_PEER)
+
+    def test_release_unknown(self):
+        self.allocator.release(OTHER_PEER, 1)
+
+
+class TestGenToken(unittest.TestCase):
+
+    def test_length(self):
+        self.assertEqual(len(gen_token()), COAP_TOKEN_LENGTH)
+        self.assertEqual(len(gen_token(4)), 4)
+
+    def test_invalid_length(self):
+        for length in (0, 3, 9):
+            with self.assertRaises(ValueError):
+                gen_token(length)
+
+    def test_random(self):
+        self.assertEqual(len({gen_token() for _ in range(100)}), 100)
+
+
+if __name__ == '__main__':
+    unittest.main()
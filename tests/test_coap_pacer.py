@@ -0,0 +1,58 @@
+import unittest
+from unittest import mock
+
+from coap_core.coap_transaction import COAP_PACING_BURST
+from coap_core.coap_transaction.coap_pacer import CoapPacer
+
+
+class TestCoapPacer(unittest.TestCase):
+
+    def setUp(self):
+        # A clock that only moves when the test moves it
+        self.now = 100.0
+        patcher = mock.patch("coap_core.coap_transaction.coap_pacer.time")
+        self.time = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.time.time.side_effect = lambda: self.now
+
+        self.pacer = CoapPacer()
+
+    def test_no_rate(self):
+        for _ in range(100):
+            self.pacer.pace(1000, None)
+        self.time.sleep.assert_not_called()
+
+    def test_burst_then_rate(self):
+        for _ in range(COAP_PACING_BURST):
+            self.pacer.pace(1000, 10000)
+        self.time.sleep.assert_not_called()
+
+        # The bucket is empty: the next datagram waits for its own size at the rate
+        self.pacer.pace(1000, 10000)
+        self.time.sleep.assert_called_once()
+        self.assertAlmostEqual(self.time.sleep.call_args.args[0], 0.1)
+
+    def test_refill(self):
+        for _ in range(COAP_PACING_BURST):
+            self.pacer.pace(1000, 10000)
+
+        # More than two datagrams worth of tokens are refilled
+        self.now += 0.25
+        self.pacer.pace(1000, 10000)
+        self.pacer.pace(1000, 10000)
+        self.time.sleep.assert_not_called()
+
+    def test_refill_is_capped_at_burst(self):
+        self.pacer.pace(1000, 10000)
+        self.now += 3600
+
+        for _ in range(COAP_PACING_BURST):
+            self.pacer.pace(1000, 10000)
+        self.time.sleep.assert_not_called()
+
+        self.pacer.pace(1000, 10000)
+        self.time.sleep.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+import unittest
+
+from coap_core.coap_packet.coap_config import CoapOptionDelta, CoapType, CoapCodeFormat
+from coap_core.coap_packet.coap_packet import CoapPacket
+
+
+class TestBlockOption(unittest.TestCase):
+
+    def test_encode_decode(self):
+        option = CoapPacket.encode_option_block(5, 1, 6)
+        self.assertEqual(CoapPacket.decode_option_block(option), {'NUM': 5, 'M': 1, 'SZX': 6, 'BLOCK_SIZE': 1024})
+
+    def test_num_limits(self):
+        last = CoapPacket.BLOCK_NUM_LIMIT - 1
+        self.assertEqual(CoapPacket.decode_option_block(CoapPacket.encode_option_block(last, 0))["NUM"], last)
+
+        with self.assertRaises(ValueError):
+            CoapPacket.encode_option_block(CoapPacket.BLOCK_NUM_LIMIT, 0)
+        with self.assertRaises(ValueError):
+            CoapPacket.encode_option_block(-1, 0)
+
+    def test_sub_session(self):
+        packet = CoapPacket()
+        num = 3 * CoapPacket.BLOCK_NUM_LIMIT + 7
+        packet.set_option_block(CoapOptionDelta.BLOCK2.value, num, 1)
+        self.assertEqual(packet.options[CoapOptionDelta.SUB_SESSION.value], 3)
+        self.assertEqual(packet.get_block_id(), num)
+
+        # A block of the first sub-session does not carry the option
+        packet.set_option_block(CoapOptionDelta.BLOCK2.value, 7, 1)
+        self.assertNotIn(CoapOptionDelta.SUB_SESSION.value, packet.options)
+        self.assertEqual(packet.get_block_id(), 7)
+
+    def test_sub_session_round_trip(self):
+        packet = CoapPacket(version=1, message_type=CoapType.CON.value, token=b"\x01\x02",
+                            code=CoapCodeFormat.SUCCESS_CONTENT.value(), message_id=42, payload=b"data")
+        num = CoapPacket.BLOCK_NUM_LIMIT + 1
+        packet.set_option_block(CoapOptionDelta.BLOCK2.value, num, 0)
+
+        decoded = CoapPacket.decode(packet.encode(), ("127.0.0.1", 5683), None)
+        self.assertEqual(decoded.get_block_id(), num)
+        self.assertEqual(decoded.message_id, 42)
+        self.assertEqual(decoded.payload, b"data")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import os
+import socket
+import threading
+import unittest
+
+from coap_core.coap_packet.coap_config import CoapOptionDelta, CoapType, CoapCodeFormat
+from coap_core.coap_packet.coap_packet import CoapPacket
+from coap_core.coap_transaction import COAP_INITIAL_WINDOW
+from coap_core.coap_transaction.coap_transaction_pool import CoapTransactionPool
+
+
+class TestCoapTransactionPool(unittest.TestCase):
+
+    def setUp(self):
+        # Every test sends to its own peer, so the windows of the shared pool do not interfere
+        self.receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.receiver.bind(("127.0.0.1", 0))
+        self.sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.peer = self.receiver.getsockname()
+        self.token = os.urandom(8)
+        self.pool = CoapTransactionPool()
+
+    def tearDown(self):
+        self.pool.set_overall_transaction_failure(self.make_block(0))
+        self.receiver.close()
+        self.sender.close()
+
+    def make_block(self, num: int) -> CoapPacket:
+        packet = CoapPacket(version=1, message_type=CoapType.CON.value, token=self.token,
+                            code=CoapCodeFormat.SUCCESS_CONTENT.value(),
+                            message_id=self.pool.next_message_id(self.peer), skt=self.sender,
+                            sender_ip_port=self.peer)
+        packet.set_option_block(CoapOptionDelta.BLOCK2.value, num, 1)
+        return packet
+
+    def send_block(self, num: int) -> CoapPacket:
+        packet = self.make_block(num)
+        self.assertFalse(self.pool.handle_congestions(packet))
+        self.pool.add_transaction(packet)
+        return packet
+
+    def get_window(self):
+        return self.pool._CoapTransactionPool__windows[self.peer]
+
+    def test_reserved_slot_is_counted_once(self):
+        blocks = [self.send_block(num) for num in range(COAP_INITIAL_WINDOW)]
+        self.assertEqual(self.get_window().in_flight, COAP_INITIAL_WINDOW)
+
+        for packet in blocks:
+            self.pool.finish_transaction(packet)
+        self.assertEqual(self.get_window().in_flight, 0)
+
+    def test_full_window_blocks_until_acknowledged(self):
+        blocks = [self.send_block(num) for num in range(COAP_INITIAL_WINDOW)]
+
+        reserved = threading.Event()
+        waiting = self.make_block(COAP_INITIAL_WINDOW)
+
+        def send():
+            if not self.pool.handle_congestions(waiting):
+                reserved.set()
+
+        thread = threading.Thread(target=send, daemon=True)
+        thread.start()
+        self.assertFalse(reserved.wait(0.3))
+
+        self.pool.finish_transaction(blocks[0])
+        self.assertTrue(reserved.wait(1))
+        thread.join(1)
+        self.assertEqual(self.get_window().in_flight, COAP_INITIAL_WINDOW)
+
+        self.pool.add_transaction(waiting)
+        self.assertEqual(self.get_window().in_flight, COAP_INITIAL_WINDOW)
+
+    def test_last_packet_waits_for_pending(self):
+        first = self.send_block(0)
+        last = self.make_block(1)
+
+        done = threading.Event()
+        thread = threading.Thread(target=lambda: self.pool.handle_congestions(last, True) or done.set(),
+                                  daemon=True)
+        thread.start()
+        self.assertFalse(done.wait(0.3))
+
+        self.pool.finish_transaction(first)
+        self.assertTrue(done.wait(1))
+        self.pool.add_transaction(last)
+
+    def test_failure_releases_slots(self):
+        for num in range(COAP_INITIAL_WINDOW):
+            self.send_block(num)
+
+        self.pool.set_overall_transaction_failure(self.make_block(0))
+        self.assertEqual(self.get_window().in_flight, 0)
+        self.assertTrue(self.pool.handle_congestions(self.make_block(COAP_INITIAL_WINDOW)))
+        self.assertEqual(self.get_window().in_flight, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import unittest
+
+from share_drive.share_drive_helpers import DRIVE_BUFFER_POOL_SIZE
+from share_drive.share_drive_helpers.drive_buffer_pool import DriveBufferPool, DriveBuffer
+
+
+class TestDriveBufferPool(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = DriveBufferPool()
+
+    def test_buffer_is_reused(self):
+        buffer = self.pool.acquire(4099)
+        self.assertIsInstance(buffer, DriveBuffer)
+        self.assertEqual(len(buffer), 4099)
+
+        # A block is returned as a view of its buffer
+        self.pool.release(memoryview(buffer)[:100])
+        self.assertIs(self.pool.acquire(4099), buffer)
+        self.assertIsNot(self.pool.acquire(4099), buffer)
+
+    def test_buffers_are_kept_by_size(self):
+        buffer = self.pool.acquire(4101)
+        self.pool.release(buffer)
+        self.assertIsNot(self.pool.acquire(4103), buffer)
+        self.assertIs(self.pool.acquire(4101), buffer)
+
+    def test_foreign_buffers_are_ignored(self):
+        buffer = bytearray(4107)
+        self.pool.release(memoryview(buffer))
+        self.pool.release(b"block")
+        self.assertIsNot(self.pool.acquire(4107), buffer)
+
+    def test_idle_buffers_are_bounded(self):
+        size = DRIVE_BUFFER_POOL_SIZE // 4 + 1
+        buffers = [self.pool.acquire(size) for _ in range(5)]
+        for buffer in buffers:
+            self.pool.release(buffer)
+
+        reused = [buffer for buffer in (self.pool.acquire(size) for _ in range(5))
+                  if any(buffer is released for released in buffers)]
+        self.assertEqual(len(reused), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,184 @@
+import os
+import random
+import tempfile
+import unittest
+
+from share_drive.share_drive_helpers import DRIVE_CHUNK_MIN_SIZE, DRIVE_CHUNK_MAX_SIZE, DRIVE_CHUNK_SUFFIX
+from share_drive.share_drive_helpers.drive_chunks import DriveChunker, DriveChunkStore, DriveChunkWriter, \
+    WINDOW_SIZE
+from share_drive.share_drive_helpers.drive_utils import DriveFileReader
+
+
+class ChunksTestCase(unittest.TestCase):
+
+    def setUp(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.folder = folder.name
+        self.random = random.Random(49)
+
+    def write(self, name: str, content: bytes) -> str:
+        path = os.path.join(self.folder, name)
+        with open(path, 'wb') as file:
+            file.write(content)
+        return path
+
+    @staticmethod
+    def get_recipe(path: str) -> dict:
+        with DriveFileReader(path, WINDOW_SIZE) as reader:
+            return DriveChunker.get_recipe(reader)
+
+
+class TestDriveChunker(ChunksTestCase):
+
+    def get_chunks(self, content: bytes) -> list[tuple[int, int]]:
+        with DriveFileReader(self.write("file.bin", content), WINDOW_SIZE) as reader:
+            return list(DriveChunker.get_chunks(reader))
+
+    def test_chunks_cover_the_file(self):
+        content = self.random.randbytes(3 * 1024 * 1024 + 12345)
+        chunks = self.get_chunks(content)
+
+        self.assertEqual(chunks[0][0], 0)
+        for (offset, length), (next_offset, _) in zip(chunks, chunks[1:]):
+            self.assertEqual(offset + length, next_offset)
+            self.assertTrue(DRIVE_CHUNK_MIN_SIZE <= length <= DRIVE_CHUNK_MAX_SIZE)
+        self.assertEqual(sum(chunks[-1]), len(content))
+
+    def test_small_files(self):
+        self.assertEqual(self.get_chunks(b""), [])
+        self.assertEqual(self.get_chunks(b"small"), [(0, 5)])
+
+    def test_repeated_bytes_are_cut_at_the_maximum(self):
+        chunks = self.get_chunks(bytes(3 * DRIVE_CHUNK_MAX_SIZE))
+        self.assertEqual([length for _, length in chunks], [DRIVE_CHUNK_MAX_SIZE] * 3)
+
+    def test_insertion_moves_few_chunks(self):
+        content = self.random.randbytes(3 * 1024 * 1024)
+        changed = content[:1500000] + b"inserted" + content[1500000:]
+
+        before = {digest for digest, _ in self.get_recipe(self.write("a.bin", content))["chunks"]}
+        after = self.get_recipe(self.write("b.bin", changed))["chunks"]
+        new = [length for digest, length in after if digest not in before]
+        self.assertLessEqual(len(new), 3)
+
+    def test_recipe(self):
+        content = self.random.randbytes(200000)
+        recipe = self.get_recipe(self.write("file.bin", content))
+
+        self.assertEqual(recipe["size"], len(content))
+        self.assertEqual(recipe["digest"], DriveChunker.get_digest(content))
+        self.assertEqual(recipe["stat"].st_size, len(content))
+
+        parsed = DriveChunker.parse_recipe(DriveChunker.encode_recipe(recipe))
+        self.assertEqual(parsed, {key: recipe[key] for key in ("size", "digest", "chunks")})
+
+    def test_invalid_recipe(self):
+        data = DriveChunker.encode_recipe(self.get_recipe(self.write("file.bin", self.random.randbytes(50000))))
+        self.assertIsNone(DriveChunker.parse_recipe(None))
+        self.assertIsNone(DriveChunker.parse_recipe(data[:-1]))
+        # The chunks do not add up to the size
+        self.assertIsNone(DriveChunker.parse_recipe(data[:-20]))
+
+    def test_missing(self):
+        indexes = [0, 1, 2, 5, 7, 8]
+        self.assertEqual(DriveChunker.encode_missing(indexes), b"[[0, 2], [5, 5], [7, 8]]")
+        self.assertEqual(DriveChunker.parse_missing(DriveChunker.encode_missing(indexes)), set(indexes))
+        self.assertEqual(DriveChunker.parse_missing(b"[]"), set())
+        for data in (None, b"not json", b"[1]"):
+            self.assertIsNone(DriveChunker.parse_missing(data))
+
+    def test_get_size(self):
+        path = self.write("file.bin", self.random.randbytes(300000))
+        recipe = self.get_recipe(path)
+        missing = set(range(0, len(recipe["chunks"]), 2))
+
+        size = sum(map(len, DriveChunker.split_on_packets(recipe, missing, path, 1024)))
+        self.assertEqual(DriveChunker.get_size(recipe, missing), size)
+
+    def test_file_changed_after_the_recipe(self):
+        path = self.write("file.bin", self.random.randbytes(100000))
+        recipe = self.get_recipe(path)
+        with open(path, 'ab') as file:
+            file.write(b"more")
+
+        with self.assertRaises(OSError):
+            list(DriveChunker.split_on_packets(recipe, set(), path, 1024))
+
+
+class TestDriveChunkStore(ChunksTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        store = tempfile.TemporaryDirectory()
+        cls.addClassCleanup(store.cleanup)
+        DriveChunkStore().set_store(os.path.join(store.name, "index", "chunks.db"))
+
+    def upload(self, source: str, name: str) -> DriveChunkWriter:
+        recipe = self.get_recipe(source)
+        missing = set(DriveChunkStore().get_missing(recipe))
+
+        writer = DriveChunkWriter(os.path.join(self.folder, name))
+        for block in DriveChunker.split_on_packets(recipe, missing, source, 1024):
+            writer.feed(block)
+        return writer
+
+    def test_upload_of_a_changed_file(self):
+        content = self.random.randbytes(500000)
+        stored = self.write("stored.bin", content)
+        DriveChunkStore().add_file(stored, self.get_recipe(stored))
+
+        changed = content[:200000] + self.random.randbytes(1000) + content[200000:]
+        source = self.write("source.bin", changed)
+        recipe = self.get_recipe(source)
+        self.assertLessEqual(len(DriveChunkStore().get_missing(recipe)), 3)
+
+        writer = self.upload(source, "uploaded.bin")
+        self.assertTrue(writer.finished)
+        with open(os.path.join(self.folder, "uploaded.bin"), 'rb') as file:
+            self.assertEqual(file.read(), changed)
+        self.assertFalse(os.path.exists(os.path.join(self.folder, "uploaded.bin" + DRIVE_CHUNK_SUFFIX)))
+
+    def test_same_file_is_linked(self):
+        content = self.random.randbytes(100000)
+        stored = self.write("stored.bin", content)
+        DriveChunkStore().add_file(stored, self.get_recipe(stored))
+        self.assertEqual(DriveChunkStore().find_file(len(content), DriveChunker.get_digest(content)),
+                         os.path.abspath(stored))
+
+        self.assertTrue(self.upload(self.write("source.bin", content), "uploaded.bin").finished)
+        self.assertTrue(os.path.samefile(stored, os.path.join(self.folder, "uploaded.bin")))
+
+    def test_changed_files_are_not_used(self):
+        stored = self.write("stored.bin", self.random.randbytes(100000))
+        recipe = self.get_recipe(stored)
+        DriveChunkStore().add_file(stored, recipe)
+
+        self.write("stored.bin", self.random.randbytes(100000))
+        self.assertEqual(DriveChunkStore().get_missing(recipe), list(range(len(recipe["chunks"]))))
+
+    def test_refresh(self):
+        stored = self.write("stored.bin", self.random.randbytes(100000))
+        recipe = self.get_recipe(stored)
+
+        DriveChunkStore().refresh(self.folder)
+        self.assertEqual(DriveChunkStore().get_missing(recipe), [])
+
+        os.remove(stored)
+        DriveChunkStore().refresh(self.folder)
+        self.assertIsNone(DriveChunkStore().find_file(recipe["size"], recipe["digest"]))
+
+    def test_unknown_reference(self):
+        path = self.write("source.bin", self.random.randbytes(100000))
+        recipe = self.get_recipe(path)
+
+        # Every chunk sent by its digest, none of them indexed
+        writer = DriveChunkWriter(os.path.join(self.folder, "uploaded.bin"))
+        for block in DriveChunker.split_on_packets(recipe, set(), path, 1024):
+            writer.feed(block)
+        self.assertTrue(writer.failed)
+        self.assertFalse(os.path.exists(os.path.join(self.folder, "uploaded.bin" + DRIVE_CHUNK_SUFFIX)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import os
+import tempfile
+import unittest
+import zlib
+
+from share_drive.share_drive_helpers.drive_compression import DriveCompression
+
+TEXT = b"The blocks of a transfer are compressed one by one. " * 40
+
+
+class TestDriveCompression(unittest.TestCase):
+
+    def test_option(self):
+        for method in (DriveCompression.ZLIB, DriveCompression.LZMA):
+            self.assertEqual(DriveCompression.decode_option(DriveCompression.encode_option(method, 6)), (method, 6))
+        self.assertIsNone(DriveCompression.decode_option(0))
+        self.assertIsNone(DriveCompression.decode_option(DriveCompression.encode_option(7, 6)))
+        self.assertIsNone(DriveCompression.decode_option(DriveCompression.encode_option(DriveCompression.ZLIB, 12)))
+
+    def test_round_trip(self):
+        for method in (DriveCompression.ZLIB, DriveCompression.LZMA):
+            compressed = DriveCompression.compress(TEXT, method, 6)
+            self.assertEqual(compressed[0], method)
+            self.assertLess(len(compressed), len(TEXT))
+            self.assertEqual(DriveCompression.decompress(compressed, len(TEXT)), TEXT)
+
+    def test_incompressible_block_is_raw(self):
+        block = os.urandom(1024)
+        compressed = DriveCompression.compress(block, DriveCompression.ZLIB, 9)
+        self.assertEqual(compressed, bytes((DriveCompression.RAW,)) + block)
+        self.assertEqual(DriveCompression.decompress(compressed, 1024), block)
+
+    def test_block_larger_than_the_block_size(self):
+        for method in (DriveCompression.ZLIB, DriveCompression.LZMA):
+            compressed = DriveCompression.compress(TEXT, method, 6)
+            self.assertIsNone(DriveCompression.decompress(compressed, len(TEXT) - 1))
+        self.assertIsNone(DriveCompression.decompress(bytes((DriveCompression.RAW,)) + TEXT, len(TEXT) - 1))
+
+    def test_invalid_blocks(self):
+        compressed = DriveCompression.compress(TEXT, DriveCompression.ZLIB, 6)
+        self.assertIsNone(DriveCompression.decompress(b"", 4096))
+        self.assertIsNone(DriveCompression.decompress(bytes((9,)) + TEXT, 4096))
+        # Truncated, followed by other bytes, or not deflate at all
+        self.assertIsNone(DriveCompression.decompress(compressed[:-4], 4096))
+        self.assertIsNone(DriveCompression.decompress(compressed + b"tail", 4096))
+        self.assertIsNone(DriveCompression.decompress(bytes((DriveCompression.ZLIB,)) + os.urandom(64), 4096))
+
+    def test_decompression_bomb(self):
+        compressor = zlib.compressobj(9, zlib.DEFLATED, -zlib.MAX_WBITS)
+        bomb = bytes((DriveCompression.ZLIB,)) + compressor.compress(bytes(10 ** 7)) + compressor.flush()
+        self.assertIsNone(DriveCompression.decompress(bomb, 1024))
+
+
+class TestIsCompressible(unittest.TestCase):
+
+    def setUp(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.folder = folder.name
+
+    def write(self, name: str, content: bytes) -> str:
+        path = os.path.join(self.folder, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as file:
+            file.write(content)
+        return path
+
+    def test_files(self):
+        self.assertTrue(DriveCompression.is_compressible(self.write("a.txt", TEXT), DriveCompression.ZLIB, 6))
+        self.assertFalse(DriveCompression.is_compressible(self.write("b.bin", os.urandom(8192)),
+                                                          DriveCompression.ZLIB, 6))
+        # Compressed types are not sampled
+        self.assertFalse(DriveCompression.is_compressible(self.write("c.zip", TEXT), DriveCompression.ZLIB, 6))
+
+    def test_folders(self):
+        self.write("text/a.txt", TEXT)
+        self.write("text/sub/b.txt", TEXT)
+        self.write("random/a.bin", os.urandom(8192))
+
+        self.assertTrue(DriveCompression.is_compressible(os.path.join(self.folder, "text"),
+                                                         DriveCompression.LZMA, 6))
+        self.assertFalse(DriveCompression.is_compressible(os.path.join(self.folder, "random"),
+                                                          DriveCompression.LZMA, 6))
+
+    def test_missing_file(self):
+        self.assertFalse(DriveCompression.is_compressible(os.path.join(self.folder, "missing.txt"),
+                                                          DriveCompression.ZLIB, 6))
+
+
+if __name__ == '__main__':
+    unittest.main()
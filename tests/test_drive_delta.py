@@ -0,0 +1,181 @@
+import os
+import random
+import tempfile
+import unittest
+
+from share_drive.share_drive_helpers import DRIVE_DELTA_MIN_BLOCK_SIZE, DRIVE_DELTA_MAX_BLOCKS
+from share_drive.share_drive_helpers.drive_delta import DriveDelta, DriveDeltaPatcher, COPY, DATA, END
+from share_drive.share_drive_helpers.drive_utils import DriveFileReader
+
+
+class TestDriveDelta(unittest.TestCase):
+
+    def setUp(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.folder = folder.name
+
+        self.random = random.Random(48)
+        self.base = self.random.randbytes(50000)
+
+    def write(self, name: str, content: bytes) -> str:
+        path = os.path.join(self.folder, name)
+        with open(path, 'wb') as file:
+            file.write(content)
+        return path
+
+    def get_operations(self, base: bytes, new: bytes) -> tuple[list, str]:
+        signature = DriveDelta.parse_signature(DriveDelta.signature(self.write("base.bin", base)))
+        path = self.write("new.bin", new)
+        with DriveFileReader(path, DriveDelta.get_window_size(signature)) as reader:
+            return DriveDelta.get_operations(signature, reader), path
+
+    def apply(self, operations: list, path: str, block_size: int = 1024) -> bytes:
+        target = os.path.join(self.folder, "rebuilt.bin")
+        patcher = DriveDeltaPatcher(os.path.join(self.folder, "base.bin"), target)
+        for block in DriveDelta.split_on_packets(operations, path, os.stat(path), block_size):
+            patcher.feed(block)
+
+        self.assertTrue(patcher.finished)
+        self.assertFalse(os.path.exists(target + ".delta"))
+        with open(target, 'rb') as file:
+            return file.read()
+
+    @staticmethod
+    def get_data_size(operations: list) -> int:
+        return sum(length for operation, _, length in operations if operation == DATA)
+
+    def test_block_size(self):
+        self.assertEqual(DriveDelta.get_block_size(0), DRIVE_DELTA_MIN_BLOCK_SIZE)
+        self.assertEqual(DriveDelta.get_block_size(DRIVE_DELTA_MAX_BLOCKS * 4096), 4096)
+        self.assertEqual(DriveDelta.get_block_size(DRIVE_DELTA_MAX_BLOCKS * 4096 + 1), 4097)
+
+    def test_signature(self):
+        signature = DriveDelta.parse_signature(DriveDelta.signature(self.write("base.bin", self.base)))
+        self.assertEqual(signature["size"], len(self.base))
+        self.assertEqual(len(signature["blocks"]), -(-len(self.base) // signature["block_size"]))
+
+    def test_invalid_signature(self):
+        data = DriveDelta.signature(self.write("base.bin", self.base))
+        self.assertIsNone(DriveDelta.parse_signature(None))
+        self.assertIsNone(DriveDelta.parse_signature(data[:10]))
+        self.assertIsNone(DriveDelta.parse_signature(data[:-1]))
+
+    def test_same_file(self):
+        operations, path = self.get_operations(self.base, self.base)
+        self.assertEqual(self.get_data_size(operations), 0)
+        self.assertEqual(operations[0], (COPY, 0, len(self.base)))
+        self.assertEqual(self.apply(operations, path), self.base)
+
+    def test_append(self):
+        new = self.base + self.random.randbytes(3000)
+        operations, path = self.get_operations(self.base, new)
+        self.assertEqual(operations[:2], [(COPY, 0, len(self.base)), (DATA, len(self.base), 3000)])
+        self.assertEqual(self.apply(operations, path), new)
+
+    def test_insertion_and_deletion(self):
+        new = self.base[:10000] + b"inserted" + self.base[10000:30000] + self.base[31000:]
+        operations, path = self.get_operations(self.base, new)
+
+        # Only the blocks around the changes are sent
+        self.assertLessEqual(self.get_data_size(operations), 4 * 1024)
+        self.assertEqual(self.apply(operations, path), new)
+
+    def test_unrelated_file(self):
+        new = self.random.randbytes(20000)
+        operations, path = self.get_operations(self.base, new)
+        self.assertEqual(operations[:-1], [(DATA, 0, len(new))])
+        self.assertEqual(operations[-1][:2], (END, len(new)))
+        self.assertEqual(self.apply(operations, path, 512), new)
+
+    def test_empty_files(self):
+        operations, path = self.get_operations(self.base, b"")
+        self.assertEqual(self.apply(operations, path), b"")
+
+        operations, path = self.get_operations(b"", self.base)
+        self.assertEqual(self.apply(operations, path), self.base)
+
+    def test_get_size(self):
+        new = self.base[:20000] + self.random.randbytes(100000) + self.base[20000:]
+        operations, path = self.get_operations(self.base, new)
+        size = sum(map(len, DriveDelta.split_on_packets(operations, path, os.stat(path), 1024)))
+        self.assertEqual(DriveDelta.get_size(operations), size)
+
+    def test_rebuild_operations(self):
+        new = self.base[:25000] + self.random.randbytes(5000) + self.base[25000:]
+        signature = DriveDelta.parse_signature(DriveDelta.signature(self.write("new.bin", new)))
+        with DriveFileReader(self.write("base.bin", self.base), DriveDelta.get_window_size(signature)) as reader:
+            operations = DriveDelta.get_rebuild_operations(signature, reader)
+
+        # The copies come from the older copy, the data from the file of the signature
+        rebuilt = bytearray()
+        for operation, offset, length in operations[:-1]:
+            rebuilt += (self.base if operation == COPY else new)[offset:offset + length]
+        self.assertEqual(bytes(rebuilt), new)
+        self.assertLess(self.get_data_size(operations), len(new) // 2)
+        self.assertEqual(operations[-1], (END, len(new), signature["digest"]))
+
+    def test_file_changed_after_the_scan(self):
+        operations, path = self.get_operations(self.base, self.base + b"appended")
+        snapshot = os.stat(path)
+        with open(path, 'ab') as file:
+            file.write(b"more")
+
+        with self.assertRaises(OSError):
+            list(DriveDelta.split_on_packets(operations, path, snapshot, 1024))
+
+    def test_patcher_rejects_a_wrong_delta(self):
+        operations, path = self.get_operations(self.base, self.base[:40000])
+        target = self.write("rebuilt.bin", b"previous")
+
+        patcher = DriveDeltaPatcher(os.path.join(self.folder, "base.bin"), target)
+        for block in DriveDelta.split_on_packets(operations[:-1], path, os.stat(path), 1024):
+            patcher.feed(block)
+        patcher.feed(DriveDelta.encode_end(40000, bytes(16)))
+
+        self.assertTrue(patcher.failed)
+        with open(target, 'rb') as file:
+            self.assertEqual(file.read(), b"previous")
+
+
+class TestDriveFileReader(unittest.TestCase):
+
+    def setUp(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+
+        self.content = random.Random(42).randbytes(10000)
+        self.path = os.path.join(folder.name, "file.bin")
+        with open(self.path, 'wb') as file:
+            file.write(self.content)
+
+    def test_view(self):
+        with DriveFileReader(self.path, 4096) as reader:
+            self.assertEqual(reader.size, len(self.content))
+            for offset, length in ((0, 100), (50, 4096), (3000, 2000), (9000, 4096), (10000, 10), (0, 0)):
+                self.assertEqual(bytes(reader.view(offset, length)), self.content[offset:offset + length])
+
+            with self.assertRaises(ValueError):
+                reader.view(0, 4097)
+
+    def test_changed_file(self):
+        with DriveFileReader(self.path, 4096) as reader:
+            snapshot = reader.stat
+            reader.check()
+            with open(self.path, 'ab') as file:
+                file.write(b"more")
+            with self.assertRaises(OSError):
+                reader.check()
+
+        with self.assertRaises(OSError):
+            DriveFileReader(self.path, 4096, snapshot)
+
+    def test_shrunk_file(self):
+        with DriveFileReader(self.path, 4096) as reader:
+            os.truncate(self.path, 5000)
+            with self.assertRaises(OSError):
+                reader.view(4000, 4096)
+
+
+if __name__ == '__main__':
+    unittest.main()
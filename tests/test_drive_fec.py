@@ -0,0 +1,57 @@
+import os
+import unittest
+
+from share_drive.share_drive_helpers.drive_fec import DriveFec
+
+
+class TestDriveFec(unittest.TestCase):
+
+    def test_option(self):
+        self.assertEqual(DriveFec.decode_option(DriveFec.encode_option(8, 2)), (8, 2))
+        self.assertIsNone(DriveFec.decode_option(0))
+        # More parity blocks than data blocks, or none at all
+        self.assertIsNone(DriveFec.decode_option(DriveFec.encode_option(2, 3)))
+        self.assertIsNone(DriveFec.decode_option(DriveFec.encode_option(8, 0)))
+
+    def test_group_members(self):
+        self.assertEqual(DriveFec.group_members(0, 0, 8, 2, 100), [0, 2, 4, 6])
+        self.assertEqual(DriveFec.group_members(1, 1, 8, 2, 100), [9, 11, 13, 15])
+        # The last group of the file is shorter
+        self.assertEqual(DriveFec.group_members(12, 1, 8, 2, 100), [97, 99])
+
+    def test_recover_each_block(self):
+        # The last block of the file is shorter, and rebuilt with its exact length
+        blocks = [os.urandom(1024) for _ in range(7)] + [os.urandom(100)]
+        parity = DriveFec.make_parity(blocks, 2)
+        self.assertEqual(len(parity), 2)
+
+        for missing in range(len(blocks)):
+            parity_index = missing % 2
+            received = [blocks[num] for num in range(parity_index, len(blocks), 2) if num != missing]
+            self.assertEqual(DriveFec.recover(parity[parity_index], received), blocks[missing])
+
+    def test_recover_two_blocks_of_different_parity(self):
+        blocks = [os.urandom(512) for _ in range(8)]
+        parity = DriveFec.make_parity(blocks, 2)
+
+        self.assertEqual(DriveFec.recover(parity[0], [blocks[0], blocks[2], blocks[6]]), blocks[4])
+        self.assertEqual(DriveFec.recover(parity[1], [blocks[1], blocks[3], blocks[7]]), blocks[5])
+
+    def test_short_group(self):
+        blocks = [b"only block"]
+        parity = DriveFec.make_parity(blocks, 2)
+        self.assertEqual(len(parity), 1)
+        self.assertEqual(DriveFec.recover(parity[0], []), blocks[0])
+
+    def test_corrupted_parity(self):
+        blocks = [os.urandom(64) for _ in range(4)]
+        parity = DriveFec.make_parity(blocks, 1)[0]
+
+        # A received block longer than the parity block
+        self.assertIsNone(DriveFec.recover(parity, [os.urandom(128)]))
+        # A length prefix beyond the parity block
+        self.assertIsNone(DriveFec.recover(b"\xff\xff" + parity[2:], blocks[1:]))
+
+
+if __name__ == '__main__':
+    unittest.main()
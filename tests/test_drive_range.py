@@ -0,0 +1,74 @@
+import os
+import tempfile
+import unittest
+
+from coap_core.coap_packet.coap_config import CoapOptionDelta
+from coap_core.coap_packet.coap_packet import CoapPacket
+from share_drive.share_drive_helpers.drive_buffer_pool import DriveBufferPool
+from share_drive.share_drive_helpers.drive_spliter import DriveSpliter
+from share_drive.share_drive_helpers.drive_utils import DriveUtilities
+
+
+def get_range(query: str, file_size: int = 10000, block_size: int = 1024):
+    request = CoapPacket(options={CoapOptionDelta.URI_QUERY.value: query})
+    return DriveSpliter.get_requested_range(request, file_size, block_size)
+
+
+class TestRequestedRange(unittest.TestCase):
+
+    def test_bytes(self):
+        self.assertEqual(get_range("bytes=100-199"), (100, 199))
+        self.assertEqual(get_range("bytes=100-"), (100, 9999))
+        self.assertEqual(get_range("bytes=5-5"), (5, 5))
+        # The last bytes of the file
+        self.assertEqual(get_range("bytes=-300"), (9700, 9999))
+        self.assertEqual(get_range("bytes=-20000"), (0, 9999))
+
+    def test_range_is_trimmed_to_the_file(self):
+        self.assertEqual(get_range("bytes=9000-20000"), (9000, 9999))
+
+    def test_blocks(self):
+        self.assertEqual(get_range("blocks=2-3"), (2048, 4095))
+        self.assertEqual(get_range("blocks=9-"), (9216, 9999))
+
+    def test_invalid(self):
+        for query in ("", "bytes", "bytes=", "bytes=-", "bytes=a-b", "bytes=200-100", "bytes=10000-",
+                      "blocks=-2", "blocks=10-", "lines=1-2", "bytes=-1-2"):
+            self.assertIsNone(get_range(query), query)
+
+    def test_empty_file(self):
+        self.assertIsNone(get_range("bytes=0-", file_size=0))
+
+
+class TestSplitOnRange(unittest.TestCase):
+
+    def setUp(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+
+        self.content = os.urandom(5000)
+        self.path = os.path.join(folder.name, "file.bin")
+        with open(self.path, 'wb') as file:
+            file.write(self.content)
+
+    def split(self, first_byte: int, last_byte: int) -> list[bytes]:
+        chunks = []
+        for chunk in DriveUtilities.split_on_range(self.path, 1024, first_byte, last_byte):
+            chunks.append(bytes(chunk))
+            DriveBufferPool().release(chunk)
+        return chunks
+
+    def test_chunks_are_aligned_to_blocks(self):
+        chunks = self.split(1000, 3000)
+        self.assertEqual([len(chunk) for chunk in chunks], [24, 1024, 953])
+        self.assertEqual(b"".join(chunks), self.content[1000:3001])
+
+    def test_range_within_a_block(self):
+        self.assertEqual(self.split(10, 20), [self.content[10:21]])
+
+    def test_range_past_the_end(self):
+        self.assertEqual(b"".join(self.split(4000, 9999)), self.content[4000:])
+
+
+if __name__ == '__main__':
+    unittest.main()
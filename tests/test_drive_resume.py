@@ -0,0 +1,57 @@
+import os
+import tempfile
+import unittest
+
+from share_drive.share_drive_helpers import DRIVE_RESUME_SUFFIX
+from share_drive.share_drive_helpers.drive_resume import DriveResume
+
+
+class TestDriveResume(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+
+        self.path = os.path.join(self.folder.name, "file.bin")
+        with open(self.path, 'wb') as file:
+            file.write(bytes(4096))
+        self.state = {"path": "file.bin", "etag": 42, "block_size": 1024, "total_packets": 10, "next_block": 4}
+
+    def test_save_load_discard(self):
+        self.assertIsNone(DriveResume.load(self.path))
+
+        DriveResume.save(self.path, self.state)
+        self.assertEqual(DriveResume.sidecar_path(self.path), self.path + DRIVE_RESUME_SUFFIX)
+        self.assertEqual(DriveResume.load(self.path), self.state)
+        self.assertFalse(os.path.exists(DriveResume.sidecar_path(self.path) + ".tmp"))
+
+        DriveResume.discard(self.path)
+        self.assertIsNone(DriveResume.load(self.path))
+        DriveResume.discard(self.path)
+
+    def test_invalid_sidecar(self):
+        for content in ("not json", "[]", '{"etag": 42}'):
+            with open(DriveResume.sidecar_path(self.path), 'w') as file:
+                file.write(content)
+            self.assertIsNone(DriveResume.load(self.path))
+
+    def test_is_resumable(self):
+        self.assertTrue(DriveResume.is_resumable(self.state, self.path, 42, 1024, 10, 4))
+        self.assertTrue(DriveResume.is_resumable(self.state, self.path, 42, 1024, 10, 0))
+
+    def test_is_not_resumable(self):
+        self.assertFalse(DriveResume.is_resumable(None, self.path, 42, 1024, 10, 4))
+        # The source changed, or the layout of the blocks
+        self.assertFalse(DriveResume.is_resumable(self.state, self.path, 43, 1024, 10, 4))
+        self.assertFalse(DriveResume.is_resumable(self.state, self.path, 42, 512, 20, 4))
+        # Blocks beyond the saved progress
+        self.assertFalse(DriveResume.is_resumable(self.state, self.path, 42, 1024, 10, 5))
+        # The target file is shorter than the saved progress, or missing
+        os.truncate(self.path, 1000)
+        self.assertFalse(DriveResume.is_resumable(self.state, self.path, 42, 1024, 10, 4))
+        os.remove(self.path)
+        self.assertFalse(DriveResume.is_resumable(self.state, self.path, 42, 1024, 10, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()